@@ -2,44 +2,25 @@
 Клиентская часть:
 параметры командной строки скрипта client.py <addr> [<port>]:
 addr — ip-адрес сервера; port — tcp-порт на сервере, по умолчанию 7777.
+Сетевая часть клиента находится в модуле messenger_client.py.
 """
 import argparse
 import json
+import os
 import threading
 import logging
 import log.client_log_config
-from time import time, ctime, sleep
+from time import ctime, sleep
 from sys import argv, exit
-from socket import socket, AF_INET, SOCK_STREAM
-from common.utils import send_message, get_message
 from common.variables import *
 from decos import Log
 from errors import NotDictError, MissingFieldError
+from messenger_client import MessengerClient, create_presence_message, \
+    create_text_message, create_file_message, save_file_chunk, read_response
 
 client_log = logging.getLogger('client')
 
 
-@Log()
-def create_presence_message(user, password=''):
-    """
-    Функция формирует presence-сообщение
-    :param user: Имя пользователя
-    :param password: Пароль
-    :return:
-    """
-    message = {
-        ACTION: PRESENCE,
-        TIME: time(),
-        TYPE: 'status',
-        USER: {
-            'account_name': user,
-            'password': password
-        }
-    }
-    client_log.debug(f'Создано приветственное сообщение серверу от {user}')
-    return message
-
-
 @Log()
 def create_user_message(account_name):
     """
@@ -49,67 +30,22 @@ def create_user_message(account_name):
     """
     recipient = input('Введите получателя: ')
     message_text = input('Введите сообщение: ')
-    message = {
-        ACTION: MSG,
-        TIME: time(),
-        FROM: account_name,
-        TO: recipient,
-        TEXT: message_text
-    }
-    client_log.debug(f'Создано сообщение от {account_name} для {recipient}')
-    return message
-
-
-@Log()
-def read_user_message(client_socket, user_name):
-    """
-    Функция обрабатывает полученные сообщения и выводит на экран.
-    :param user_name: имя текущего пользователя
-    :param client_socket:
-    :return:
-    """
-    while True:
-        try:
-            message = get_message(client_socket)
-            client_log.info(f'Получено сообщение {message}')
-            client_log.debug(f'Разбор сообщения сервера: {message}')
-            if (ACTION in message and message[ACTION] == MSG
-                    and TIME in message and FROM in message
-                    and TEXT in message
-                    and TO in message and message[TO] == user_name):
-                print(f'{ctime(message[TIME])} - {message[FROM]} пишет:\n'
-                      f'{message[TEXT]}')
-            elif TO in message and message[TO] != user_name:
-                continue
-            else:
-                raise ValueError
-
-        except (OSError, ConnectionError, ConnectionAbortedError,
-                ConnectionResetError, json.JSONDecodeError):
-            client_log.critical('Потеряно соединение с сервером.')
-            break
-
-        except ValueError:
-            client_log.error(f'Получено некорректное сообщение от сервера {message}')
+    return create_text_message(account_name, recipient, message_text)
 
 
 @Log()
-def read_response(message):
+def print_user_message(message):
     """
-    Функция принимает ответ сервера и выводит на экран
-    соответствующий результат
+    Функция выводит на экран полученное сообщение или файл.
     :param message:
     :return:
     """
-    client_log.debug(f'Разбор ответа сервера: {message}')
-    if 'response' in message:
-        if message[RESPONSE] == 200:
-            return f'200: {message[ALERT]}'
-        elif message[RESPONSE] == 400:
-            return f'400: {message[ERROR]}'
-        else:
-            raise ValueError
-    raise MissingFieldError(RESPONSE)
+    if message[ACTION] == FILE:
+        print(f'{message[FROM]} прислал файл {message[FILE_NAME]}, '
+              f'сохранён в {message[FILE_PATH]}')
+    else:
+        print(f'{ctime(message[TIME])} - {message[FROM]} пишет:\n'
+              f'{message[TEXT]}')
 
 
 @Log()
@@ -124,7 +60,12 @@ def get_client_settings():
     args.add_argument('port', type=int, default=DEFAULT_PORT, nargs='?',
                       help='Порт для подкючения к серверу, должен находиться в диапазоне от 1024 до 65535.')
     args.add_argument('-n', '--name', default=None, help='Имя пользователя')
+    args.add_argument('--log-level', default=None,
+                      choices=('DEBUG', 'INFO', 'WARNING', 'ERROR', 'CRITICAL'),
+                      help='Уровень журналирования')
     namespace = args.parse_args(argv[1:])
+    if namespace.log_level:
+        client_log.setLevel(namespace.log_level)
     connection_ip = namespace.address
     connection_port = namespace.port
     user_name = namespace.name
@@ -146,39 +87,40 @@ def print_help(user_name):
     """
     print(f'Вы работаете как {user_name}')
     print('Доступные команды:\nm/message - отправить сообщение\n'
+          'f/file - отправить файл\n'
           'h/help - вывод справки\nq/quit - выход\n')
 
 
 @Log()
-def get_command(client_socket, user_name):
+def get_command(client):
     """
     Функция реализует интерфейс взаимодействия с пользователем.
-    :param client_socket:
-    :param user_name:
+    :param client: подключенный MessengerClient
     :return:
     """
     while True:
         command = input('Введите команду:\n')
 
         if command in ['m', 'message']:
-            message = create_user_message(user_name)
-            send_message(client_socket, message)
-            client_log.info(f'Отрправлено сообщение {message}')
+            message = create_user_message(client.user_name)
+            client.send_message(message)
+
+        elif command in ['f', 'file']:
+            recipient = input('Введите получателя: ')
+            path = input('Введите путь к файлу: ')
+            if not os.path.isfile(path):
+                print('Файл не найден.')
+                continue
+            file_thread = threading.Thread(target=client.send_file,
+                                           args=(recipient, path),
+                                           daemon=True)
+            file_thread.start()
 
         elif command in ['h', 'help']:
-            print_help(user_name)
+            print_help(client.user_name)
 
         elif command in ['q', 'quit']:
-            message = {
-                ACTION: EXIT,
-                TIME: time(),
-                FROM: user_name
-            }
-            send_message(client_socket, message)
-            # Закрываем сокет
-            sleep(1)
-            client_socket.close()
-            client_log.info('Завершение подключения.')
+            client.close()
             exit()
 
         else:
@@ -195,22 +137,12 @@ def run_client():
     while not user_name:
         user_name = input('Введите имя пользователя: ')
 
+    client = MessengerClient(user_name, connection_ip, connection_port)
+    client.add_callback(print_user_message)
     try:
-        # Создаем сокет
-        client_socket = socket(AF_INET, SOCK_STREAM)
-        client_socket.connect((connection_ip, connection_port))
-        client_log.info(f'Соединение с сервером {connection_ip}:{connection_port}')
+        client.connect()
 
-        # Создаем и отправляем presence-сообщение
-        message = create_presence_message(user_name)
-        send_message(client_socket, message)
-        client_log.info(f'Отрправлено сообщение {message}')
-
-        # Получаем и обрабатываем ответ сервера
-        answer = read_response(get_message(client_socket))
-        client_log.info(f'Получен ответ сервера {answer}')
-
-    except ConnectionRefusedError:
+    except (ConnectionRefusedError, ConnectionResetError):
         client_log.critical(f'Не удалось установить соединение с сервером '
                             f'{connection_ip}:{connection_port}')
         exit(1)
@@ -228,14 +160,8 @@ def run_client():
         exit(1)
 
     else:
-        in_thread = threading.Thread(target=read_user_message,
-                                     args=(client_socket, user_name),
-                                     daemon=True)
-        in_thread.start()
-        client_log.debug('Сформирован поток для приема сообщений')
-
         out_thread = threading.Thread(target=get_command,
-                                      args=(client_socket, user_name),
+                                      args=(client,),
                                       daemon=True)
         out_thread.start()
         client_log.debug('Сформирован поток для отправки сообщений')
@@ -244,7 +170,7 @@ def run_client():
 
         while True:
             sleep(0.5)
-            if in_thread.is_alive() and out_thread.is_alive():
+            if client.connected and out_thread.is_alive():
                 continue
             break
 
@@ -0,0 +1,90 @@
+"""
+База данных истории сообщений клиента
+"""
+import sqlite3
+from time import time
+
+
+class ClientDatabase:
+    """
+    Хранилище истории сообщений клиента в SQLite.
+    Соединение можно использовать только из создавшего его потока.
+    """
+    def __init__(self, path):
+        self.connection = sqlite3.connect(path)
+        self.connection.execute('''CREATE TABLE IF NOT EXISTS message_history (
+                                       id INTEGER PRIMARY KEY AUTOINCREMENT,
+                                       contact TEXT NOT NULL,
+                                       incoming INTEGER NOT NULL,
+                                       message TEXT NOT NULL,
+                                       time REAL NOT NULL)''')
+        # Индекс для постраничной выборки истории одного контакта
+        self.connection.execute('''CREATE INDEX IF NOT EXISTS message_history_contact
+                                   ON message_history (contact, id)''')
+        self.connection.commit()
+
+    def save_message(self, contact, incoming, text, message_time=None):
+        """
+        Сохраняет сообщение в историю
+        :param contact: имя собеседника
+        :param incoming: True для входящего сообщения
+        :param text: текст сообщения
+        :param message_time: время сообщения, по умолчанию текущее
+        :return: идентификатор сохранённого сообщения
+        """
+        if message_time is None:
+            message_time = time()
+        cursor = self.connection.execute(
+            'INSERT INTO message_history (contact, incoming, message, time) VALUES (?, ?, ?, ?)',
+            (contact, int(incoming), text, message_time))
+        self.connection.commit()
+        return cursor.lastrowid
+
+    def get_contacts(self):
+        """
+        Возвращает список собеседников из истории
+        :return:
+        """
+        cursor = self.connection.execute(
+            'SELECT DISTINCT contact FROM message_history ORDER BY contact')
+        return [row[0] for row in cursor]
+
+    def count_messages(self, contact):
+        """
+        Возвращает число сообщений в истории переписки с собеседником
+        :param contact: имя собеседника
+        :return:
+        """
+        cursor = self.connection.execute(
+            'SELECT COUNT(*) FROM message_history WHERE contact = ?', (contact,))
+        return cursor.fetchone()[0]
+
+    def get_messages(self, contact, limit, before_id=None):
+        """
+        Возвращает страницу истории переписки: не более limit последних
+        сообщений, более ранних чем before_id. Выборка идёт по индексу,
+        без OFFSET, поэтому не замедляется при листании длинной истории.
+        :param contact: имя собеседника
+        :param limit: размер страницы
+        :param before_id: идентификатор самого раннего уже загруженного сообщения
+        :return: список (id, incoming, message, time) в порядке отправки
+        """
+        if before_id is None:
+            cursor = self.connection.execute(
+                '''SELECT id, incoming, message, time FROM message_history
+                   WHERE contact = ? ORDER BY id DESC LIMIT ?''', (contact, limit))
+        else:
+            cursor = self.connection.execute(
+                '''SELECT id, incoming, message, time FROM message_history
+                   WHERE contact = ? AND id < ? ORDER BY id DESC LIMIT ?''',
+                (contact, before_id, limit))
+        rows = cursor.fetchall()
+        rows.reverse()
+        return [(row_id, bool(incoming), text, message_time)
+                for row_id, incoming, text, message_time in rows]
+
+    def close(self):
+        """
+        Закрывает соединение с базой данных
+        """
+        self.connection.close()
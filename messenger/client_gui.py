@@ -0,0 +1,367 @@
+"""
+Графический клиент на PyQt5.
+Параметры командной строки те же, что у client.py:
+client_gui.py <addr> [<port>] [-n <name>].
+Сетевой обмен выполняется в отдельных потоках: NetworkThread принимает
+сообщения, SendThread отправляет, с интерфейсом они обмениваются сигналами. История переписки хранится
+в локальной базе данных и подгружается страницами при прокрутке вверх.
+"""
+import os
+import json
+import sys
+import logging
+import log.client_log_config
+from queue import Queue
+from time import ctime
+from PyQt5.QtCore import Qt, QAbstractListModel, QModelIndex, QThread, pyqtSignal
+from PyQt5.QtWidgets import QApplication, QMainWindow, QWidget, QListView, QListWidget, \
+    QLineEdit, QPushButton, QHBoxLayout, QVBoxLayout, QInputDialog, QMessageBox, \
+    QFileDialog
+from common.variables import *
+from client import get_client_settings
+from client_database import ClientDatabase
+from errors import NotDictError, MissingFieldError
+from messenger_client import MessengerClient
+
+client_log = logging.getLogger('client')
+
+
+class NetworkThread(QThread):
+    """
+    Поток приёма сообщений. Интерфейс не обращается к сокету на чтение,
+    а получает сообщения через сигнал new_message.
+    """
+    new_message = pyqtSignal(dict)
+    connection_lost = pyqtSignal()
+
+    def __init__(self, client):
+        super().__init__()
+        self.client = client
+
+    def run(self):
+        for message in self.client:
+            self.new_message.emit(message)
+        self.connection_lost.emit()
+
+
+class SendThread(QThread):
+    """
+    Поток отправки текстовых сообщений. Отправка блокируется, пока сервер
+    не примет данные, поэтому интерфейс только ставит сообщения в очередь.
+    """
+    message_sent = pyqtSignal(str, str, float)
+    send_failed = pyqtSignal()
+
+    def __init__(self, client):
+        super().__init__()
+        self.client = client
+        self.outgoing = Queue()
+
+    def send(self, recipient, text):
+        """
+        Ставит сообщение в очередь на отправку
+        """
+        self.outgoing.put((recipient, text))
+
+    def stop(self):
+        self.outgoing.put(None)
+
+    def run(self):
+        while True:
+            item = self.outgoing.get()
+            if item is None:
+                return
+            recipient, text = item
+            try:
+                message = self.client.send(recipient, text)
+            except OSError:
+                self.send_failed.emit()
+                continue
+            self.message_sent.emit(recipient, text, message[TIME])
+
+
+def format_time(value):
+    """
+    Форматирует время сообщения. Время приходит от другого пользователя
+    и может быть любым значением.
+    """
+    try:
+        return ctime(value)
+    except (TypeError, ValueError, OverflowError, OSError):
+        return '?'
+
+
+class FileSendThread(QThread):
+    """
+    Поток отправки файла, передача может занимать долгое время
+    """
+    finished_sending = pyqtSignal(str, bool)
+
+    def __init__(self, client, recipient, path):
+        super().__init__()
+        self.client = client
+        self.recipient = recipient
+        self.path = path
+
+    def run(self):
+        self.finished_sending.emit(self.path, self.client.send_file(self.recipient, self.path))
+
+
+class MessageListModel(QAbstractListModel):
+    """
+    Модель истории переписки с одним собеседником. В памяти хранятся
+    только загруженные страницы, более ранние сообщения подгружаются
+    из базы данных методом fetch_older.
+    """
+    def __init__(self, database, contact, page_size=HISTORY_PAGE_SIZE):
+        super().__init__()
+        self.database = database
+        self.contact = contact
+        self.page_size = page_size
+        self.rows = database.get_messages(contact, page_size)
+        self.has_older = len(self.rows) == page_size
+
+    def rowCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self.rows)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        row_id, incoming, text, message_time = self.rows[index.row()]
+        if role == Qt.DisplayRole:
+            author = self.contact if incoming else 'Вы'
+            return f'{format_time(message_time)} - {author}:\n{text}'
+        if role == Qt.TextAlignmentRole:
+            return Qt.AlignLeft if incoming else Qt.AlignRight
+        return None
+
+    def fetch_older(self):
+        """
+        Загружает из базы данных предыдущую страницу истории
+        :return: число загруженных сообщений
+        """
+        if not self.has_older or not self.rows:
+            return 0
+        rows = self.database.get_messages(self.contact, self.page_size,
+                                          before_id=self.rows[0][0])
+        self.has_older = len(rows) == self.page_size
+        if rows:
+            self.beginInsertRows(QModelIndex(), 0, len(rows) - 1)
+            self.rows[:0] = rows
+            self.endInsertRows()
+        return len(rows)
+
+    def append_message(self, row):
+        """
+        Добавляет новое сообщение в конец списка
+        :param row: (id, incoming, message, time)
+        """
+        self.beginInsertRows(QModelIndex(), len(self.rows), len(self.rows))
+        self.rows.append(row)
+        self.endInsertRows()
+
+
+class ClientMainWindow(QMainWindow):
+    """
+    Главное окно клиента: список собеседников, переписка и поле ввода
+    """
+    def __init__(self, client, database):
+        super().__init__()
+        self.client = client
+        self.database = database
+        self.model = None
+        self.file_threads = []
+
+        self.setWindowTitle(f'Мессенджер - {client.user_name}')
+        self.resize(800, 600)
+
+        self.contacts = QListWidget()
+        self.contacts.addItems(database.get_contacts())
+        self.contacts.currentTextChanged.connect(self.select_contact)
+        self.new_contact = QLineEdit()
+        self.new_contact.setPlaceholderText('Новый собеседник')
+        self.new_contact.returnPressed.connect(self.add_contact)
+
+        self.history = QListView()
+        # Высота строк зависит от длины сообщения, поэтому одинаковую высоту
+        # не задаём. Размеры строк рассчитываются порциями, а в модели
+        # загружено лишь несколько страниц истории.
+        self.history.setWordWrap(True)
+        self.history.setLayoutMode(QListView.Batched)
+        self.history.setBatchSize(HISTORY_PAGE_SIZE)
+        self.history.verticalScrollBar().valueChanged.connect(self.load_older_messages)
+
+        self.message_text = QLineEdit()
+        self.message_text.returnPressed.connect(self.send_text)
+        self.send_button = QPushButton('Отправить')
+        self.send_button.clicked.connect(self.send_text)
+        self.file_button = QPushButton('Файл')
+        self.file_button.clicked.connect(self.send_file)
+
+        contacts_layout = QVBoxLayout()
+        contacts_layout.addWidget(self.contacts)
+        contacts_layout.addWidget(self.new_contact)
+        input_layout = QHBoxLayout()
+        input_layout.addWidget(self.message_text)
+        input_layout.addWidget(self.send_button)
+        input_layout.addWidget(self.file_button)
+        chat_layout = QVBoxLayout()
+        chat_layout.addWidget(self.history)
+        chat_layout.addLayout(input_layout)
+        main_layout = QHBoxLayout()
+        main_layout.addLayout(contacts_layout, 1)
+        main_layout.addLayout(chat_layout, 3)
+        central_widget = QWidget()
+        central_widget.setLayout(main_layout)
+        self.setCentralWidget(central_widget)
+
+        self.network_thread = NetworkThread(client)
+        self.network_thread.new_message.connect(self.receive_message)
+        self.network_thread.connection_lost.connect(self.connection_lost)
+        self.network_thread.start()
+        self.send_thread = SendThread(client)
+        self.send_thread.message_sent.connect(self.text_sent)
+        self.send_thread.send_failed.connect(self.send_failed)
+        self.send_thread.start()
+
+    def current_contact(self):
+        return self.model.contact if self.model else None
+
+    def add_contact(self):
+        """
+        Добавляет собеседника в список и открывает переписку с ним
+        """
+        contact = self.new_contact.text().strip()
+        self.new_contact.clear()
+        if not contact:
+            return
+        items = self.contacts.findItems(contact, Qt.MatchExactly)
+        if not items:
+            self.contacts.addItem(contact)
+            items = self.contacts.findItems(contact, Qt.MatchExactly)
+        self.contacts.setCurrentItem(items[0])
+
+    def select_contact(self, contact):
+        """
+        Открывает переписку с собеседником, загружая последнюю страницу истории
+        """
+        self.model = MessageListModel(self.database, contact)
+        self.history.setModel(self.model)
+        self.history.scrollToBottom()
+
+    def load_older_messages(self, value):
+        """
+        Подгружает более ранние сообщения при прокрутке к началу списка
+        и сохраняет положение видимой части списка
+        """
+        if value != 0 or self.model is None:
+            return
+        scroll_bar = self.history.verticalScrollBar()
+        old_maximum = scroll_bar.maximum()
+        if self.model.fetch_older():
+            scroll_bar.setValue(scroll_bar.maximum() - old_maximum)
+
+    def add_to_history(self, contact, incoming, text, message_time):
+        """
+        Сохраняет сообщение в базу данных и показывает его,
+        если открыта переписка с этим собеседником
+        """
+        row_id = self.database.save_message(contact, incoming, text, message_time)
+        if contact == self.current_contact():
+            self.model.append_message((row_id, incoming, text, message_time))
+            self.history.scrollToBottom()
+        elif not self.contacts.findItems(contact, Qt.MatchExactly):
+            self.contacts.addItem(contact)
+
+    def send_text(self):
+        text = self.message_text.text()
+        contact = self.current_contact()
+        if not text or not contact:
+            return
+        self.send_thread.send(contact, text)
+        self.message_text.clear()
+
+    def text_sent(self, contact, text, message_time):
+        self.add_to_history(contact, False, text, message_time)
+
+    def send_failed(self):
+        QMessageBox.critical(self, 'Ошибка', 'Не удалось отправить сообщение.')
+
+    def send_file(self):
+        contact = self.current_contact()
+        if not contact:
+            return
+        path, _ = QFileDialog.getOpenFileName(self, 'Выберите файл')
+        if not path:
+            return
+        file_thread = FileSendThread(self.client, contact, path)
+        file_thread.finished_sending.connect(self.file_sent)
+        self.file_threads.append(file_thread)
+        file_thread.start()
+
+    def file_sent(self, path, success):
+        self.file_threads = [thread for thread in self.file_threads if thread.isRunning()]
+        if not success:
+            QMessageBox.warning(self, 'Ошибка', f'Не удалось отправить файл {path}')
+
+    def receive_message(self, message):
+        # Поля сообщения приходят от другого пользователя, в базу данных
+        # сохраняются только строки и числа
+        message_time = message.get(TIME)
+        if message.get(ACTION) == FILE:
+            text = f'Файл {message.get(FILE_PATH)}'
+        else:
+            text = message.get(TEXT)
+        if (not isinstance(text, str) or not isinstance(message.get(FROM), str)
+                or not isinstance(message_time, (int, float)) or isinstance(message_time, bool)):
+            client_log.warning('Получено некорректное сообщение, оно не сохранено.')
+            return
+        self.add_to_history(message[FROM], True, text, message_time)
+
+    def connection_lost(self):
+        QMessageBox.critical(self, 'Ошибка', 'Потеряно соединение с сервером.')
+        self.close()
+
+    def closeEvent(self, event):
+        self.send_thread.stop()
+        self.send_thread.wait(1000)
+        self.client.close()
+        self.network_thread.wait(1000)
+        self.database.close()
+        super().closeEvent(event)
+
+
+def run_client_gui():
+    """
+    Основная функция для запуска графического клиента
+    """
+    client_log.info(f'Запуск графического клиента.')
+    connection_ip, connection_port, user_name = get_client_settings()
+    app = QApplication(sys.argv)
+
+    while not user_name:
+        user_name, ok = QInputDialog.getText(None, 'Вход', 'Введите имя пользователя:')
+        if not ok:
+            sys.exit(0)
+
+    client = MessengerClient(user_name, connection_ip, connection_port)
+    try:
+        client.connect()
+    except (ConnectionRefusedError, ConnectionResetError, ValueError, NotDictError,
+            MissingFieldError, json.JSONDecodeError) as err:
+        client_log.critical(f'Не удалось установить соединение с сервером '
+                            f'{connection_ip}:{connection_port}: {err}')
+        QMessageBox.critical(None, 'Ошибка', 'Не удалось установить соединение с сервером.')
+        sys.exit(1)
+
+    database = ClientDatabase(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                           f'client_{user_name}.db3'))
+    window = ClientMainWindow(client, database)
+    window.show()
+    sys.exit(app.exec_())
+
+
+if __name__ == '__main__':
+    run_client_gui()
@@ -2,38 +2,243 @@
 Общие функции клиента и сервера
 """
 import json
-from common.variables import MAX_PACKAGE_LENGTH, ENCODING
+import mmap
+import os
+import zlib
+from time import time
+from weakref import WeakKeyDictionary
+from common.variables import MAX_PACKAGE_LENGTH, ENCODING, COMPRESSION_METHOD, \
+    COMPRESSION_THRESHOLD, COMPRESSION_LEVEL, COMPRESSED_MARKER, COMPRESSION_DICT, \
+    FILE_CHUNK_SIZE, FRAME_DELIMITER, MAX_MESSAGE_SIZE, TIME
 from decos import Log
 from errors import NotDictError
 
+# Данные, принятые из сокета после первого сообщения: {сокет: байты}
+RECEIVE_BUFFERS = WeakKeyDictionary()
+# Распаковка сжатого сообщения, принятого не полностью: {сокет: FrameDecompressor}
+DECOMPRESSORS = WeakKeyDictionary()
+
+
+def compress_data(data):
+    """
+    Сжимает закодированное сообщение с использованием общего словаря
+    JIM-ключей и добавляет признак сжатого сообщения
+    :param data: сообщение в виде байтов
+    :return: сжатое сообщение
+    """
+    compressor = zlib.compressobj(COMPRESSION_LEVEL, zdict=COMPRESSION_DICT)
+    return COMPRESSED_MARKER + compressor.compress(data) + compressor.flush()
+
+
+def make_frame(data, compression=None):
+    """
+    Оформляет закодированное сообщение для отправки: сжимает его
+    или добавляет разделитель
+    :param data: сообщение в виде JSON-байтов
+    :param compression: согласованный с получателем метод сжатия,
+    сообщения короче COMPRESSION_THRESHOLD не сжимаются
+    :return: байты для отправки
+    """
+    if compression == COMPRESSION_METHOD and len(data) >= COMPRESSION_THRESHOLD:
+        return compress_data(data)
+    return data + FRAME_DELIMITER
+
+
+def encode_message(message):
+    """
+    Кодирует сообщение в JSON-байты
+    :param message: словарь с атрибутами сообщения
+    :return: сообщение в виде байтов
+    """
+    if not isinstance(message, dict):
+        raise NotDictError
+    return json.dumps(message).encode(ENCODING)
+
+
+class MessageTemplate:
+    """
+    Заранее закодированное сообщение с постоянными полями. При отправке
+    в него подставляется текущее время, словарь заново не кодируется.
+    """
+    PLACEHOLDER = '\x00time\x00'
+
+    def __init__(self, message):
+        # Поле времени остаётся на своём месте в сообщении
+        message = dict(message)
+        message[TIME] = self.PLACEHOLDER
+        self.head, self.tail = encode_message(message).split(
+            json.dumps(self.PLACEHOLDER).encode(ENCODING), 1)
+
+    def encode(self, now=None):
+        """
+        Возвращает сообщение в виде JSON-байтов
+        :param now: время сообщения, по умолчанию текущее
+        """
+        return self.head + repr(time() if now is None else float(now)).encode(ENCODING) + self.tail
+
+    def make_frame(self, compression=None):
+        """
+        Возвращает кадр сообщения с текущим временем
+        """
+        return make_frame(self.encode(), compression)
+
+
+class FrameDecompressor:
+    """
+    Распаковка сжатого сообщения, принимаемого по частям. Буфер сокета
+    растёт с каждым recv, а распаковываются только новые данные.
+    Размер распакованного сообщения ограничен max_size.
+    """
+    def __init__(self, max_size=MAX_MESSAGE_SIZE):
+        self.decompressor = zlib.decompressobj(zdict=COMPRESSION_DICT)
+        self.max_size = max_size
+        # Сколько байтов буфера уже распаковано
+        self.fed = len(COMPRESSED_MARKER)
+        self.data = b''
+
+    def feed(self, buffer):
+        """
+        Распаковывает данные, добавленные в буфер с прошлого вызова
+        :param buffer: принятые данные, начиная с COMPRESSED_MARKER
+        :return: (сообщение в виде байтов или None, если оно принято не полностью,
+        оставшиеся данные)
+        """
+        if not self.decompressor.eof:
+            try:
+                # Лишний байт показывает, что ограничение превышено
+                self.data += self.decompressor.decompress(
+                    buffer[self.fed:], self.max_size - len(self.data) + 1)
+            except zlib.error:
+                raise ValueError
+            if self.decompressor.unconsumed_tail or len(self.data) > self.max_size:
+                raise ValueError
+            self.fed = len(buffer)
+            if not self.decompressor.eof:
+                return None, buffer
+        return self.data, self.decompressor.unused_data
+
+
+def split_frame(buffer, decompressor=None):
+    """
+    Отделяет первое сообщение от остальных принятых данных. Обычные
+    сообщения заканчиваются FRAME_DELIMITER, сжатые - концом zlib-потока.
+    :param buffer: принятые данные
+    :param decompressor: FrameDecompressor, которому уже передавалось
+    начало сжатого сообщения из этого буфера
+    :return: (сообщение в виде байтов или None, если оно принято не полностью,
+    оставшиеся данные)
+    """
+    if buffer.startswith(COMPRESSED_MARKER):
+        return (decompressor or FrameDecompressor()).feed(buffer)
+    end = buffer.find(FRAME_DELIMITER)
+    if end == -1:
+        return None, buffer
+    return buffer[:end], buffer[end + len(FRAME_DELIMITER):]
+
+
+def has_buffered_message(socket_obj):
+    """
+    Проверяет, остались ли в буфере сокета полностью принятые сообщения.
+    select о них не сообщает, поэтому их нужно обработать сразу.
+    :param socket_obj: объект сокета для обмена сообщениями
+    :return:
+    """
+    buffer = RECEIVE_BUFFERS.get(socket_obj)
+    if not buffer:
+        return False
+    if not buffer.startswith(COMPRESSED_MARKER):
+        return split_frame(buffer)[0] is not None
+    # Распакованное здесь get_message повторно не распаковывает
+    decompressor = DECOMPRESSORS.pop(socket_obj, None) or FrameDecompressor()
+    try:
+        frame = decompressor.feed(buffer)[0]
+    except ValueError:
+        # Ошибку сообщит get_message
+        return True
+    DECOMPRESSORS[socket_obj] = decompressor
+    return frame is not None
+
+
+def read_file_chunks(path, chunk_size=FILE_CHUNK_SIZE):
+    """
+    Генератор, читающий файл частями через отображение в память,
+    файл целиком в память не загружается
+    :param path: путь к файлу
+    :param chunk_size: размер части
+    :return: пары (часть файла, признак последней части)
+    """
+    with open(path, 'rb') as file:
+        size = os.fstat(file.fileno()).st_size
+        # Пустой файл нельзя отобразить в память
+        if not size:
+            yield b'', True
+            return
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            for offset in range(0, size, chunk_size):
+                yield mapped[offset:offset + chunk_size], offset + chunk_size >= size
+
 
 @Log()
-def send_message(socket_obj, message):
+def send_message(socket_obj, message, compression=None):
     """
     Функция, осуществляющая кодирование и отправку сообщений между
     клиентами
     :param socket_obj: объект сокета для обмена сообщениями
     :param message: словарь с атрибутами сообщения
+    :param compression: согласованный с получателем метод сжатия,
+    сообщения короче COMPRESSION_THRESHOLD не сжимаются
     """
-    if not isinstance(message, dict):
-        raise NotDictError
-    msg = json.dumps(message)
-    socket_obj.send(msg.encode(ENCODING))
+    socket_obj.sendall(make_frame(encode_message(message), compression))
 
 
 @Log()
-def get_message(socket_obj):
+def get_message(socket_obj, wait=True, max_size=MAX_MESSAGE_SIZE):
     """
     Функция принимает и декодирует сообщение
     :param socket_obj: объект сокета для обмена сообщениями
-    :return: словарь с атрибутами сообщения
-    """
-    response = socket_obj.recv(MAX_PACKAGE_LENGTH)
-    # проверяеи пришедшие данные
-    if isinstance(response, bytes):
-        response = json.loads(response.decode(ENCODING))
-        # Проверяем результат декодирования
-        if isinstance(response, dict):
-            return response
-        raise NotDictError
-    raise ValueError
+    :param wait: ждать, пока сообщение не будет принято полностью. Сервер
+    передаёт False: сокет, о котором сообщил select, читается не больше
+    одного раза, иначе клиент, отправивший часть сообщения, остановит сервер.
+    :param max_size: наибольший размер сообщения
+    :return: словарь с атрибутами сообщения или None, если wait=False
+    и сообщение ещё не принято полностью
+    """
+    # Несколько сообщений могут прийти за один recv, а одно сообщение -
+    # за несколько, поэтому остаток данных сохраняем до следующего вызова
+    buffer = RECEIVE_BUFFERS.pop(socket_obj, b'')
+    decompressor = DECOMPRESSORS.pop(socket_obj, None)
+    received = False
+    while True:
+        if decompressor is None and buffer.startswith(COMPRESSED_MARKER):
+            decompressor = FrameDecompressor(max_size)
+        response, rest = split_frame(buffer, decompressor)
+        if response is not None:
+            break
+        if len(buffer) > max_size:
+            raise ValueError
+        if received and not wait:
+            RECEIVE_BUFFERS[socket_obj] = buffer
+            if decompressor is not None:
+                DECOMPRESSORS[socket_obj] = decompressor
+            return None
+        # Большое сообщение читается частями растущего размера
+        data = socket_obj.recv(max(MAX_PACKAGE_LENGTH, len(buffer)))
+        received = True
+        # проверяеи пришедшие данные
+        if not isinstance(data, bytes):
+            raise ValueError
+        # Соединение закрыто, оставшиеся данные считаем последним сообщением
+        if not data:
+            if not buffer:
+                raise ConnectionResetError
+            response, rest = buffer, b''
+            break
+        buffer += data
+    if rest:
+        RECEIVE_BUFFERS[socket_obj] = rest
+
+    response = json.loads(response.decode(ENCODING))
+    # Проверяем результат декодирования
+    if isinstance(response, dict):
+        return response
+    raise NotDictError
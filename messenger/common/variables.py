@@ -8,10 +8,124 @@ DEFAULT_LISTEN_ADDRESSES = ''
 TIMEOUT = 0.5
 
 MAX_PACKAGE_LENGTH = 4096
+# Наибольшее число одновременно подключенных клиентов
+MAX_CLIENTS = 1000
+# Разделитель несжатых сообщений, json.dumps не выводит его внутри сообщения
+FRAME_DELIMITER = b'\n'
+# Наибольший размер принимаемого сообщения
+MAX_MESSAGE_SIZE = 65536
+# Наибольший размер ответа сервера консоли администратора: полный
+# список пользователей может быть намного больше обычного сообщения
+ADMIN_MESSAGE_SIZE = 16 * 1024 * 1024
 MAX_USERS = 10
 
 ENCODING = 'utf-8'
 
+# Сжатие сообщений
+COMPRESSION_METHOD = 'zlib'
+# Сообщения короче порога отправляются без сжатия
+COMPRESSION_THRESHOLD = 512
+COMPRESSION_LEVEL = 6
+# Признак сжатого сообщения (в JSON-тексте нулевой байт встретиться не может)
+COMPRESSED_MARKER = b'\x00'
+# Словарь для сжатия: часто встречающиеся фрагменты JIM-сообщений
+COMPRESSION_DICT = (b'{"response": 200, "alert": "error": "user": {"account_name": "password": '
+                    b'"type": "status", "action": "presence", "action": "msg", '
+                    b'"time": "from": "to": "message": ')
+
+# Передача файлов
+# Размер части файла до кодирования в base64, вместе с полями сообщения
+# должен помещаться в MAX_PACKAGE_LENGTH
+FILE_CHUNK_SIZE = 2048
+# Число неподтвержденных сервером частей одной передачи: следующая часть
+# отправляется после подтверждения, чтобы передача не заполняла очередь сервера
+FILE_WINDOW = 1
+FILE_ACK_TIMEOUT = 10
+DOWNLOADS_DIR = 'downloads'
+
+# Графический клиент
+# Число сообщений истории, загружаемых за один раз
+HISTORY_PAGE_SIZE = 100
+
+# Администрирование сервера
+# Порт администрирования доступен только с локального адреса
+ADMIN_ADDRESS = '127.0.0.1'
+ADMIN_PORT = 7778
+# Число хранимых событий для передачи изменений консоли администратора
+ADMIN_EVENTS_LIMIT = 1000
+# Интервал обновления консоли администратора, мс
+ADMIN_UPDATE_INTERVAL = 1000
+SERVER_DATABASE = 'server_base.db3'
+# Время на отправку накопленных сообщений при остановке сервера, с
+SHUTDOWN_TIMEOUT = 5
+# Время ожидания готовности нового процесса при перезапуске, с
+RESTART_TIMEOUT = 10
+# Интервал записи изменений в базу данных сервера, с
+DATABASE_COMMIT_INTERVAL = 1
+# Журнал событий
+# Типы событий
+REQUEST_EVENT = 'request'
+BAD_REQUEST_EVENT = 'bad_request'
+SENT_EVENT = 'message_sent'
+RECEIVED_EVENT = 'message_received'
+# Доли записываемых событий, события других типов записываются все
+EVENT_SAMPLE_RATES = {
+    REQUEST_EVENT: 0.1,
+    SENT_EVENT: 0.1,
+    RECEIVED_EVENT: 0.1,
+    BAD_REQUEST_EVENT: 1
+}
+# Наибольшее число записываемых событий в секунду: некорректные запросы
+# записываются все, но клиент не должен заполнять ими журнал
+EVENT_RATE_LIMITS = {
+    BAD_REQUEST_EVENT: 10
+}
+# Длина строковых полей сообщения в журнале
+LOGGED_STRING_LENGTH = 64
+
+# Профилирование работающего сервера
+# Длительность профилирования по сигналу SIGUSR1, с
+PROFILE_DURATION = 30
+# Каталог для результатов профилирования
+PROFILE_DIR = 'profiles'
+# Число функций и строк кода в отчёте
+PROFILE_TOP = 20
+
+# Наибольшее число сообщений в очереди на отправку
+MAX_QUEUED_MESSAGES = 10000
+# Наибольшее число сообщений в очереди одному получателю и время, в течение
+# которого получатель может не принимать сообщения, с. Получатель, превысивший
+# любое из ограничений, отключается, а его сообщения переносятся в почтовый ящик
+MAX_RECIPIENT_QUEUE = 1000
+STALL_TIMEOUT = 30
+# Наибольшее число сообщений от одного клиента в секунду, 0 - без ограничения
+MAX_MESSAGE_RATE = 0
+
+# Почтовые ящики отключенных пользователей
+# Время хранения сообщения, с
+MAILBOX_TTL = 7 * 24 * 60 * 60
+# Наибольшее число и объём сообщений одного пользователя
+MAILBOX_MESSAGES = 1000
+MAILBOX_BYTES = 1024 * 1024
+# Объём сообщений в памяти, после которого они переносятся на диск
+MAILBOX_MEMORY = 64 * 1024 * 1024
+# Общий объём сообщений всех ящиков в памяти и на диске
+MAILBOX_TOTAL_BYTES = 1024 * 1024 * 1024
+MAILBOX_DIR = 'mailboxes'
+
+# Кластер серверов
+# Порт для подключения других узлов, 0 - узел работает без кластера
+PEER_PORT = 0
+# Адрес, на котором узел принимает подключения других узлов
+PEER_LISTEN_ADDRESS = '127.0.0.1'
+# Общий секрет узлов кластера. Если он не задан, принимаются
+# подключения только с адресов узлов из настройки peers.
+PEER_SECRET = ''
+# Интервал повторного подключения к узлам, с
+PEER_RETRY_INTERVAL = 5
+# Время ожидания подключения к узлу, с
+PEER_CONNECT_TIMEOUT = 1
+
 # JIM-протокол
 ACTION = 'action'
 TIME = 'time'
@@ -23,8 +137,48 @@ USER = 'user'
 RESPONSE = 'response'
 ALERT = 'alert'
 ERROR = 'error'
+COMPRESSION = 'compression'
+FILE_ID = 'file_id'
+FILE_NAME = 'file_name'
+# Путь к принятому файлу, добавляется клиентом к последней части файла
+FILE_PATH = 'file_path'
+SEQ = 'seq'
+CHUNK = 'chunk'
+LAST = 'last'
+SINCE = 'since'
+VERSION = 'version'
+EVENTS = 'events'
+EVENT = 'event'
+USERS = 'users'
+ADDRESS = 'address'
+LIMITS = 'limits'
+MESSAGE_COUNT = 'message_count'
+CONNECTIONS = 'connections'
+NODE = 'node'
+SECRET = 'secret'
+HISTORY = 'history'
+DURATION = 'duration'
+REPORT = 'report'
+ACTIVE = 'active'
 
 # Действия (actions)
 PRESENCE = 'presence'
 MSG = 'msg'
 EXIT = 'quit'
+FILE = 'file'
+
+# Действия администратора
+GET_STATE = 'get_state'
+GET_HISTORY = 'get_history'
+KICK = 'kick'
+SET_LIMITS = 'set_limits'
+PROFILE_START = 'profile_start'
+PROFILE_REPORT = 'profile_report'
+
+# Сообщения между узлами кластера
+PEER_HELLO = 'peer_hello'
+PEER_PRESENCE = 'peer_presence'
+
+# События сервера
+LOGIN = 'login'
+LOGOUT = 'logout'
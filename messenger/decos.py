@@ -8,6 +8,24 @@ import log.client_log_config
 import log.server_log_config
 from sys import argv
 from functools import wraps
+from log.event_log import LOGGED_FIELDS, describe_value
+
+
+def describe_argument(argument):
+    """
+    Описывает аргумент функции для журнала. Тексты сообщений, части файлов
+    и пароли в журнал не попадают: от сообщения остаются служебные поля.
+    :param argument: аргумент функции
+    :return: описание аргумента
+    """
+    if isinstance(argument, dict):
+        return {field: describe_value(argument[field])
+                for field in LOGGED_FIELDS if field in argument}
+    if isinstance(argument, (bytes, bytearray)):
+        return f'<{len(argument)} байт>'
+    if isinstance(argument, str) and len(argument) > 64:
+        return f'<строка {len(argument)} символов>'
+    return argument
 
 
 class Log:
@@ -26,7 +44,13 @@ class Log:
         @wraps(function)
         def wrapper(*args, **kwargs):
             result = function(*args, **kwargs)
-            self.func_logger.debug(f'Вызвана функция {function.__name__} с параметрами: {args} {kwargs}.')
+            # inspect.stack() и вывод параметров дороги, без отладки их пропускаем
+            if not self.func_logger.isEnabledFor(logging.DEBUG):
+                return result
+            self.func_logger.debug(
+                f'Вызвана функция {function.__name__} с параметрами: '
+                f'{[describe_argument(arg) for arg in args]} '
+                f'{ {name: describe_argument(arg) for name, arg in kwargs.items()} }.')
             self.func_logger.debug(f'Функция {function.__name__} вызвана из функции {inspect.stack()[1][3]}')
             return result
         return wrapper
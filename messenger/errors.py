@@ -17,3 +17,16 @@ class MissingFieldError(Exception):
 
     def __str__(self):
         return f'Отсутствует обязательное поле {self.missing_field}'
+
+
+class ConfigError(Exception):
+    """
+    Ошибка - неверное значение настройки
+    """
+    def __init__(self, setting, value, reason=''):
+        self.setting = setting
+        self.value = value
+        self.reason = reason
+
+    def __str__(self):
+        return f'Неверное значение настройки {self.setting}: {self.value!r}. {self.reason}'
@@ -0,0 +1,119 @@
+"""
+Реестр обработчиков действий JIM-протокола
+"""
+
+from time import perf_counter
+from common.variables import *
+
+# Зарегистрированные обработчики: {действие: ActionHandler}
+ACTION_HANDLERS = {}
+# Обработчики команд консоли администратора, недоступные клиентам
+ADMIN_HANDLERS = {}
+# Обработчики сообщений других узлов кластера
+PEER_HANDLERS = {}
+
+
+class ActionHandler:
+    """
+    Обработчик действия: функция, обязательные поля сообщения,
+    дополнительная проверка и хуки для замера времени обработки
+    """
+    def __init__(self, action, function, fields=(), validator=None):
+        self.action = action
+        self.function = function
+        self.fields = tuple(fields)
+        self.validator = validator
+        self.timing_hooks = []
+
+    def is_valid(self, message):
+        """
+        Проверяет наличие обязательных полей и вызывает дополнительную проверку
+        :param message: сообщение в виде словаря
+        :return: True, если сообщение может быть обработано
+        """
+        for field in self.fields:
+            if field not in message:
+                return False
+        return self.validator is None or self.validator(message)
+
+    def __call__(self, *args, **kwargs):
+        # Без хуков время не замеряем
+        if not self.timing_hooks:
+            return self.function(*args, **kwargs)
+        start = perf_counter()
+        try:
+            return self.function(*args, **kwargs)
+        finally:
+            elapsed = perf_counter() - start
+            for hook in self.timing_hooks:
+                hook(self.action, elapsed)
+
+
+def is_number(value):
+    """
+    Проверяет, что значение JSON - число, а не логическое значение
+    """
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def is_valid_message(message):
+    """
+    Проверяет типы полей текстового сообщения
+    :param message: сообщение в виде словаря
+    :return: True, если поля имеют ожидаемые типы
+    """
+    return (is_number(message[TIME]) and isinstance(message[FROM], str)
+            and isinstance(message[TO], str) and isinstance(message[TEXT], str))
+
+
+def is_valid_file_chunk(message):
+    """
+    Проверяет типы полей сообщения с частью файла
+    :param message: сообщение в виде словаря
+    :return: True, если поля имеют ожидаемые типы
+    """
+    return (is_number(message[TIME]) and isinstance(message[FROM], str)
+            and isinstance(message[TO], str) and isinstance(message[FILE_ID], str)
+            and isinstance(message[FILE_NAME], str) and isinstance(message[SEQ], int)
+            and not isinstance(message[SEQ], bool) and message[SEQ] >= 0
+            and isinstance(message[CHUNK], str) and isinstance(message[LAST], bool))
+
+
+def register_action(action, fields=(), validator=None, registry=ACTION_HANDLERS):
+    """
+    Декоратор, регистрирующий функцию как обработчик действия.
+    Повторная регистрация заменяет прежний обработчик.
+    :param action: значение поля action
+    :param fields: обязательные поля сообщения
+    :param validator: функция дополнительной проверки сообщения
+    :param registry: реестр обработчиков
+    :return:
+    """
+    def decorator(function):
+        registry[action] = ActionHandler(action, function, fields, validator)
+        return function
+    return decorator
+
+
+def get_handler(action, registry=ACTION_HANDLERS):
+    """
+    Возвращает обработчик действия или None, если действие не зарегистрировано
+    :param action: значение поля action
+    :param registry: реестр обработчиков
+    :return:
+    """
+    # Поле action приходит от клиента и может быть любым значением JSON
+    if not isinstance(action, str):
+        return None
+    return registry.get(action)
+
+
+def add_timing_hook(action, hook, registry=ACTION_HANDLERS):
+    """
+    Добавляет хук, вызываемый после обработки действия
+    с аргументами (действие, время обработки в секундах)
+    :param action: значение поля action
+    :param hook: функция-хук
+    :param registry: реестр обработчиков
+    """
+    registry[action].timing_hooks.append(hook)
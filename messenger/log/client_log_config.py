@@ -3,9 +3,14 @@
 """
 import logging
 import os
+from log.event_log import EventLogger
 
 CLIENT_LOGGER = logging.getLogger('client')
 LOG_FILE_NAME = os.path.join(os.path.dirname(__file__), "client_log.log")
+# Уровень журналирования задаётся переменной окружения или параметром
+# --log-level клиента. На уровне DEBUG журнал растёт с каждым сообщением.
+LOG_LEVEL_VARIABLE = 'MESSENGER_CLIENT_LOG_LEVEL'
+LOG_LEVEL = os.environ.get(LOG_LEVEL_VARIABLE, 'INFO').upper()
 
 FORMATTER = logging.Formatter("%(asctime)s - %(levelname)-8s - %(filename)-10s - %(message)s")
 
@@ -18,7 +23,11 @@ STREAM_HANDLER.setLevel(logging.ERROR)
 
 CLIENT_LOGGER.addHandler(FILE_HANDLER)
 CLIENT_LOGGER.addHandler(STREAM_HANDLER)
-CLIENT_LOGGER.setLevel(logging.DEBUG)
+CLIENT_LOGGER.setLevel(LOG_LEVEL if isinstance(logging.getLevelName(LOG_LEVEL), int)
+                       else logging.INFO)
+
+# Журнал событий обмена сообщениями
+CLIENT_EVENTS = EventLogger(CLIENT_LOGGER)
 
 if __name__ == '__main__':
     CLIENT_LOGGER.debug('Test. Debug info')
@@ -0,0 +1,141 @@
+"""
+Журнал событий обмена сообщениями.
+Событие записывается одной JSON-строкой с полями event, user, action,
+size, latency. Тексты сообщений, части файлов и пароли в журнал не
+попадают, длинные строки обрезаются, а от других значений остаётся
+только размер. Для каждого типа событий задаётся доля записываемых
+событий и наибольшее число событий в секунду, поэтому объём журнала
+не растёт вместе с числом сообщений.
+JSON формируется, только если запись действительно выводится.
+"""
+import json
+import logging
+import random
+from time import time
+from common.variables import *
+
+# Поля сообщения, которые попадают в журнал
+LOGGED_FIELDS = (ACTION, FROM, TO, RESPONSE, FILE_ID, SEQ)
+
+
+def describe_value(value):
+    """
+    Описывает значение поля сообщения для журнала. Поля приходят
+    от клиента и могут быть любого размера и типа.
+    :param value: значение поля
+    :return: число, обрезанная строка или описание размера значения
+    """
+    if value is None or isinstance(value, (bool, int, float)):
+        return value
+    if isinstance(value, str):
+        if len(value) > LOGGED_STRING_LENGTH:
+            return value[:LOGGED_STRING_LENGTH] + '...'
+        return value
+    size = len(json.dumps(value, ensure_ascii=False, default=str).encode(ENCODING))
+    return f'<{type(value).__name__} {size} байт>'
+
+
+class LazyEvent:
+    """
+    Событие журнала. Преобразуется в JSON при выводе записи обработчиком журнала.
+    """
+    __slots__ = ('event', 'message', 'fields')
+
+    def __init__(self, event, message, fields):
+        self.event = event
+        self.message = message
+        self.fields = fields
+
+    def to_dict(self):
+        """
+        Возвращает поля события без текста сообщения
+        :return:
+        """
+        record = {EVENT: self.event}
+        if self.message is not None:
+            for field in LOGGED_FIELDS:
+                if field in self.message:
+                    record[field] = self.message[field]
+            if isinstance(self.message.get(USER), dict):
+                record[USER] = self.message[USER].get('account_name')
+            else:
+                record[USER] = self.message.get(FROM)
+            record['size'] = len(json.dumps(self.message, ensure_ascii=False).encode(ENCODING))
+        record.update(self.fields)
+        record = {name: describe_value(value) for name, value in record.items()}
+        if 'latency' in record:
+            record['latency'] = round(record['latency'], 6)
+        return record
+
+    def __str__(self):
+        return json.dumps(self.to_dict(), ensure_ascii=False, default=str)
+
+
+class EventLogger:
+    """
+    Запись событий в журнал с выборкой по типам событий
+    """
+    def __init__(self, logger, sample_rates=None, level=logging.INFO, rate_limits=None):
+        """
+        :param logger: журнал, в который выводятся события
+        :param sample_rates: доли записываемых событий {тип события: доля от 0 до 1},
+        события других типов записываются все
+        :param level: уровень записей журнала
+        :param rate_limits: наибольшее число записываемых событий в секунду
+        {тип события: число}, для других типов число не ограничено
+        """
+        self.logger = logger
+        self.level = level
+        self.sample_rates = dict(EVENT_SAMPLE_RATES if sample_rates is None else sample_rates)
+        self.rate_limits = dict(EVENT_RATE_LIMITS if rate_limits is None else rate_limits)
+        # Число записанных событий за текущую секунду: {тип события: [секунда, число]}
+        self.counts = {}
+
+    def set_sample_rate(self, event, rate):
+        """
+        Задаёт долю записываемых событий типа event
+        """
+        self.sample_rates[event] = rate
+
+    def sample(self, event):
+        """
+        Решает, записывать ли очередное событие. Вызывается до подготовки
+        полей события, чтобы не замерять время для пропускаемых событий.
+        :param event: тип события
+        :return: True, если событие нужно записать
+        """
+        if not self.logger.isEnabledFor(self.level):
+            return False
+        rate = self.sample_rates.get(event, 1)
+        if not (rate >= 1 or (rate > 0 and random.random() < rate)):
+            return False
+        limit = self.rate_limits.get(event)
+        if limit is None:
+            return True
+        second = int(time())
+        count = self.counts.get(event)
+        if count is None or count[0] != second:
+            count = self.counts[event] = [second, 0]
+        count[1] += 1
+        return count[1] <= limit
+
+    def emit(self, event, message=None, **fields):
+        """
+        Записывает событие без проверки выборки
+        :param event: тип события
+        :param message: сообщение, к которому относится событие
+        :param fields: дополнительные поля, например latency
+        """
+        # В записи журнала указывается модуль, вызвавший emit или log
+        stacklevel = fields.pop('stacklevel', 2)
+        self.logger.log(self.level, LazyEvent(event, message, fields), stacklevel=stacklevel)
+
+    def log(self, event, message=None, **fields):
+        """
+        Записывает событие, если оно попало в выборку
+        :param event: тип события
+        :param message: сообщение, к которому относится событие
+        :param fields: дополнительные поля
+        """
+        if self.sample(event):
+            self.emit(event, message, stacklevel=3, **fields)
@@ -4,6 +4,7 @@
 import logging
 import logging.handlers
 import os
+from log.event_log import EventLogger
 
 SERVER_LOGGER = logging.getLogger('server')
 LOG_FILE_NAME = os.path.join(os.path.dirname(__file__), "server_log.log")
@@ -23,6 +24,9 @@ SERVER_LOGGER.addHandler(FILE_HANDLER)
 SERVER_LOGGER.addHandler(STREAM_HANDLER)
 SERVER_LOGGER.setLevel(logging.DEBUG)
 
+# Журнал событий обмена сообщениями
+SERVER_EVENTS = EventLogger(SERVER_LOGGER)
+
 if __name__ == '__main__':
     SERVER_LOGGER.debug('Test. Debug info')
     SERVER_LOGGER.info('Test. Information')
@@ -0,0 +1,407 @@
+"""
+Клиентская библиотека без пользовательского интерфейса.
+Используется консольным клиентом client.py, а также ботами,
+интеграциями и нагрузочными тестами.
+"""
+import json
+import os
+import re
+import threading
+import logging
+from log.client_log_config import CLIENT_EVENTS
+from base64 import b64encode, b64decode
+from queue import Queue, Empty
+from uuid import uuid4
+from time import time
+from socket import socket, AF_INET, SOCK_STREAM
+from common.utils import send_message, get_message, read_file_chunks
+from common.variables import *
+from decos import Log
+from errors import NotDictError, MissingFieldError
+from handlers import is_valid_message, is_valid_file_chunk
+
+client_log = logging.getLogger('client')
+
+
+@Log()
+def create_presence_message(user, password='', compression=False):
+    """
+    Функция формирует presence-сообщение
+    :param user: Имя пользователя
+    :param password: Пароль
+    :param compression: предложить серверу сжатие сообщений
+    :return:
+    """
+    message = {
+        ACTION: PRESENCE,
+        TIME: time(),
+        TYPE: 'status',
+        USER: {
+            'account_name': user,
+            'password': password
+        }
+    }
+    if compression:
+        message[COMPRESSION] = [COMPRESSION_METHOD]
+    client_log.debug(f'Создано приветственное сообщение серверу от {user}')
+    return message
+
+
+@Log()
+def create_text_message(account_name, recipient, text):
+    """
+    Функция формирует текстовое сообщение пользователю.
+    :param account_name: имя отправителя
+    :param recipient: имя получателя
+    :param text: текст сообщения
+    :return:
+    """
+    message = {
+        ACTION: MSG,
+        TIME: time(),
+        FROM: account_name,
+        TO: recipient,
+        TEXT: text
+    }
+    client_log.debug(f'Создано сообщение от {account_name} для {recipient}')
+    return message
+
+
+@Log()
+def create_exit_message(account_name):
+    """
+    Функция формирует сообщение о выходе.
+    :param account_name: имя пользователя
+    :return:
+    """
+    return {
+        ACTION: EXIT,
+        TIME: time(),
+        FROM: account_name
+    }
+
+
+@Log()
+def create_file_message(account_name, recipient, file_id, file_name, seq, chunk, last):
+    """
+    Функция формирует сообщение с частью передаваемого файла.
+    :param account_name: имя отправителя
+    :param recipient: имя получателя
+    :param file_id: идентификатор передачи
+    :param file_name: имя файла
+    :param seq: порядковый номер части
+    :param chunk: часть файла в виде байтов
+    :param last: признак последней части
+    :return:
+    """
+    message = {
+        ACTION: FILE,
+        TIME: time(),
+        FROM: account_name,
+        TO: recipient,
+        FILE_ID: file_id,
+        FILE_NAME: file_name,
+        SEQ: seq,
+        CHUNK: b64encode(chunk).decode('ascii'),
+        LAST: last
+    }
+    return message
+
+
+@Log()
+def get_download_path(message, directory=DOWNLOADS_DIR):
+    """
+    Функция формирует путь для сохранения принимаемого файла. Имя файла
+    приходит от другого пользователя: путь отбрасывается, а идентификатор
+    передачи в начале имени разделяет одновременные передачи файлов
+    с одинаковыми именами.
+    :param message: сообщение с частью файла
+    :param directory: каталог для сохранения файлов
+    :return: путь к файлу
+    """
+    file_id, file_name = message[FILE_ID], message[FILE_NAME]
+    if not isinstance(file_id, str) or not re.fullmatch(r'[0-9A-Za-z_-]{1,64}', file_id):
+        raise ValueError
+    if not isinstance(file_name, str):
+        raise ValueError
+    file_name = os.path.basename(file_name)
+    if file_name in ('', '.', '..'):
+        raise ValueError
+    return os.path.join(directory, f'{file_id}_{file_name}')
+
+
+@Log()
+def save_file_chunk(message, directory=DOWNLOADS_DIR):
+    """
+    Функция дописывает полученную часть файла на диск.
+    Первая часть создаёт новый файл, существующие файлы не перезаписываются.
+    :param message: сообщение с частью файла
+    :param directory: каталог для сохранения файлов
+    :return: путь к сохраняемому файлу
+    """
+    path = get_download_path(message, directory)
+    os.makedirs(directory, exist_ok=True)
+    with open(path, 'xb' if message[SEQ] == 0 else 'ab') as file:
+        file.write(b64decode(message[CHUNK]))
+    return path
+
+
+@Log()
+def read_response(message):
+    """
+    Функция принимает ответ сервера и выводит на экран
+    соответствующий результат
+    :param message:
+    :return:
+    """
+    client_log.debug('Разбор ответа сервера: %s', message)
+    if 'response' in message:
+        if message[RESPONSE] == 200:
+            return f'200: {message[ALERT]}'
+        elif message[RESPONSE] == 400:
+            return f'400: {message[ERROR]}'
+        else:
+            raise ValueError
+    raise MissingFieldError(RESPONSE)
+
+
+class MessengerClient:
+    """
+    Подключение к серверу мессенджера.
+    После connect() входящие сообщения принимаются в отдельном потоке
+    и передаются зарегистрированным функциям обратного вызова, а если
+    их нет - складываются в очередь, доступную через recv() и итерацию.
+    """
+    def __init__(self, user_name, address=DEFAULT_IP, port=DEFAULT_PORT,
+                 compression=True, downloads_dir=DOWNLOADS_DIR):
+        self.user_name = user_name
+        self.address = address
+        self.port = port
+        self.use_compression = compression
+        self.downloads_dir = downloads_dir
+        # Метод сжатия, согласованный с сервером
+        self.compression = None
+        self.socket = None
+        self.connected = False
+        self.callbacks = []
+        self.incoming = Queue()
+        # Активные передачи файлов {идентификатор: семафор}
+        self.transfers = {}
+        # Принимаемые файлы, которые не удалось сохранить: остальные
+        # части этих передач пропускаются
+        self.failed_transfers = set()
+        # Сообщения и части файлов могут отправляться из разных потоков
+        self.send_lock = threading.Lock()
+        self.receiver = None
+
+    def connect(self):
+        """
+        Подключается к серверу, отправляет presence-сообщение
+        и запускает поток приёма сообщений
+        :return: ответ сервера
+        """
+        self.socket = socket(AF_INET, SOCK_STREAM)
+        self.socket.connect((self.address, self.port))
+        client_log.info(f'Соединение с сервером {self.address}:{self.port}')
+
+        send_message(self.socket, create_presence_message(self.user_name,
+                                                          compression=self.use_compression))
+        response = get_message(self.socket)
+        answer = read_response(response)
+        client_log.info(f'Получен ответ сервера {answer}')
+        # Сервер может не поддерживать сжатие
+        self.compression = response.get(COMPRESSION)
+        self.connected = True
+
+        self.receiver = threading.Thread(target=self.receive_messages, daemon=True)
+        self.receiver.start()
+        client_log.debug('Сформирован поток для приема сообщений')
+        return answer
+
+    def add_callback(self, callback):
+        """
+        Регистрирует функцию, вызываемую для каждого входящего сообщения
+        в потоке приёма сообщений
+        :param callback: функция с аргументом - сообщением в виде словаря
+        """
+        self.callbacks.append(callback)
+
+    def send_message(self, message):
+        """
+        Отправляет серверу готовое сообщение
+        :param message: сообщение в виде словаря
+        """
+        with self.send_lock:
+            send_message(self.socket, message, self.compression)
+        CLIENT_EVENTS.log(SENT_EVENT, message)
+
+    def send(self, recipient, text):
+        """
+        Отправляет текстовое сообщение пользователю
+        :param recipient: имя получателя
+        :param text: текст сообщения
+        :return: отправленное сообщение
+        """
+        message = create_text_message(self.user_name, recipient, text)
+        self.send_message(message)
+        return message
+
+    def send_file(self, recipient, path):
+        """
+        Отправляет файл по частям. Следующая часть отправляется только
+        после подтверждения сервером приёма предыдущих, поэтому передача
+        не мешает обмену текстовыми сообщениями. Блокирует вызывающий поток.
+        :param recipient: имя получателя
+        :param path: путь к файлу
+        :return: True, если файл отправлен полностью
+        """
+        file_id = uuid4().hex
+        window = threading.Semaphore(FILE_WINDOW)
+        self.transfers[file_id] = window
+        try:
+            for seq, (chunk, last) in enumerate(read_file_chunks(path)):
+                if not window.acquire(timeout=FILE_ACK_TIMEOUT):
+                    client_log.error(f'Сервер не подтвердил приём файла {path}, передача прервана.')
+                    return False
+                self.send_message(create_file_message(self.user_name, recipient, file_id,
+                                                      os.path.basename(path), seq, chunk, last))
+            client_log.info(f'Файл {path} отправлен пользователю {recipient}')
+            return True
+        finally:
+            del self.transfers[file_id]
+
+    def recv(self, timeout=None):
+        """
+        Возвращает следующее входящее сообщение из очереди
+        :param timeout: время ожидания в секундах, 0 - не ждать,
+        None - ждать до получения сообщения
+        :return: сообщение или None, если сообщений нет или соединение закрыто
+        """
+        try:
+            return self.incoming.get(block=timeout != 0, timeout=timeout or None)
+        except Empty:
+            return None
+
+    def __iter__(self):
+        # Итерация заканчивается после потери соединения
+        while True:
+            message = self.incoming.get()
+            if message is None:
+                return
+            yield message
+
+    def close(self):
+        """
+        Сообщает серверу о выходе и закрывает соединение
+        """
+        if self.connected:
+            try:
+                self.send_message(create_exit_message(self.user_name))
+            except OSError:
+                pass
+        self.connected = False
+        if self.socket:
+            self.socket.close()
+        client_log.info('Завершение подключения.')
+
+    def deliver(self, message):
+        """
+        Передаёт входящее сообщение функциям обратного вызова или в очередь
+        :param message: сообщение в виде словаря
+        """
+        if not self.callbacks:
+            self.incoming.put(message)
+            return
+        # Ошибка в функции обратного вызова не должна останавливать приём
+        for callback in self.callbacks:
+            try:
+                callback(message)
+            except Exception:
+                client_log.exception(f'Ошибка при обработке входящего сообщения {callback}')
+
+    def process_message(self, message):
+        """
+        Разбирает сообщение сервера: подтверждения приёма частей файлов
+        обрабатываются здесь, сообщения текущему пользователю передаются дальше.
+        Типы полей проверяются так же, как на сервере, чтобы функции обратного
+        вызова получали только корректные сообщения.
+        :param message: сообщение в виде словаря
+        """
+        if (message.get(ACTION) == MSG
+                and all(field in message for field in (TIME, FROM, TO, TEXT))
+                and is_valid_message(message) and message[TO] == self.user_name):
+            self.deliver(message)
+        elif (message.get(ACTION) == FILE
+                and all(field in message for field in (TIME, FROM, TO, FILE_ID, FILE_NAME,
+                                                       SEQ, CHUNK, LAST))
+                and is_valid_file_chunk(message) and message[TO] == self.user_name):
+            if message[FILE_ID] in self.failed_transfers:
+                if message[LAST]:
+                    self.failed_transfers.discard(message[FILE_ID])
+                return
+            # Ошибка записи файла или повреждённая часть не должны
+            # прерывать приём сообщений
+            try:
+                path = save_file_chunk(message, self.downloads_dir)
+            except (OSError, ValueError) as err:
+                client_log.error(f'Не удалось сохранить файл {message[FILE_NAME]} '
+                                 f'от {message[FROM]}: {err}')
+                self.fail_transfer(message)
+                return
+            # О файле сообщаем после получения последней части
+            if message[LAST]:
+                message[FILE_PATH] = path
+                self.deliver(message)
+        elif (RESPONSE in message and message[RESPONSE] == 202
+                and isinstance(message.get(FILE_ID), str)):
+            # Подтверждение приёма части файла, разрешаем отправку следующей
+            if message[FILE_ID] in self.transfers:
+                self.transfers[message[FILE_ID]].release()
+        elif RESPONSE in message and message[RESPONSE] == 400 and ERROR in message:
+            client_log.warning(f'Сервер отклонил сообщение: {message[ERROR]}')
+        elif RESPONSE in message and message[RESPONSE] == 503:
+            client_log.warning(f'Сервер завершает работу.')
+        elif TO in message and message[TO] != self.user_name:
+            return
+        else:
+            raise ValueError
+
+    def fail_transfer(self, message):
+        """
+        Прекращает приём файла: удаляет сохранённые части и пропускает остальные
+        :param message: часть файла, которую не удалось сохранить
+        """
+        if not message[LAST]:
+            self.failed_transfers.add(message[FILE_ID])
+        # Первая часть могла не сохраниться из-за уже существующего файла
+        if message[SEQ] == 0:
+            return
+        try:
+            os.remove(get_download_path(message, self.downloads_dir))
+        except (OSError, ValueError):
+            pass
+
+    def receive_messages(self):
+        """
+        Цикл приёма сообщений, выполняется в отдельном потоке
+        """
+        try:
+            while True:
+                try:
+                    message = get_message(self.socket)
+                    CLIENT_EVENTS.log(RECEIVED_EVENT, message)
+                    self.process_message(message)
+
+                except (OSError, ConnectionError, ConnectionAbortedError,
+                        ConnectionResetError, json.JSONDecodeError):
+                    if self.connected:
+                        client_log.critical('Потеряно соединение с сервером.')
+                    break
+
+                except (ValueError, NotDictError):
+                    client_log.error(f'Получено некорректное сообщение от сервера.')
+        finally:
+            # Поток мог завершиться и из-за непредвиденной ошибки
+            self.connected = False
+            # Завершаем итерацию по входящим сообщениям
+            self.incoming.put(None)
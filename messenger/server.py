@@ -2,98 +2,342 @@
 Серверная часть.
 Параметры командной строки:
 -p <port> — TCP-порт для работы (по умолчанию использует 7777);
--a <addr> — IP-адрес для прослушивания (по умолчанию слушает все доступные адреса).
+-a <addr> — IP-адрес для прослушивания (по умолчанию слушает все доступные адреса);
+-c <file> — файл настроек (по умолчанию server.ini, если он есть);
+--peer-port <port> — порт для подключения других узлов кластера;
+--peers <addr:port,...> — адреса других узлов кластера;
+--admin-port <port> — порт администрирования (по умолчанию 7778);
+--log-level <level> — уровень журналирования.
+Остальные настройки задаются в файле настроек или переменных окружения,
+см. server_config.py. Консоль администратора (server_gui.py) подключается
+к порту администрирования на локальном адресе.
 """
 import argparse
 import json
+import os
 import select
-from time import time
-from sys import argv
+from time import time, perf_counter
+from sys import argv, stdin
 import logging
-import log.server_log_config
-from socket import socket, AF_INET, SOCK_STREAM, SOL_SOCKET, SO_REUSEADDR
-from common.utils import send_message, get_message
+from log.server_log_config import SERVER_EVENTS
+from socket import socket, gethostname, AF_INET, SOCK_STREAM, SOL_SOCKET, SO_REUSEADDR, \
+    SO_RCVBUF, SO_SNDBUF
+from common.utils import send_message, get_message, has_buffered_message, make_frame, \
+    encode_message, MessageTemplate
 from common.variables import *
 from decos import Log
-from errors import NotDictError
+from errors import NotDictError, ConfigError
+from handlers import register_action, get_handler, is_valid_message, is_valid_file_chunk, \
+    ACTION_HANDLERS, ADMIN_HANDLERS, PEER_HANDLERS
+from server_control import install_signal_handlers, shutdown_server, restart_server, \
+    restore_server, confirm_restart, reload_config, STOP, RESTART, HANDOFF_ARGUMENT
+from server_config import ServerConfig, convert_value
+from server_database import ServerDatabase
+from server_federation import connect_peers, finish_peer_connect, configure_peers
+from server_mailbox import Mailboxes
+from server_state import ServerState
 
 server_log = logging.getLogger('server')
 
+# Частые ответы сервера кодируются заранее, при отправке подставляется время
+CONNECTED_RESPONSE = MessageTemplate({RESPONSE: 200, TIME: None,
+                                      ALERT: 'Соединение прошло успешно'})
+CONNECTED_COMPRESSED_RESPONSE = MessageTemplate({RESPONSE: 200, TIME: None,
+                                                 ALERT: 'Соединение прошло успешно',
+                                                 COMPRESSION: COMPRESSION_METHOD})
+BAD_REQUEST_RESPONSE = MessageTemplate({RESPONSE: 400, TIME: None,
+                                        ERROR: 'Ошибка соединения'})
 
-@Log()
-def create_response(message, client, message_list, client_list):
+
+def is_valid_presence(message):
     """
-    Функция проверяет поля сообщения на соответствие JIM-формату
-    и отправляет сообщение с кодом ответа,
-    либо записывает полученное сообщение в очередь на отправку.
-    :param client_list:
-    :param message_list: список принятых сообщений
-    :param client: сокет пользователя
-    :param message: сообщение в виде словаря
-    :return: ответ в виде словаря
-    """
-    server_log.debug(f'Формирование ответа на сообщение {message}')
-    # Если получено presence-сообщение, сообщаем об успешном подключении
-    if (ACTION in message and message[ACTION] == PRESENCE
-            and TIME in message and USER in message
-            and isinstance(message[USER], dict)):
-        server_log.info(f'Принято presence-сообщение {message} '
-                        f'от: {message[USER]["account_name"]}')
-        response = {
-            RESPONSE: 200,
-            TIME: time(),
-            ALERT: 'Соединение прошло успешно'
-        }
-        server_log.info(f'Сформировано сообщение об успешном соединении с {client}')
-        send_message(client, response)
-        return
+    Проверяет поля presence-сообщения: пользователь указан словарём
+    с именем-строкой, поддерживаемые методы сжатия - списком
+    """
+    return (isinstance(message[USER], dict)
+            and isinstance(message[USER].get('account_name'), str)
+            and isinstance(message.get(COMPRESSION, []), list))
 
-    # Если получено текстовое сообщение, добавляем его в список на отправку
-    if (ACTION in message and message[ACTION] == MSG
-            and TIME in message and FROM in message
-            and TO in message and TEXT in message):
-        server_log.info(f'Принято сообщение {message} от: {message[FROM]}')
-        message_list.append(message)
+
+@register_action(PRESENCE, (TIME, USER), is_valid_presence)
+def handle_presence(message, client, state):
+    """
+    Обработчик presence-сообщения: сообщает клиенту об успешном подключении
+    и согласовывает сжатие, если клиент его поддерживает.
+    Повторное presence-сообщение в том же соединении отклоняется.
+    """
+    if state.get_name(client) is not None:
+        send_message(client, {RESPONSE: 400, TIME: time(),
+                              ERROR: 'Пользователь уже представился'})
         return
+    name = message[USER]['account_name']
+    server_log.info(f'Подключился пользователь {name}')
+    state.login(name, client)
+    response = CONNECTED_RESPONSE
+    if COMPRESSION in message and COMPRESSION_METHOD in message[COMPRESSION]:
+        response = CONNECTED_COMPRESSED_RESPONSE
+        state.compressed_clients.add(client)
+    client.sendall(response.make_frame())
+
+    # Сообщения, поступившие, пока пользователь был не подключен
+    stored = state.mailboxes.take(name)
+    for data in stored:
+        client.sendall(make_frame(data, state.get_compression(client)))
+    if stored:
+        server_log.info(f'Пользователю {name} доставлено сообщений из почтового ящика: {len(stored)}')
+
 
-    if ACTION in message and message[ACTION] == EXIT:
-        server_log.info(f'Клиент {client} отключился от сервера.')
-        client.close()
-        client_list.remove(client)
+def queue_message(message, client, state):
+    """
+    Ставит сообщение в очередь на отправку, а если получатель не подключен
+    ни к этому, ни к другому узлу кластера - в его почтовый ящик.
+    Если сообщение принять нельзя, отправляет клиенту ошибку.
+    :param message: сообщение в виде словаря
+    :param client: сокет отправителя
+    :param state: состояние сервера
+    :return: True, если сообщение принято
+    """
+    # Пользователь может отправлять сообщения только от своего имени
+    if message[FROM] != state.get_name(client):
+        error = 'Отправитель не совпадает с подключенным пользователем'
+    else:
+        error = state.can_queue(client)
+    if error is None:
+        if message[TO] in state.names or message[TO] in state.remote_users:
+            state.messages.append(message)
+            return True
+        if state.store_message(message):
+            return True
+        error = 'Почтовый ящик получателя переполнен'
+    server_log.warning(f'Сообщение клиента {state.get_name(client)} отклонено: {error}')
+    send_message(client, {RESPONSE: 400, TIME: time(), ERROR: error})
+    return False
+
+
+@register_action(MSG, (TIME, FROM, TO, TEXT), is_valid_message)
+def handle_message(message, client, state):
+    """
+    Обработчик текстового сообщения: добавляет его в список на отправку
+    """
+    if not queue_message(message, client, state):
         return
+    state.message_sent(message)
+
 
+@register_action(FILE, (TIME, FROM, TO, FILE_ID, FILE_NAME, SEQ, CHUNK, LAST),
+                 is_valid_file_chunk)
+def handle_file(message, client, state):
+    """
+    Обработчик части файла: ставит её в очередь на отправку вместе с
+    текстовыми сообщениями и подтверждает приём отправителю
+    """
+    if not queue_message(message, client, state):
+        return
     response = {
-        RESPONSE: 400,
+        RESPONSE: 202,
         TIME: time(),
-        ERROR: 'Ошибка соединения'
+        FILE_ID: message[FILE_ID],
+        SEQ: message[SEQ]
     }
-    server_log.info(f'Сформировано сообщение об ошибке для клиента {client}')
     send_message(client, response)
-    return
+
+
+@register_action(EXIT)
+def handle_exit(message, client, state):
+    """
+    Обработчик выхода: закрывает соединение с клиентом
+    """
+    state.remove_client(client)
+
+
+@register_action(GET_STATE, (SINCE,), registry=ADMIN_HANDLERS)
+def handle_get_state(message, admin, state):
+    """
+    Команда консоли администратора: изменения состояния после известной
+    консоли версии. Полный список пользователей отправляется только при
+    первом запросе или если консоль отстала больше, чем хранит журнал.
+    """
+    response = {
+        RESPONSE: 200,
+        TIME: time(),
+        VERSION: state.version,
+        MESSAGE_COUNT: state.message_count,
+        CONNECTIONS: len(state.clients),
+        LIMITS: state.limits
+    }
+    changes = state.get_changes(message[SINCE])
+    if changes is None:
+        response[USERS] = state.get_users()
+    else:
+        response[EVENTS] = changes
+    send_message(admin, response, COMPRESSION_METHOD)
+
+
+@register_action(GET_HISTORY, registry=ADMIN_HANDLERS)
+def handle_get_history(message, admin, state):
+    """
+    Команда консоли администратора: сводка по пользователям из базы данных
+    """
+    history = state.database.get_history_summary() if state.database else []
+    send_message(admin, {RESPONSE: 200, TIME: time(), HISTORY: history}, COMPRESSION_METHOD)
+
+
+@register_action(KICK, (USER,), registry=ADMIN_HANDLERS)
+def handle_kick(message, admin, state):
+    """
+    Команда консоли администратора: отключение пользователя
+    """
+    if message[USER] not in state.names:
+        send_message(admin, {RESPONSE: 400, TIME: time(),
+                             ERROR: f'Пользователь {message[USER]} не подключен'})
+        return
+    server_log.info(f'Пользователь {message[USER]} отключен администратором.')
+    state.remove_client(state.names[message[USER]])
+    send_message(admin, {RESPONSE: 200, TIME: time(), ALERT: 'Пользователь отключен'})
+
+
+@register_action(SET_LIMITS, (LIMITS,),
+                 lambda message: isinstance(message[LIMITS], dict), registry=ADMIN_HANDLERS)
+def handle_set_limits(message, admin, state):
+    """
+    Команда консоли администратора: изменение ограничений сервера
+    """
+    for name, value in message[LIMITS].items():
+        try:
+            if name not in state.limits or not isinstance(value, int):
+                raise ConfigError(name, value)
+            convert_value(name, value)
+        except ConfigError:
+            send_message(admin, {RESPONSE: 400, TIME: time(),
+                                 ERROR: f'Неверное ограничение {name}'})
+            return
+    state.limits.update(message[LIMITS])
+    server_log.info(f'Администратор изменил ограничения: {message[LIMITS]}')
+    send_message(admin, {RESPONSE: 200, TIME: time(), ALERT: 'Ограничения изменены'})
+
+
+@register_action(PROFILE_START, (DURATION,),
+                 lambda message: isinstance(message[DURATION], (int, float))
+                 and message[DURATION] > 0, registry=ADMIN_HANDLERS)
+def handle_profile_start(message, admin, state):
+    """
+    Команда консоли администратора: профилирование сервера на заданное время
+    """
+    if not state.profiler.start(message[DURATION]):
+        send_message(admin, {RESPONSE: 400, TIME: time(), ERROR: 'Профилирование уже идёт'})
+        return
+    send_message(admin, {RESPONSE: 200, TIME: time(), ALERT: 'Профилирование включено'})
+
+
+@register_action(PROFILE_REPORT, registry=ADMIN_HANDLERS)
+def handle_profile_report(message, admin, state):
+    """
+    Команда консоли администратора: отчёт о последнем профилировании
+    """
+    send_message(admin, {RESPONSE: 200, TIME: time(), REPORT: state.profiler.report,
+                         ACTIVE: state.profiler.active}, COMPRESSION_METHOD)
+
+
+@Log()
+def create_response(message, client, state, registry=ACTION_HANDLERS):
+    """
+    Функция находит обработчик действия в реестре,
+    проверяет поля сообщения и передаёт сообщение обработчику,
+    либо отправляет клиенту сообщение об ошибке.
+    :param registry: реестр обработчиков
+    :param state: состояние сервера
+    :param client: сокет пользователя
+    :param message: сообщение в виде словаря
+    """
+    handler = get_handler(message.get(ACTION), registry)
+    if handler is not None and handler.is_valid(message):
+        # Время обработки замеряем только для записываемых событий
+        if not SERVER_EVENTS.sample(REQUEST_EVENT):
+            handler(message, client, state)
+            return
+        start = perf_counter()
+        handler(message, client, state)
+        SERVER_EVENTS.emit(REQUEST_EVENT, message, latency=perf_counter() - start)
+        return
+
+    SERVER_EVENTS.log(BAD_REQUEST_EVENT, message,
+                      user=state.get_name(client) or message.get(FROM))
+    client.sendall(BAD_REQUEST_RESPONSE.make_frame())
 
 
 @Log()
 def get_server_settings():
     """
-    Получает IP-адрес для прослушивания и порт для работы из командной строки
-    :return:
+    Получает настройки сервера из файла настроек, переменных окружения
+    и командной строки
+    :return: (настройки, признак передачи работы от прежнего процесса)
     """
-    server_log.info(f'Получение IP-фдреса и порта для работы.')
+    server_log.info(f'Получение настроек сервера.')
     args = argparse.ArgumentParser()
-    args.add_argument('-a', default=DEFAULT_LISTEN_ADDRESSES, nargs='?',
+    args.add_argument('-a', default=None, nargs='?',
                       help='Прослушиваемый IP-адрес, по умолчанию слушает все адреса.')
-    args.add_argument('-p', type=int, default=DEFAULT_PORT, nargs='?',
+    args.add_argument('-p', type=int, default=None, nargs='?',
                       help='Номер порта, должен находиться в диапазоне от 1024 до 65535.')
+    args.add_argument('-c', '--config', default=None,
+                      help='Файл настроек, по умолчанию server.ini.')
+    args.add_argument('--admin-port', type=int, default=None,
+                      help='Порт администрирования.')
+    args.add_argument('--log-level', default=None,
+                      help='Уровень журналирования.')
+    args.add_argument('--peer-port', type=int, default=None,
+                      help='Порт для подключения других узлов кластера.')
+    args.add_argument('--peers', default=None,
+                      help='Адреса других узлов кластера через запятую.')
+    args.add_argument(HANDOFF_ARGUMENT, action='store_true',
+                      help='Получить сокеты и состояние от прежнего процесса сервера.')
     namespace = args.parse_args(argv[1:])
-    listen_address = namespace.a
-    listen_port = namespace.p
 
-    if not (1024 < listen_port < 65535):
-        server_log.critical(f'Неверное значение порта {listen_port}.\n'
-                            f'Порт должен находиться в диапазоне от 1024 до 65535.')
+    try:
+        config = ServerConfig(namespace.config, {
+            'address': namespace.a,
+            'port': namespace.p,
+            'admin_port': namespace.admin_port,
+            'log_level': namespace.log_level,
+            'peer_port': namespace.peer_port,
+            'peers': namespace.peers
+        })
+    except ConfigError as err:
+        server_log.critical(f'{err}')
         exit(1)
 
-    return listen_address, listen_port
+    return config, namespace.handoff
+
+
+def process_incoming(sending_client, state, registry=ACTION_HANDLERS):
+    """
+    Принимает и обрабатывает сообщения клиента или консоли администратора
+    :param sending_client: сокет, готовый к чтению
+    :param state: состояние сервера
+    :param registry: реестр обработчиков
+    :return: False, если соединение разорвано
+    """
+    try:
+        # Обрабатываем и сообщения, принятые вместе с первым
+        while True:
+            incoming_message = get_message(sending_client, wait=False)
+            # Сообщение принято не полностью, остальное придёт позже
+            if incoming_message is None:
+                break
+            create_response(incoming_message, sending_client, state, registry)
+            # Обработчик мог закрыть соединение
+            if (sending_client.fileno() == -1
+                    or not has_buffered_message(sending_client)):
+                break
+
+    except json.JSONDecodeError:
+        server_log.error(f'Не удалось декодировать сообщение клиента.')
+
+    except (ValueError, NotDictError):
+        server_log.error(f'Неверный формат передаваемых данных.')
+
+    except Exception:
+        return False
+    return True
 
 
 def run_server():
@@ -102,70 +346,171 @@ def run_server():
     """
     server_log.info('Запуск сервера.')
 
-    listen_addr, listen_port = get_server_settings()
+    config, handoff = get_server_settings()
+    server_log.setLevel(config.log_level)
+    SERVER_EVENTS.set_sample_rate(REQUEST_EVENT, config.request_log_rate)
 
-    # Создаём сокет и начинаем прослушивание
-    server_socket = socket(AF_INET, SOCK_STREAM)
-    server_socket.setsockopt(SOL_SOCKET, SO_REUSEADDR, 1)
-    server_socket.bind((listen_addr, listen_port))
-    server_socket.settimeout(TIMEOUT)
+    database = ServerDatabase(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                           config.database))
+    state = ServerState(database, **config.limits())
+    state.profiler.directory = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                            PROFILE_DIR)
+    state.mailboxes = Mailboxes(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                             config.mailbox_dir),
+                                config.mailbox_ttl, config.mailbox_messages,
+                                config.mailbox_bytes, config.mailbox_memory,
+                                config.mailbox_total_bytes)
+    state.mailboxes.load()
+    state.node_name = config.node_name or f'{config.address or gethostname()}:{config.port}'
 
-    server_socket.listen(MAX_USERS)
-    server_log.info(f'Сервер запущен. Прослушиваемые адреса: {listen_addr}'
-                    f'Порт подключения: {listen_port}')
+    if handoff:
+        # Сокеты и клиенты переданы прежним процессом сервера
+        (server_socket, admin_socket, *peer_listening), ready = restore_server(state,
+                                                                               stdin.buffer)
+        peer_socket = peer_listening[0] if peer_listening else None
+    else:
+        # Создаём сокет и начинаем прослушивание
+        server_socket = socket(AF_INET, SOCK_STREAM)
+        server_socket.setsockopt(SOL_SOCKET, SO_REUSEADDR, 1)
+        # Размеры буферов наследуются принятыми соединениями
+        if config.recv_buffer:
+            server_socket.setsockopt(SOL_SOCKET, SO_RCVBUF, config.recv_buffer)
+        if config.send_buffer:
+            server_socket.setsockopt(SOL_SOCKET, SO_SNDBUF, config.send_buffer)
+        server_socket.bind((config.address, config.port))
+        server_socket.listen(config.backlog)
 
-    clients = []
-    messages = []
+        # Сокет для консоли администратора
+        admin_socket = socket(AF_INET, SOCK_STREAM)
+        admin_socket.setsockopt(SOL_SOCKET, SO_REUSEADDR, 1)
+        admin_socket.bind((ADMIN_ADDRESS, config.admin_port))
+        admin_socket.listen(config.backlog)
 
-    while True:
-        try:
-            # Получаем данные клиента
-            client, client_address = server_socket.accept()
-        except OSError:
-            pass
-        else:
-            server_log.info(f'Установлено соединение клиентом {client_address}')
-            clients.append(client)
+        # Сокет для подключения других узлов кластера
+        peer_socket = None
+        if config.peer_port:
+            peer_socket = socket(AF_INET, SOCK_STREAM)
+            peer_socket.setsockopt(SOL_SOCKET, SO_REUSEADDR, 1)
+            peer_socket.bind((config.peer_listen_address, config.peer_port))
+            peer_socket.listen(config.backlog)
+    listening_sockets = [server_socket, admin_socket] + ([peer_socket] if peer_socket else [])
+    if peer_socket:
+        state.peer_address = f'{config.peer_listen_address or "127.0.0.1"}:{config.peer_port}'
+    configure_peers(state, config.peers, config.peer_secret)
+    server_log.info(f'Сервер запущен. Прослушиваемые адреса: {config.address}'
+                    f'Порт подключения: {config.port}')
+    server_log.info(f'Порт администрирования: {config.admin_port}')
+    if peer_socket:
+        server_log.info(f'Узел кластера {state.node_name}, порт для узлов: {config.peer_port}')
+
+    install_signal_handlers(state)
+    if handoff:
+        # Прежний процесс закроет свои сокеты после подтверждения
+        confirm_restart(ready)
+    last_commit = time()
+    last_peer_connect = 0
 
-        # Создаём списки клиентов, ожидающих обработки
+    while state.stop_request != STOP:
+        if state.stop_request == RESTART:
+            # При неудачном перезапуске сервер продолжает работу
+            state.stop_request = None
+            if restart_server(state, listening_sockets, argv):
+                return
+        if state.reload_request:
+            state.reload_request = False
+            reload_config(state, config)
+        if state.profile_request:
+            state.profile_request = False
+            if state.profiler.active:
+                state.profiler.stop()
+            else:
+                state.profiler.start()
+        state.profiler.check()
+        if config.peers and time() - last_peer_connect > PEER_RETRY_INTERVAL:
+            connect_peers(state, config.peers)
+            last_peer_connect = time()
+
+        # Ждём новых подключений и сообщений. Готовность к записи
+        # проверяем, только если есть сообщения на отправку
         read_lst = []
         write_lst = []
-        err_lst = []
         try:
-            if clients:
-                read_lst, write_lst, err_lst = select.select(clients, clients, [], 0)
+            read_lst, write_lst, err_lst = select.select(
+                listening_sockets + state.clients + state.admins + state.peers,
+                (state.clients + state.peers if state.messages else []) + list(state.connecting),
+                [], config.timeout)
         except OSError:
             pass
 
-        # Получаем сообщения пользователей
-        if read_lst:
-            for sending_client in read_lst:
-                try:
-                    incoming_message = get_message(sending_client)
-                    create_response(incoming_message, sending_client, messages, clients)
+        # Подключение к узлу завершено, когда сокет готов к записи
+        for ready_socket in write_lst:
+            if ready_socket in state.connecting:
+                finish_peer_connect(state, ready_socket)
 
-                except json.JSONDecodeError:
-                    server_log.error(f'Не удалось декодировать сообщение клиента.')
+        for ready_socket in read_lst:
+            if ready_socket is server_socket:
+                # Получаем данные клиента
+                client, client_address = server_socket.accept()
+                if not state.can_accept():
+                    server_log.warning(f'Достигнуто наибольшее число клиентов, '
+                                       f'соединение {client_address} отклонено.')
+                    client.close()
+                    continue
+                server_log.info(f'Установлено соединение клиентом {client_address}')
+                state.clients.append(client)
 
-                except (ValueError, NotDictError):
-                    server_log.error(f'Неверный формат передаваемых данных.')
+            elif ready_socket is admin_socket:
+                admin, admin_address = admin_socket.accept()
+                server_log.info(f'Подключена консоль администратора {admin_address}')
+                state.admins.append(admin)
 
-                except Exception as e:
-                    server_log.info(f'Клиент {sending_client.getpeername()} отключился от сервера.')
-                    sending_client.close()
-                    clients.remove(sending_client)
+            elif ready_socket is peer_socket:
+                peer, peer_address = peer_socket.accept()
+                server_log.info(f'Подключение узла кластера {peer_address}')
+                state.peers.append(peer)
 
-        # Отправляем полученные сообщения клиентам
-        if messages and write_lst:
-            message = messages[0]
-            del messages[0]
-            for waiting_client in write_lst:
+            elif ready_socket in state.peers:
+                if not process_incoming(ready_socket, state, PEER_HANDLERS):
+                    state.remove_peer(ready_socket)
+
+            elif ready_socket in state.admins:
+                if not process_incoming(ready_socket, state, ADMIN_HANDLERS):
+                    server_log.info('Консоль администратора отключена.')
+                    ready_socket.close()
+                    state.admins.remove(ready_socket)
+
+            # Клиент мог быть отключен при обработке предыдущих сокетов
+            elif ready_socket in state.clients:
+                if not process_incoming(ready_socket, state):
+                    state.remove_client(ready_socket)
+
+        # Отправляем сообщения получателям и узлам кластера, готовым к приёму
+        # Очередь разбирается и без готовых к записи сокетов, чтобы
+        # отключить получателей, не принимающих сообщения
+        if state.messages:
+            for recipient, message in state.route_messages(set(write_lst)):
+                # JSON-байты сообщения нужны и для кадра, и для почтового ящика,
+                # если отправить сообщение не удастся
+                data = encode_message(message)
+                # Получатель мог быть отключен при отправке предыдущих сообщений
+                if not state.is_connected(recipient):
+                    state.store_message(message, data)
+                    continue
                 try:
-                    send_message(waiting_client, message)
-                except Exception as e:
-                    server_log.info(f'Клиент {waiting_client.getpeername()} отключился от сервера.')
-                    waiting_client.close()
-                    clients.remove(waiting_client)
+                    recipient.sendall(make_frame(data, state.get_compression(recipient)))
+                except Exception:
+                    if recipient in state.peer_nodes:
+                        state.remove_peer(recipient)
+                    else:
+                        state.remove_client(recipient)
+                    state.store_message(message, data)
+
+        if time() - last_commit > config.database_commit_interval:
+            database.commit()
+            state.mailboxes.expire()
+            last_commit = time()
+
+    shutdown_server(state, listening_sockets, config.shutdown_timeout)
 
 
 if __name__ == '__main__':
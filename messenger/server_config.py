@@ -0,0 +1,166 @@
+"""
+Настройки сервера.
+Значения берутся по возрастанию приоритета: значения по умолчанию из
+common/variables.py, секция [server] файла настроек (server.ini или
+файл из параметра -c), переменные окружения MESSENGER_<ИМЯ НАСТРОЙКИ>
+и параметры командной строки. Все значения проверяются при запуске.
+Настройки, помеченные как изменяемые, перечитываются по сигналу SIGHUP.
+"""
+import os
+import logging
+import log.server_log_config
+from configparser import ConfigParser
+from common.variables import *
+from errors import ConfigError
+
+server_log = logging.getLogger('server')
+
+CONFIG_SECTION = 'server'
+ENV_PREFIX = 'MESSENGER_'
+DEFAULT_CONFIG_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'server.ini')
+LOG_LEVELS = ('DEBUG', 'INFO', 'WARNING', 'ERROR', 'CRITICAL')
+
+# {имя: (тип, значение по умолчанию, (минимум, максимум) или None, изменяемая без перезапуска)}
+SETTINGS = {
+    'address': (str, DEFAULT_LISTEN_ADDRESSES, None, False),
+    'port': (int, DEFAULT_PORT, (1025, 65534), False),
+    'admin_port': (int, ADMIN_PORT, (1025, 65534), False),
+    # Длина очереди входящих подключений
+    'backlog': (int, MAX_USERS, (1, 65535), False),
+    # Время ожидания select, с
+    'timeout': (float, TIMEOUT, (0.01, 60), False),
+    # Размеры буферов сокетов клиентов, 0 - по умолчанию системы
+    'recv_buffer': (int, 0, (0, 16 * 1024 * 1024), False),
+    'send_buffer': (int, 0, (0, 16 * 1024 * 1024), False),
+    'database': (str, SERVER_DATABASE, None, False),
+    'database_commit_interval': (float, DATABASE_COMMIT_INTERVAL, (0, 3600), False),
+    'shutdown_timeout': (float, SHUTDOWN_TIMEOUT, (0, 3600), False),
+    # Кластер: имя узла (по умолчанию <адрес>:<порт>), порт для других узлов
+    # и IP-адреса других узлов через запятую: 127.0.0.1:7801,127.0.0.1:7802
+    'node_name': (str, '', None, False),
+    'peer_port': (int, PEER_PORT, (0, 65534), False),
+    'peer_listen_address': (str, PEER_LISTEN_ADDRESS, None, False),
+    'peer_secret': (str, PEER_SECRET, None, True),
+    'peers': (str, '', None, True),
+    # Почтовые ящики отключенных пользователей
+    'mailbox_dir': (str, MAILBOX_DIR, None, False),
+    'mailbox_ttl': (float, MAILBOX_TTL, (1, 365 * 24 * 60 * 60), False),
+    'mailbox_messages': (int, MAILBOX_MESSAGES, (0, 100000000), False),
+    'mailbox_bytes': (int, MAILBOX_BYTES, (0, 2 ** 40), False),
+    'mailbox_memory': (int, MAILBOX_MEMORY, (0, 2 ** 40), False),
+    'mailbox_total_bytes': (int, MAILBOX_TOTAL_BYTES, (0, 2 ** 50), False),
+    'max_clients': (int, MAX_CLIENTS, (1, 1000000), True),
+    # Наибольшая длина очереди сообщений на отправку
+    'max_queue': (int, MAX_QUEUED_MESSAGES, (1, 100000000), True),
+    # Наибольшее число сообщений в очереди одному получателю и время,
+    # после которого не принимающий сообщения получатель отключается, с
+    'max_recipient_queue': (int, MAX_RECIPIENT_QUEUE, (1, 100000000), True),
+    'stall_timeout': (int, STALL_TIMEOUT, (1, 24 * 60 * 60), True),
+    # Наибольшее число сообщений от клиента в секунду, 0 - без ограничения
+    'max_message_rate': (int, MAX_MESSAGE_RATE, (0, 1000000), True),
+    # На уровне DEBUG в журнал выводятся вызовы функций, от сообщений
+    # остаются служебные поля без текстов и содержимого файлов
+    'log_level': (str, 'INFO', LOG_LEVELS, True),
+    # Доля записываемых в журнал событий обработки сообщений
+    'request_log_rate': (float, EVENT_SAMPLE_RATES[REQUEST_EVENT], (0, 1), True),
+}
+
+
+def convert_value(name, value):
+    """
+    Приводит значение настройки к нужному типу и проверяет его
+    :param name: имя настройки
+    :param value: значение, обычно строка
+    :return: проверенное значение
+    """
+    if name not in SETTINGS:
+        raise ConfigError(name, value, 'Неизвестная настройка.')
+    value_type, default, allowed, reloadable = SETTINGS[name]
+    try:
+        value = value_type(value)
+    except (TypeError, ValueError):
+        raise ConfigError(name, value, f'Ожидается {value_type.__name__}.')
+    if value_type is str and allowed is not None:
+        value = value.upper()
+        if value not in allowed:
+            raise ConfigError(name, value, f'Допустимые значения: {", ".join(allowed)}.')
+    elif allowed is not None and not (allowed[0] <= value <= allowed[1]):
+        raise ConfigError(name, value, f'Значение должно находиться в диапазоне '
+                                       f'от {allowed[0]} до {allowed[1]}.')
+    return value
+
+
+class ServerConfig:
+    """
+    Проверенные настройки сервера, доступные как атрибуты
+    """
+    def __init__(self, path=None, overrides=None, environ=None):
+        """
+        :param path: файл настроек, по умолчанию server.ini, если он существует
+        :param overrides: значения из командной строки {имя: значение}
+        :param environ: переменные окружения, по умолчанию os.environ
+        """
+        self.path = path
+        self.overrides = {name: value for name, value in (overrides or {}).items()
+                          if value is not None}
+        self.environ = os.environ if environ is None else environ
+        for name, value in self.load().items():
+            setattr(self, name, value)
+
+    def load(self):
+        """
+        Читает и проверяет все настройки
+        :return: {имя: значение}
+        """
+        values = {name: setting[1] for name, setting in SETTINGS.items()}
+
+        path = self.path
+        if path is None and os.path.exists(DEFAULT_CONFIG_FILE):
+            path = DEFAULT_CONFIG_FILE
+        if path is not None:
+            parser = ConfigParser()
+            if not parser.read(path, encoding=ENCODING):
+                raise ConfigError('config', path, 'Файл настроек не найден.')
+            if parser.has_section(CONFIG_SECTION):
+                values.update(parser.items(CONFIG_SECTION))
+
+        for name in SETTINGS:
+            env_name = ENV_PREFIX + name.upper()
+            if env_name in self.environ:
+                values[name] = self.environ[env_name]
+
+        values.update(self.overrides)
+        return {name: convert_value(name, value) for name, value in values.items()}
+
+    def reload(self):
+        """
+        Перечитывает настройки и применяет изменяемые без перезапуска.
+        При ошибке в настройках сохраняются прежние значения.
+        :return: {имя: новое значение} для изменившихся настроек
+        """
+        try:
+            values = self.load()
+        except ConfigError as err:
+            server_log.error(f'Настройки не перечитаны: {err}')
+            return {}
+        changed = {}
+        for name, value in values.items():
+            if value == getattr(self, name):
+                continue
+            if SETTINGS[name][3]:
+                setattr(self, name, value)
+                changed[name] = value
+            else:
+                server_log.warning(f'Настройка {name} применяется только при перезапуске.')
+        return changed
+
+    def limits(self):
+        """
+        Возвращает ограничения, которые можно менять во время работы сервера
+        :return:
+        """
+        return {'max_clients': self.max_clients,
+                'max_queue': self.max_queue,
+                'max_recipient_queue': self.max_recipient_queue,
+                'stall_timeout': self.stall_timeout,
+                'max_message_rate': self.max_message_rate}
@@ -0,0 +1,243 @@
+"""
+Управление работой сервера: обработка сигналов, остановка с отправкой
+накопленных сообщений и перезапуск без разрыва соединений.
+Почтовые ящики при остановке и перезапуске сохраняются в файлы.
+SIGINT, SIGTERM - остановка сервера;
+SIGHUP - чтение изменяемых без перезапуска настроек;
+SIGUSR1 - включение или выключение профилирования (server_profiler.py);
+SIGUSR2 - запуск нового процесса сервера, которому передаются
+прослушиваемые сокеты, соединения клиентов и очередь сообщений.
+Прежний процесс закрывает свои сокеты только после того, как новый
+сообщит о готовности, иначе продолжает работу.
+"""
+import json
+import os
+import select
+import signal
+import subprocess
+import sys
+import tempfile
+import logging
+import log.server_log_config
+from log.server_log_config import SERVER_EVENTS
+from base64 import b64encode, b64decode
+from time import time
+from socket import socket
+from common.utils import encode_message, make_frame, MessageTemplate, RECEIVE_BUFFERS
+from common.variables import *
+from server_federation import configure_peers
+
+server_log = logging.getLogger('server')
+
+STOP = 'stop'
+RESTART = 'restart'
+# Аргумент командной строки нового процесса, получающего состояние через stdin
+HANDOFF_ARGUMENT = '--handoff'
+# Уведомление клиентов об остановке сервера
+SHUTDOWN_NOTICE = MessageTemplate({RESPONSE: 503, TIME: None, ERROR: 'Сервер завершает работу'})
+
+
+def install_signal_handlers(state):
+    """
+    Устанавливает обработчики сигналов. Обработчики только запоминают
+    запрос, сервер выполняет его после текущей итерации основного цикла.
+    :param state: состояние сервера
+    """
+    def request_stop(signum, frame):
+        server_log.info(f'Получен сигнал {signum}, остановка сервера.')
+        state.stop_request = STOP
+
+    def request_restart(signum, frame):
+        server_log.info(f'Получен сигнал {signum}, перезапуск сервера.')
+        state.stop_request = RESTART
+
+    def request_reload(signum, frame):
+        server_log.info(f'Получен сигнал {signum}, чтение настроек.')
+        state.reload_request = True
+
+    def request_profile(signum, frame):
+        state.profile_request = True
+
+    signal.signal(signal.SIGINT, request_stop)
+    signal.signal(signal.SIGTERM, request_stop)
+    # Перезапуск с передачей дескрипторов доступен только в Unix
+    if hasattr(signal, 'SIGUSR2'):
+        signal.signal(signal.SIGUSR2, request_restart)
+    if hasattr(signal, 'SIGHUP'):
+        signal.signal(signal.SIGHUP, request_reload)
+    if hasattr(signal, 'SIGUSR1'):
+        signal.signal(signal.SIGUSR1, request_profile)
+
+
+def reload_config(state, config):
+    """
+    Перечитывает настройки и применяет ограничения и уровень журналирования
+    :param state: состояние сервера
+    :param config: настройки сервера
+    """
+    changed = config.reload()
+    state.limits.update({name: value for name, value in changed.items()
+                         if name in state.limits})
+    if 'log_level' in changed:
+        server_log.setLevel(changed['log_level'])
+    if 'request_log_rate' in changed:
+        SERVER_EVENTS.set_sample_rate(REQUEST_EVENT, changed['request_log_rate'])
+    if 'peers' in changed or 'peer_secret' in changed:
+        configure_peers(state, config.peers, config.peer_secret)
+    server_log.info(f'Настройки прочитаны, изменено: {changed}')
+
+
+def flush_messages(state, timeout=SHUTDOWN_TIMEOUT):
+    """
+    Отправляет подключенным получателям все накопленные сообщения, ожидая
+    не дольше timeout. Не отправленные сообщения остаются в почтовых ящиках.
+    :param state: состояние сервера
+    :param timeout: время на отправку, с
+    """
+    deadline = time() + timeout
+    for recipient, message in state.route_messages(set(state.clients + state.peers)):
+        data = encode_message(message)
+        remaining = deadline - time()
+        if remaining <= 0 or not state.is_connected(recipient):
+            state.store_message(message, data)
+            continue
+        try:
+            recipient.settimeout(remaining)
+            recipient.sendall(make_frame(data, state.get_compression(recipient)))
+        except OSError:
+            if recipient in state.peer_nodes:
+                state.remove_peer(recipient)
+            else:
+                state.remove_client(recipient)
+            state.store_message(message, data)
+
+
+def shutdown_server(state, listening_sockets, timeout=SHUTDOWN_TIMEOUT):
+    """
+    Останавливает сервер: прекращает приём подключений, отправляет
+    накопленные сообщения, уведомляет клиентов и закрывает соединения
+    :param state: состояние сервера
+    :param listening_sockets: прослушиваемые сокеты
+    :param timeout: время на отправку накопленных сообщений, с
+    """
+    for listening_socket in listening_sockets:
+        listening_socket.close()
+    flush_messages(state, timeout)
+
+    # Уведомление кодируется один раз для всех клиентов
+    notice = SHUTDOWN_NOTICE.make_frame()
+    for client in list(state.clients):
+        try:
+            client.sendall(notice)
+        except OSError:
+            pass
+        state.remove_client(client)
+    for admin in state.admins:
+        admin.close()
+    state.admins.clear()
+    for peer in list(state.peers):
+        state.remove_peer(peer)
+    for peer in state.connecting:
+        peer.close()
+    state.connecting.clear()
+    state.mailboxes.spill_all()
+    if state.database:
+        state.database.close()
+    server_log.info('Сервер остановлен.')
+
+
+def restart_server(state, listening_sockets, argv, timeout=RESTART_TIMEOUT):
+    """
+    Запускает новый процесс сервера и передаёт ему прослушиваемые сокеты,
+    соединения клиентов и очередь сообщений. Дескрипторы наследуются
+    новым процессом, поэтому соединения не разрываются. Новый процесс
+    сообщает о готовности через канал; если он не сообщил о ней за timeout,
+    он останавливается, а прежний процесс продолжает работу.
+    :param state: состояние сервера
+    :param listening_sockets: прослушиваемые сокеты
+    :param argv: аргументы командной строки сервера
+    :param timeout: время ожидания готовности нового процесса, с
+    :return: запущенный процесс или None, если перезапуск не удался
+    """
+    ready_read, ready_write = os.pipe()
+    handoff = {
+        'listening': [listening_socket.fileno() for listening_socket in listening_sockets],
+        'clients': [{
+            'fd': client.fileno(),
+            USER: state.get_name(client),
+            COMPRESSION: client in state.compressed_clients,
+            'buffer': b64encode(RECEIVE_BUFFERS.get(client, b'')).decode('ascii')
+        } for client in state.clients],
+        'messages': state.messages,
+        MESSAGE_COUNT: state.message_count,
+        'ready': ready_write
+    }
+    # Новый процесс загрузит почтовые ящики из файлов
+    state.mailboxes.spill_all()
+    descriptors = (handoff['listening'] + [client['fd'] for client in handoff['clients']]
+                   + [ready_write])
+    arguments = [argument for argument in argv[1:] if argument != HANDOFF_ARGUMENT]
+    # Состояние передаётся через файл: запись в канал заблокировала бы
+    # процесс, если новый процесс не читает его
+    with tempfile.TemporaryFile() as stream:
+        stream.write(json.dumps(handoff).encode(ENCODING))
+        stream.seek(0)
+        process = subprocess.Popen([sys.executable, os.path.abspath(argv[0]), *arguments,
+                                    HANDOFF_ARGUMENT], stdin=stream, pass_fds=descriptors)
+    # Канал закрывается и при завершении нового процесса
+    os.close(ready_write)
+    try:
+        ready, _, _ = select.select([ready_read], [], [], timeout)
+        confirmed = bool(ready) and os.read(ready_read, 1) == b'1'
+    finally:
+        os.close(ready_read)
+    if not confirmed:
+        process.kill()
+        process.wait()
+        server_log.error(f'Новый процесс сервера не сообщил о готовности, '
+                         f'сервер продолжает работу.')
+        return None
+
+    # Закрываем свои копии дескрипторов, соединения остаются в новом процессе
+    # Узлы кластера подключатся к новому процессу повторно
+    for sock in (listening_sockets + state.clients + state.admins + state.peers
+                 + list(state.connecting)):
+        sock.close()
+    if state.database:
+        state.database.close()
+    server_log.info(f'Работа передана процессу {process.pid}, '
+                    f'клиентов: {len(handoff["clients"])}.')
+    return process
+
+
+def restore_server(state, stream):
+    """
+    Восстанавливает состояние, переданное прежним процессом сервера.
+    Ограничения берутся из настроек нового процесса.
+    :param state: состояние нового процесса
+    :param stream: поток, из которого читается переданное состояние
+    :return: прослушиваемые сокеты и дескриптор канала для сообщения о готовности
+    """
+    handoff = json.loads(stream.read().decode(ENCODING))
+    listening_sockets = [socket(fileno=fd) for fd in handoff['listening']]
+    for client in handoff['clients']:
+        client_socket = socket(fileno=client['fd'])
+        state.restore_client(client_socket, client[USER], client[COMPRESSION])
+        buffer = b64decode(client['buffer'])
+        if buffer:
+            RECEIVE_BUFFERS[client_socket] = buffer
+    state.messages.extend(handoff['messages'])
+    state.message_count = handoff[MESSAGE_COUNT]
+    server_log.info(f'Получена работа от прежнего процесса, клиентов: {len(state.clients)}.')
+    return listening_sockets, handoff['ready']
+
+
+def confirm_restart(ready):
+    """
+    Сообщает прежнему процессу сервера о готовности к работе
+    :param ready: дескриптор канала, переданный прежним процессом
+    """
+    try:
+        os.write(ready, b'1')
+    finally:
+        os.close(ready)
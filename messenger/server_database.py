@@ -0,0 +1,89 @@
+"""
+База данных сервера: пользователи, история входов и статистика сообщений
+"""
+import sqlite3
+from time import time
+
+
+class ServerDatabase:
+    """
+    Хранилище сервера в SQLite. Изменения записываются на диск
+    методом commit, сервер вызывает его периодически, а не после
+    каждого сообщения.
+    """
+    def __init__(self, path):
+        self.connection = sqlite3.connect(path)
+        self.connection.executescript('''
+            CREATE TABLE IF NOT EXISTS users (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                name TEXT NOT NULL UNIQUE,
+                last_login REAL NOT NULL,
+                sent INTEGER NOT NULL DEFAULT 0,
+                received INTEGER NOT NULL DEFAULT 0);
+            CREATE TABLE IF NOT EXISTS login_history (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER NOT NULL REFERENCES users (id),
+                time REAL NOT NULL,
+                address TEXT NOT NULL);
+        ''')
+        self.connection.commit()
+
+    def user_login(self, name, address):
+        """
+        Регистрирует вход пользователя
+        :param name: имя пользователя
+        :param address: IP-адрес пользователя
+        """
+        login_time = time()
+        self.connection.execute(
+            '''INSERT INTO users (name, last_login) VALUES (?, ?)
+               ON CONFLICT (name) DO UPDATE SET last_login = excluded.last_login''',
+            (name, login_time))
+        self.connection.execute(
+            '''INSERT INTO login_history (user_id, time, address)
+               SELECT id, ?, ? FROM users WHERE name = ?''',
+            (login_time, address, name))
+
+    def message_sent(self, sender, recipient):
+        """
+        Учитывает отправленное сообщение в статистике пользователей
+        :param sender: имя отправителя
+        :param recipient: имя получателя
+        """
+        self.connection.execute('UPDATE users SET sent = sent + 1 WHERE name = ?', (sender,))
+        self.connection.execute('UPDATE users SET received = received + 1 WHERE name = ?',
+                                (recipient,))
+
+    def get_history_summary(self):
+        """
+        Возвращает сводку по пользователям
+        :return: список (имя, время последнего входа, отправлено, получено)
+        """
+        cursor = self.connection.execute(
+            'SELECT name, last_login, sent, received FROM users ORDER BY name')
+        return cursor.fetchall()
+
+    def get_login_history(self, name):
+        """
+        Возвращает историю входов пользователя
+        :param name: имя пользователя
+        :return: список (время, адрес)
+        """
+        cursor = self.connection.execute(
+            '''SELECT login_history.time, login_history.address FROM login_history
+               JOIN users ON users.id = login_history.user_id
+               WHERE users.name = ? ORDER BY login_history.id''', (name,))
+        return cursor.fetchall()
+
+    def commit(self):
+        """
+        Записывает накопленные изменения
+        """
+        self.connection.commit()
+
+    def close(self):
+        """
+        Записывает изменения и закрывает соединение с базой данных
+        """
+        self.connection.commit()
+        self.connection.close()
@@ -0,0 +1,226 @@
+"""
+Объединение серверов в кластер.
+Каждый узел принимает подключения других узлов на порту peer_port и сам
+подключается к узлам из настройки peers. После подключения узлы обмениваются
+сообщениями peer_hello со списками своих пользователей и адресами, по
+которым к ним подключаются другие узлы, а затем сообщают
+друг другу о входе и выходе пользователей (peer_presence). Узлы должны быть
+связаны каждый с каждым: сведения о пользователях дальше не передаются.
+Сообщение пользователю другого узла пересылается этому узлу без изменений,
+получивший узел доставляет его своему пользователю или кладёт в почтовый
+ящик, но не пересылает дальше.
+Порт для узлов по умолчанию открыт только на 127.0.0.1. Приветствие
+принимается от узла с общим секретом peer_secret, а если секрет не задан -
+только с адресов узлов из настройки peers. Остальные сообщения узлов
+принимаются только после приветствия.
+Адреса узлов указываются IP-адресами: разрешение имён и подключение
+к узлу не должны блокировать основной цикл сервера, поэтому узел
+подключается неблокирующим сокетом, готовность которого проверяет select.
+"""
+import errno
+import hmac
+import logging
+import log.server_log_config
+from ipaddress import IPv4Address
+from time import time
+from socket import socket, AF_INET, SOCK_STREAM, SOL_SOCKET, SO_ERROR
+from common.utils import send_message, make_frame
+from common.variables import *
+from handlers import register_action, is_valid_message, is_valid_file_chunk, PEER_HANDLERS
+
+server_log = logging.getLogger('server')
+
+
+def parse_peers(peers):
+    """
+    Разбирает список адресов узлов из настроек
+    :param peers: строка вида 127.0.0.1:7801,127.0.0.1:7802
+    :return: список (IP-адрес, порт)
+    """
+    addresses = []
+    for peer in filter(None, (peer.strip() for peer in peers.split(','))):
+        host, _, port = peer.rpartition(':')
+        try:
+            addresses.append((str(IPv4Address(host)), int(port)))
+        except ValueError:
+            server_log.error(f'Неверный адрес узла кластера: {peer}')
+    return addresses
+
+
+def configure_peers(state, peers, secret):
+    """
+    Запоминает узлы, от которых принимаются приветствия
+    :param state: состояние сервера
+    :param peers: строка адресов узлов из настроек
+    :param secret: общий секрет узлов кластера
+    """
+    state.peer_secret = secret
+    state.allowed_peers = {host for host, port in parse_peers(peers)}
+
+
+def is_allowed_peer(state, peer, message):
+    """
+    Проверяет, что приветствие отправлено узлом кластера
+    :param state: состояние сервера
+    :param peer: сокет узла
+    :param message: приветствие
+    :return: True, если узел принят
+    """
+    if state.peer_secret:
+        secret = message.get(SECRET)
+        return isinstance(secret, str) and hmac.compare_digest(
+            secret.encode(ENCODING), state.peer_secret.encode(ENCODING))
+    # К узлам из настроек этот узел подключается сам
+    if peer in state.peer_addresses.values():
+        return True
+    try:
+        return peer.getpeername()[0] in state.allowed_peers
+    except OSError:
+        return False
+
+
+def reject_peer(state, peer, reason):
+    """
+    Отключает узел, не прошедший проверку
+    """
+    server_log.warning(f'Подключение узла отклонено: {reason}')
+    state.remove_peer(peer)
+
+
+def create_hello(state):
+    """
+    Формирует приветствие узла со списком его пользователей
+    """
+    hello = {ACTION: PEER_HELLO, TIME: time(), NODE: state.node_name, USERS: list(state.names)}
+    # По адресу узел, к которому подключились, не будет подключаться в ответ
+    if state.peer_address:
+        hello[ADDRESS] = state.peer_address
+    if state.peer_secret:
+        hello[SECRET] = state.peer_secret
+    return hello
+
+
+def forward_mailbox(state, peer, name):
+    """
+    Пересылает узлу, к которому подключился пользователь, сообщения
+    из его почтового ящика на этом узле
+    :param state: состояние сервера
+    :param peer: сокет узла
+    :param name: имя пользователя
+    """
+    stored = state.mailboxes.take(name)
+    for data in stored:
+        peer.sendall(make_frame(data, COMPRESSION_METHOD))
+    if stored:
+        server_log.info(f'Узлу {state.peer_nodes[peer]} переслано сообщений '
+                        f'пользователю {name}: {len(stored)}')
+
+
+def connect_peers(state, peers):
+    """
+    Начинает подключение к узлам из настроек, с которыми ещё нет соединения.
+    Подключение завершает finish_peer_connect, когда select сообщит
+    о готовности сокета к записи. Не завершённые за PEER_CONNECT_TIMEOUT
+    подключения закрываются.
+    :param state: состояние сервера
+    :param peers: строка адресов узлов из настроек
+    """
+    now = time()
+    for peer, (key, started) in list(state.connecting.items()):
+        if now - started > PEER_CONNECT_TIMEOUT:
+            server_log.debug(f'Не удалось подключиться к узлу {key}: истекло время ожидания')
+            del state.connecting[peer]
+            peer.close()
+    connecting = {key for key, started in state.connecting.values()}
+    for address in parse_peers(peers):
+        key = f'{address[0]}:{address[1]}'
+        if key in state.peer_addresses or key in connecting:
+            continue
+        peer = socket(AF_INET, SOCK_STREAM)
+        peer.setblocking(False)
+        error = peer.connect_ex(address)
+        if error not in (0, errno.EINPROGRESS, errno.EWOULDBLOCK):
+            server_log.debug(f'Не удалось подключиться к узлу {key}: {errno.errorcode.get(error)}')
+            peer.close()
+            continue
+        state.connecting[peer] = (key, now)
+
+
+def finish_peer_connect(state, peer):
+    """
+    Завершает подключение к узлу, сокет которого готов к записи,
+    и отправляет узлу приветствие
+    :param state: состояние сервера
+    :param peer: сокет узла
+    """
+    key, started = state.connecting.pop(peer)
+    try:
+        error = peer.getsockopt(SOL_SOCKET, SO_ERROR)
+        if error:
+            raise OSError(error, errno.errorcode.get(error))
+        peer.setblocking(True)
+        send_message(peer, create_hello(state))
+    except OSError as err:
+        server_log.debug(f'Не удалось подключиться к узлу {key}: {err}')
+        peer.close()
+        return
+    state.peers.append(peer)
+    state.peer_addresses[key] = peer
+
+
+@register_action(PEER_HELLO, (NODE, USERS),
+                 lambda message: isinstance(message[USERS], list), registry=PEER_HANDLERS)
+def handle_peer_hello(message, peer, state):
+    """
+    Приветствие другого узла: запоминает узел и его пользователей,
+    отвечает своим приветствием, если узел подключился сам
+    """
+    if not is_allowed_peer(state, peer, message):
+        reject_peer(state, peer, f'узел {message[NODE]} не указан в настройках '
+                                 f'или передал неверный секрет')
+        return
+    answer = peer not in state.peer_addresses.values()
+    if isinstance(message.get(ADDRESS), str):
+        state.peer_addresses.setdefault(message[ADDRESS], peer)
+    state.link_peer(peer, message[NODE], message[USERS])
+    if answer:
+        send_message(peer, create_hello(state))
+    for name in message[USERS]:
+        forward_mailbox(state, peer, name)
+
+
+@register_action(PEER_PRESENCE, (NODE, EVENT, USER), registry=PEER_HANDLERS)
+def handle_peer_presence(message, peer, state):
+    """
+    Вход или выход пользователя другого узла
+    """
+    if peer not in state.peer_nodes:
+        reject_peer(state, peer, 'сообщение до приветствия')
+        return
+    name = message[USER]
+    if message[EVENT] == LOGIN:
+        state.remote_users[name] = message[NODE]
+        forward_mailbox(state, peer, name)
+    elif state.remote_users.get(name) == message[NODE]:
+        del state.remote_users[name]
+
+
+def deliver_forwarded(message, peer, state):
+    """
+    Сообщение, пересланное другим узлом: ставится в очередь своему
+    пользователю, но не пересылается дальше
+    """
+    if peer not in state.peer_nodes:
+        reject_peer(state, peer, 'сообщение до приветствия')
+        return
+    message[NODE] = state.peer_nodes.get(peer)
+    if message[TO] in state.names:
+        state.messages.append(message)
+    else:
+        state.store_message(message)
+
+
+register_action(MSG, (TIME, FROM, TO, TEXT), is_valid_message,
+                PEER_HANDLERS)(deliver_forwarded)
+register_action(FILE, (TIME, FROM, TO, FILE_ID, FILE_NAME, SEQ, CHUNK, LAST),
+                is_valid_file_chunk, PEER_HANDLERS)(deliver_forwarded)
@@ -0,0 +1,314 @@
+"""
+Консоль администратора сервера на PyQt5.
+Подключается к порту администрирования запущенного сервера,
+показывает подключенных пользователей, сводку из базы данных и
+график числа сообщений в секунду, позволяет отключать пользователей
+и менять ограничения сервера, профилировать работающий сервер.
+Параметры командной строки: server_gui.py [<port>] — порт администрирования.
+"""
+import argparse
+import json
+import sys
+import logging
+import log.server_log_config
+from collections import deque
+from time import ctime, time
+from socket import socket, AF_INET, SOCK_STREAM
+from PyQt5.QtCore import Qt, QTimer, QPointF
+from PyQt5.QtGui import QStandardItemModel, QStandardItem, QPainter, QPolygonF
+from PyQt5.QtWidgets import QApplication, QMainWindow, QWidget, QTableView, QTabWidget, \
+    QPushButton, QSpinBox, QLabel, QHBoxLayout, QVBoxLayout, QMessageBox, QAbstractItemView, \
+    QPlainTextEdit
+from common.utils import send_message, get_message
+from common.variables import *
+from errors import NotDictError
+
+server_log = logging.getLogger('server')
+
+# Число точек на графике
+RATE_CHART_POINTS = 120
+
+
+class AdminConnection:
+    """
+    Подключение к порту администрирования сервера
+    """
+    def __init__(self, port=ADMIN_PORT):
+        self.socket = socket(AF_INET, SOCK_STREAM)
+        self.socket.settimeout(TIMEOUT * 4)
+        self.socket.connect((ADMIN_ADDRESS, port))
+
+    def request(self, message):
+        """
+        Отправляет команду серверу и возвращает ответ
+        :param message: команда в виде словаря
+        :return: ответ сервера
+        """
+        send_message(self.socket, message)
+        return get_message(self.socket, max_size=ADMIN_MESSAGE_SIZE)
+
+    def close(self):
+        self.socket.close()
+
+
+class RateChart(QWidget):
+    """
+    График числа сообщений в секунду за последние RATE_CHART_POINTS обновлений
+    """
+    def __init__(self):
+        super().__init__()
+        self.points = deque(maxlen=RATE_CHART_POINTS)
+        self.setMinimumHeight(150)
+
+    def add_point(self, value):
+        self.points.append(value)
+        self.update()
+
+    def paintEvent(self, event):
+        painter = QPainter(self)
+        painter.fillRect(self.rect(), Qt.white)
+        if not self.points:
+            return
+        maximum = max(max(self.points), 1)
+        step = self.width() / max(RATE_CHART_POINTS - 1, 1)
+        height = self.height() - 20
+        polygon = QPolygonF([QPointF(number * step, 10 + height * (1 - value / maximum))
+                             for number, value in enumerate(self.points)])
+        painter.setPen(Qt.blue)
+        painter.drawPolyline(polygon)
+        painter.setPen(Qt.black)
+        painter.drawText(5, 15, f'{self.points[-1]:.1f} сообщ./с (максимум {maximum:.1f})')
+
+
+class AdminMainWindow(QMainWindow):
+    """
+    Главное окно консоли администратора. Состояние сервера обновляется
+    по таймеру: сервер присылает только события после известной версии.
+    """
+    def __init__(self, connection):
+        super().__init__()
+        self.connection = connection
+        self.version = 0
+        self.last_count = None
+        self.last_update = time()
+        # Строки таблицы пользователей: {имя: первая ячейка строки}
+        self.user_items = {}
+
+        self.setWindowTitle('Администрирование сервера')
+        self.resize(800, 600)
+
+        self.users_model = QStandardItemModel(0, 3)
+        self.users_model.setHorizontalHeaderLabels(['Пользователь', 'IP-адрес', 'Время входа'])
+        self.users_view = QTableView()
+        self.users_view.setModel(self.users_model)
+        self.users_view.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.users_view.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.kick_button = QPushButton('Отключить пользователя')
+        self.kick_button.clicked.connect(self.kick_user)
+        self.users_count = QLabel()
+        users_layout = QVBoxLayout()
+        users_layout.addWidget(self.users_view)
+        users_buttons = QHBoxLayout()
+        users_buttons.addWidget(self.users_count)
+        users_buttons.addStretch()
+        users_buttons.addWidget(self.kick_button)
+        users_layout.addLayout(users_buttons)
+        users_tab = QWidget()
+        users_tab.setLayout(users_layout)
+
+        self.history_model = QStandardItemModel(0, 4)
+        self.history_model.setHorizontalHeaderLabels(
+            ['Пользователь', 'Последний вход', 'Отправлено', 'Получено'])
+        self.history_view = QTableView()
+        self.history_view.setModel(self.history_model)
+        self.history_view.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.history_button = QPushButton('Обновить')
+        self.history_button.clicked.connect(self.update_history)
+        history_layout = QVBoxLayout()
+        history_layout.addWidget(self.history_view)
+        history_layout.addWidget(self.history_button)
+        history_tab = QWidget()
+        history_tab.setLayout(history_layout)
+
+        self.rate_chart = RateChart()
+        self.max_clients = QSpinBox()
+        self.max_clients.setRange(1, 1000000)
+        self.limits_button = QPushButton('Применить')
+        self.limits_button.clicked.connect(self.set_limits)
+        limits_layout = QHBoxLayout()
+        limits_layout.addWidget(QLabel('Наибольшее число клиентов:'))
+        limits_layout.addWidget(self.max_clients)
+        limits_layout.addWidget(self.limits_button)
+        limits_layout.addStretch()
+        self.profile_duration = QSpinBox()
+        self.profile_duration.setRange(1, 3600)
+        self.profile_duration.setValue(PROFILE_DURATION)
+        self.profile_button = QPushButton('Профилировать')
+        self.profile_button.clicked.connect(self.start_profile)
+        self.report_button = QPushButton('Отчёт')
+        self.report_button.clicked.connect(self.show_profile_report)
+        profile_layout = QHBoxLayout()
+        profile_layout.addWidget(QLabel('Профилирование, с:'))
+        profile_layout.addWidget(self.profile_duration)
+        profile_layout.addWidget(self.profile_button)
+        profile_layout.addWidget(self.report_button)
+        profile_layout.addStretch()
+        self.profile_report = QPlainTextEdit()
+        self.profile_report.setReadOnly(True)
+        stats_layout = QVBoxLayout()
+        stats_layout.addWidget(self.rate_chart)
+        stats_layout.addLayout(limits_layout)
+        stats_layout.addLayout(profile_layout)
+        stats_layout.addWidget(self.profile_report)
+        stats_tab = QWidget()
+        stats_tab.setLayout(stats_layout)
+
+        tabs = QTabWidget()
+        tabs.addTab(users_tab, 'Пользователи')
+        tabs.addTab(history_tab, 'История')
+        tabs.addTab(stats_tab, 'Статистика')
+        self.setCentralWidget(tabs)
+
+        self.timer = QTimer()
+        self.timer.timeout.connect(self.update_state)
+        self.timer.start(ADMIN_UPDATE_INTERVAL)
+        self.update_state(first=True)
+
+    def request(self, message):
+        """
+        Выполняет команду, при потере соединения закрывает консоль
+        :return: ответ сервера или None
+        """
+        try:
+            return self.connection.request(message)
+        except (OSError, ValueError, NotDictError, json.JSONDecodeError) as err:
+            self.timer.stop()
+            server_log.error(f'Потеряно соединение с сервером: {err}')
+            QMessageBox.critical(self, 'Ошибка', 'Потеряно соединение с сервером.')
+            self.close()
+            return None
+
+    def add_user(self, user):
+        """
+        Добавляет пользователя в таблицу или обновляет его строку
+        """
+        self.remove_user(user[USER])
+        row = [QStandardItem(user[USER]), QStandardItem(user[ADDRESS]),
+               QStandardItem(ctime(user[TIME]))]
+        self.users_model.appendRow(row)
+        self.user_items[user[USER]] = row[0]
+
+    def remove_user(self, name):
+        item = self.user_items.pop(name, None)
+        if item is not None:
+            self.users_model.removeRow(item.row())
+
+    def update_state(self, first=False):
+        """
+        Запрашивает изменения состояния сервера и применяет их к таблице
+        """
+        response = self.request({ACTION: GET_STATE, SINCE: self.version})
+        if response is None or response.get(RESPONSE) != 200:
+            return
+        if USERS in response:
+            self.users_model.removeRows(0, self.users_model.rowCount())
+            self.user_items.clear()
+            for user in response[USERS]:
+                self.add_user(user)
+        for event in response.get(EVENTS, []):
+            if event[EVENT] == LOGIN:
+                self.add_user(event)
+            elif event[EVENT] == LOGOUT:
+                self.remove_user(event[USER])
+        self.version = response[VERSION]
+        self.users_count.setText(f'Подключено: {len(self.user_items)}')
+
+        now = time()
+        if self.last_count is not None:
+            self.rate_chart.add_point((response[MESSAGE_COUNT] - self.last_count)
+                                      / max(now - self.last_update, 0.001))
+        self.last_count = response[MESSAGE_COUNT]
+        self.last_update = now
+        if first:
+            self.max_clients.setValue(response[LIMITS]['max_clients'])
+
+    def update_history(self):
+        """
+        Загружает сводку по пользователям из базы данных сервера
+        """
+        response = self.request({ACTION: GET_HISTORY})
+        if response is None:
+            return
+        self.history_model.removeRows(0, self.history_model.rowCount())
+        for name, last_login, sent, received in response[HISTORY]:
+            self.history_model.appendRow([QStandardItem(name), QStandardItem(ctime(last_login)),
+                                          QStandardItem(str(sent)), QStandardItem(str(received))])
+
+    def kick_user(self):
+        index = self.users_view.currentIndex()
+        if not index.isValid():
+            return
+        name = self.users_model.item(index.row(), 0).text()
+        response = self.request({ACTION: KICK, USER: name})
+        if response and response[RESPONSE] != 200:
+            QMessageBox.warning(self, 'Ошибка', response[ERROR])
+
+    def set_limits(self):
+        response = self.request({ACTION: SET_LIMITS,
+                                 LIMITS: {'max_clients': self.max_clients.value()}})
+        if response and response[RESPONSE] != 200:
+            QMessageBox.warning(self, 'Ошибка', response[ERROR])
+
+    def start_profile(self):
+        response = self.request({ACTION: PROFILE_START, DURATION: self.profile_duration.value()})
+        if response and response[RESPONSE] != 200:
+            QMessageBox.warning(self, 'Ошибка', response[ERROR])
+
+    def show_profile_report(self):
+        """
+        Показывает функции с наибольшим временем работы и прирост памяти
+        по результатам последнего профилирования
+        """
+        response = self.request({ACTION: PROFILE_REPORT})
+        if response is None:
+            return
+        report = response[REPORT]
+        if report is None:
+            self.profile_report.setPlainText('Профилирование идёт' if response[ACTIVE]
+                                             else 'Профилирование не выполнялось')
+            return
+        lines = [f'Файл: {report["file"]}', '', 'Вызовов   Собств., с   Всего, с   Функция']
+        lines += [f'{function["calls"]:>7}   {function["total"]:>10.4f}   '
+                  f'{function["cumulative"]:>8.4f}   {function["function"]}'
+                  for function in report['functions']]
+        lines += ['', 'Прирост памяти:']
+        lines += [f'{stat["size_diff"]:+} байт  {stat["line"]}' for stat in report['memory']]
+        self.profile_report.setPlainText('\n'.join(lines))
+
+    def closeEvent(self, event):
+        self.timer.stop()
+        self.connection.close()
+        super().closeEvent(event)
+
+
+def run_server_gui():
+    """
+    Основная функция для запуска консоли администратора
+    """
+    args = argparse.ArgumentParser(description='Консоль администратора сервера')
+    args.add_argument('port', type=int, default=ADMIN_PORT, nargs='?',
+                      help='Порт администрирования сервера')
+    namespace = args.parse_args(sys.argv[1:])
+    app = QApplication(sys.argv)
+    try:
+        connection = AdminConnection(namespace.port)
+    except OSError:
+        QMessageBox.critical(None, 'Ошибка', 'Не удалось подключиться к серверу.')
+        sys.exit(1)
+    window = AdminMainWindow(connection)
+    window.show()
+    sys.exit(app.exec_())
+
+
+if __name__ == '__main__':
+    run_server_gui()
@@ -0,0 +1,218 @@
+"""
+Почтовые ящики пользователей, не подключенных к серверу.
+Сообщение хранится в виде закодированного JSON вместе со временем
+истечения срока хранения, поэтому занимает в памяти немногим больше
+своего размера и отправляется получателю без повторного кодирования.
+Когда объём сообщений в памяти превышает ограничение, самые большие
+ящики переносятся в файлы каталога MAILBOX_DIR. Общий объём сообщений
+в памяти и в файлах ограничен, поэтому сообщения произвольным
+получателям не могут занять весь диск. Файл начинается со
+строки с именем пользователя, далее по строке на сообщение:
+<время истечения> <JSON>.
+"""
+import json
+import os
+import logging
+import log.server_log_config
+from collections import deque
+from hashlib import sha1
+from time import time
+from common.variables import *
+
+server_log = logging.getLogger('server')
+
+MAILBOX_SUFFIX = '.box'
+
+
+class MailboxEntry:
+    """
+    Сообщение в почтовом ящике
+    """
+    __slots__ = ('expires', 'data')
+
+    def __init__(self, expires, data):
+        self.expires = expires
+        self.data = data
+
+
+class Mailboxes:
+    """
+    Почтовые ящики всех пользователей с ограничением числа и объёма
+    сообщений каждого пользователя, общего объёма сообщений
+    и сроком хранения сообщений
+    """
+    def __init__(self, directory=MAILBOX_DIR, ttl=MAILBOX_TTL, max_messages=MAILBOX_MESSAGES,
+                 max_bytes=MAILBOX_BYTES, memory_limit=MAILBOX_MEMORY,
+                 total_limit=MAILBOX_TOTAL_BYTES):
+        self.directory = directory
+        self.ttl = ttl
+        self.max_messages = max_messages
+        self.max_bytes = max_bytes
+        self.memory_limit = memory_limit
+        self.total_limit = total_limit
+        # Сообщения в памяти: {имя: deque(MailboxEntry)}
+        self.boxes = {}
+        # Объём сообщений в памяти: {имя: байты}
+        self.sizes = {}
+        # Сообщения в файлах: {имя: [число, объём, наибольшее время истечения]}
+        self.spilled = {}
+        self.memory = 0
+        # Объём сообщений в файлах
+        self.disk = 0
+
+    def __len__(self):
+        return (sum(len(box) for box in self.boxes.values())
+                + sum(info[0] for info in self.spilled.values()))
+
+    def get_path(self, name):
+        # Имя пользователя может содержать любые символы
+        digest = sha1(json.dumps(name).encode(ENCODING)).hexdigest()
+        return os.path.join(self.directory, digest + MAILBOX_SUFFIX)
+
+    def put(self, name, message, data=None):
+        """
+        Кладёт сообщение в почтовый ящик пользователя
+        :param name: имя получателя
+        :param message: сообщение в виде словаря
+        :param data: сообщение, уже закодированное в JSON-байты
+        :return: False, если ящик или все ящики вместе переполнены
+        """
+        if data is None:
+            data = json.dumps(message).encode(ENCODING)
+        if self.memory + self.disk + len(data) > self.total_limit:
+            return False
+        box = self.boxes.get(name)
+        count = len(box) if box else 0
+        size = self.sizes.get(name, 0)
+        if name in self.spilled:
+            count += self.spilled[name][0]
+            size += self.spilled[name][1]
+        if count >= self.max_messages or size + len(data) > self.max_bytes:
+            return False
+
+        if box is None:
+            box = self.boxes[name] = deque()
+        box.append(MailboxEntry(time() + self.ttl, data))
+        self.sizes[name] = self.sizes.get(name, 0) + len(data)
+        self.memory += len(data)
+        if self.memory > self.memory_limit:
+            self.spill(self.memory_limit // 2)
+        return True
+
+    def take(self, name):
+        """
+        Забирает все сообщения пользователя с неистекшим сроком хранения
+        :param name: имя пользователя
+        :return: список сообщений в виде JSON-байтов в порядке поступления
+        """
+        now = time()
+        messages = []
+        # В файле находятся более ранние сообщения, чем в памяти
+        info = self.spilled.pop(name, None)
+        if info is not None:
+            self.disk -= info[1]
+            path = self.get_path(name)
+            try:
+                with open(path, 'rb') as file:
+                    file.readline()
+                    for line in file:
+                        expires, data = line.rstrip(b'\n').split(b' ', 1)
+                        if float(expires) > now:
+                            messages.append(data)
+                os.remove(path)
+            except (OSError, ValueError) as err:
+                server_log.error(f'Не удалось прочитать почтовый ящик {name}: {err}')
+        box = self.boxes.pop(name, None)
+        if box:
+            self.memory -= self.sizes.pop(name)
+            messages.extend(entry.data for entry in box if entry.expires > now)
+        return messages
+
+    def expire(self):
+        """
+        Удаляет сообщения с истекшим сроком хранения. Файл удаляется,
+        когда истёк срок хранения всех его сообщений.
+        """
+        now = time()
+        for name in list(self.boxes):
+            box = self.boxes[name]
+            while box and box[0].expires <= now:
+                size = len(box.popleft().data)
+                self.sizes[name] -= size
+                self.memory -= size
+            if not box:
+                del self.boxes[name]
+                del self.sizes[name]
+        for name, (count, size, expires) in list(self.spilled.items()):
+            if expires <= now:
+                del self.spilled[name]
+                self.disk -= size
+                try:
+                    os.remove(self.get_path(name))
+                except OSError:
+                    pass
+
+    def spill(self, target):
+        """
+        Переносит в файлы самые большие ящики, пока объём сообщений
+        в памяти не станет меньше target
+        """
+        for name in sorted(self.boxes, key=self.sizes.get, reverse=True):
+            if self.memory <= target:
+                break
+            self.spill_box(name)
+        server_log.info(f'Почтовые ящики перенесены на диск, в памяти {self.memory} байт.')
+
+    def spill_box(self, name):
+        """
+        Дописывает сообщения ящика из памяти в его файл
+        :param name: имя пользователя
+        """
+        box = self.boxes.pop(name)
+        size = self.sizes.pop(name)
+        self.memory -= size
+        os.makedirs(self.directory, exist_ok=True)
+        with open(self.get_path(name), 'ab' if name in self.spilled else 'wb') as file:
+            if name not in self.spilled:
+                file.write(json.dumps(name).encode(ENCODING) + b'\n')
+            file.writelines(b'%.3f ' % entry.expires + entry.data + b'\n' for entry in box)
+        info = self.spilled.setdefault(name, [0, 0, 0])
+        info[0] += len(box)
+        info[1] += size
+        info[2] = max(info[2], box[-1].expires)
+        self.disk += size
+
+    def spill_all(self):
+        """
+        Переносит все ящики в файлы, чтобы сообщения сохранились
+        после остановки или перезапуска сервера
+        """
+        for name in list(self.boxes):
+            self.spill_box(name)
+
+    def load(self):
+        """
+        Находит ящики, сохранённые в файлы прежним процессом сервера
+        """
+        if not os.path.isdir(self.directory):
+            return
+        for file_name in os.listdir(self.directory):
+            if not file_name.endswith(MAILBOX_SUFFIX):
+                continue
+            try:
+                with open(os.path.join(self.directory, file_name), 'rb') as file:
+                    name = json.loads(file.readline())
+                    info = [0, 0, 0]
+                    for line in file:
+                        expires, data = line.rstrip(b'\n').split(b' ', 1)
+                        info[0] += 1
+                        info[1] += len(data)
+                        info[2] = max(info[2], float(expires))
+            except (OSError, ValueError) as err:
+                server_log.error(f'Не удалось прочитать почтовый ящик {file_name}: {err}')
+                continue
+            self.spilled[name] = info
+            self.disk += info[1]
+        if self.spilled:
+            server_log.info(f'Загружено почтовых ящиков: {len(self.spilled)}, '
+                            f'сообщений: {len(self)}.')
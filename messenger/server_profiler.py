@@ -0,0 +1,142 @@
+"""
+Профилирование работающего сервера.
+Профилирование включается командой консоли администратора или
+сигналом SIGUSR1 на заданное время. cProfile замеряет время работы
+функций основного цикла, tracemalloc - прирост памяти по строкам кода.
+Результаты сохраняются в каталог PROFILE_DIR: файл .prof для pstats
+и текстовый отчёт .txt.
+"""
+import cProfile
+import io
+import os
+import pstats
+import tracemalloc
+import logging
+import log.server_log_config
+from time import time, strftime
+from common.variables import *
+
+server_log = logging.getLogger('server')
+
+# Функции, которые всегда попадают в отчёт: (файл, имя функции)
+WATCHED_FUNCTIONS = (
+    ('server.py', 'create_response'),
+    ('utils.py', 'get_message'),
+    ('utils.py', 'send_message'),
+    ('utils.py', 'get_frame'),
+    ('decos.py', 'wrapper'),
+)
+
+
+class ServerProfiler:
+    """
+    Профилирование основного цикла сервера на заданное время
+    """
+    def __init__(self, directory=PROFILE_DIR, top=PROFILE_TOP):
+        self.directory = directory
+        self.top = top
+        self.profile = None
+        self.snapshot = None
+        self.deadline = None
+        # Отчёт о последнем завершенном профилировании
+        self.report = None
+
+    @property
+    def active(self):
+        return self.profile is not None
+
+    def start(self, duration=PROFILE_DURATION):
+        """
+        Включает профилирование. Профилируется поток, вызвавший start,
+        поэтому метод вызывается из основного цикла сервера.
+        :param duration: длительность профилирования, с
+        :return: False, если профилирование уже идёт
+        """
+        if self.active:
+            return False
+        started_tracemalloc = not tracemalloc.is_tracing()
+        if started_tracemalloc:
+            tracemalloc.start()
+        self.snapshot = (tracemalloc.take_snapshot(), started_tracemalloc)
+        self.deadline = time() + duration
+        self.profile = cProfile.Profile()
+        self.profile.enable()
+        server_log.info(f'Профилирование включено на {duration} с.')
+        return True
+
+    def check(self):
+        """
+        Завершает профилирование по истечении времени.
+        Вызывается на каждой итерации основного цикла.
+        """
+        if self.active and time() >= self.deadline:
+            self.stop()
+
+    def stop(self):
+        """
+        Завершает профилирование и сохраняет результаты
+        :return: отчёт или None, если профилирование не было включено
+        """
+        if not self.active:
+            return None
+        self.profile.disable()
+        first_snapshot, started_tracemalloc = self.snapshot
+        memory = tracemalloc.take_snapshot().compare_to(first_snapshot, 'lineno')
+        if started_tracemalloc:
+            tracemalloc.stop()
+
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, f'profile_{strftime("%Y%m%d_%H%M%S")}')
+        self.profile.dump_stats(path + '.prof')
+        stats = pstats.Stats(self.profile)
+        self.report = {
+            'file': path + '.prof',
+            'functions': self.get_functions(stats),
+            'memory': [{'line': str(stat.traceback[0]), 'size_diff': stat.size_diff,
+                        'count_diff': stat.count_diff} for stat in memory[:self.top]]
+        }
+        with open(path + '.txt', 'w', encoding=ENCODING) as file:
+            file.write(self.format_report(stats))
+        self.profile = None
+        self.snapshot = None
+        server_log.info(f'Профилирование завершено, результаты сохранены в {path}.txt')
+        return self.report
+
+    def get_functions(self, stats):
+        """
+        Выбирает из статистики функции с наибольшим суммарным временем
+        и наблюдаемые функции обработки сообщений
+        :param stats: статистика pstats
+        :return: список {функция, число вызовов, собственное и суммарное время}
+        """
+        functions = []
+        by_time = sorted(stats.stats.items(), key=lambda item: item[1][3], reverse=True)
+        for number, ((file_name, line, name), (_, calls, total, cumulative, _)) \
+                in enumerate(by_time):
+            watched = (os.path.basename(file_name), name) in WATCHED_FUNCTIONS
+            if number >= self.top and not watched:
+                continue
+            functions.append({'function': f'{os.path.basename(file_name)}:{line}({name})',
+                              'calls': calls, 'total': round(total, 6),
+                              'cumulative': round(cumulative, 6)})
+        return functions
+
+    def format_report(self, stats):
+        """
+        Формирует текстовый отчёт о профилировании
+        :param stats: статистика pstats
+        :return:
+        """
+        output = io.StringIO()
+        stats.stream = output
+        stats.sort_stats('cumulative').print_stats(self.top)
+        output.write('Наблюдаемые функции:\n')
+        for function in self.report['functions']:
+            if any(name in function['function'] for _, name in WATCHED_FUNCTIONS):
+                output.write(f'{function["function"]}: вызовов {function["calls"]}, '
+                             f'{function["cumulative"]} с\n')
+        output.write('\nПрирост памяти по строкам кода:\n')
+        for stat in self.report['memory']:
+            output.write(f'{stat["line"]}: {stat["size_diff"]:+} байт, '
+                         f'{stat["count_diff"]:+} блоков\n')
+        return output.getvalue()
@@ -0,0 +1,359 @@
+"""
+Состояние работающего сервера
+"""
+import logging
+import log.server_log_config
+from collections import deque
+from time import time
+from common.utils import encode_message, make_frame
+from common.variables import *
+from server_mailbox import Mailboxes
+from server_profiler import ServerProfiler
+
+server_log = logging.getLogger('server')
+
+
+class ServerState:
+    """
+    Подключенные клиенты, очередь сообщений и журнал изменений для
+    консоли администратора. Консоль запрашивает изменения после
+    известной ей версии состояния, а не всё состояние целиком.
+    """
+    def __init__(self, database=None, max_clients=MAX_CLIENTS,
+                 max_queue=MAX_QUEUED_MESSAGES, max_message_rate=MAX_MESSAGE_RATE,
+                 max_recipient_queue=MAX_RECIPIENT_QUEUE, stall_timeout=STALL_TIMEOUT):
+        self.clients = []
+        self.messages = []
+        # Клиенты, согласовавшие сжатие сообщений
+        self.compressed_clients = set()
+        # Пользователи, приславшие presence-сообщение: {имя: сокет}
+        self.names = {}
+        self.client_names = {}
+        # Сведения о пользователях: {имя: {адрес, время входа}}
+        self.users = {}
+        # Подключения консолей администратора
+        self.admins = []
+        self.database = database
+        self.limits = {'max_clients': max_clients,
+                       'max_queue': max_queue,
+                       'max_message_rate': max_message_rate,
+                       'max_recipient_queue': max_recipient_queue,
+                       'stall_timeout': stall_timeout}
+        # Получатели, не готовые к приёму сообщений: {сокет: с какого времени}
+        self.stalled = {}
+        # Число сообщений клиентов за текущую секунду: {сокет: [секунда, число]}
+        self.rates = {}
+        self.message_count = 0
+        self.version = 0
+        self.events = deque(maxlen=ADMIN_EVENTS_LIMIT)
+        # Запрошенная сигналом остановка или перезапуск сервера
+        self.stop_request = None
+        # Запрошенное сигналом чтение настроек
+        self.reload_request = False
+        # Запрошенное сигналом включение или выключение профилирования
+        self.profile_request = False
+        self.profiler = ServerProfiler()
+        # Сообщения пользователям, не подключенным к серверу
+        self.mailboxes = Mailboxes()
+        # Кластер: имя этого узла, подключения других узлов,
+        # {сокет: имя узла} и {имя узла: сокет}
+        self.node_name = ''
+        self.peers = []
+        self.peer_nodes = {}
+        self.node_links = {}
+        # Адрес для подключения к этому узлу и адреса узлов,
+        # с которыми уже есть соединение: {адрес: сокет}
+        self.peer_address = ''
+        self.peer_addresses = {}
+        # Начатые подключения к узлам: {сокет: (адрес, время начала)}
+        self.connecting = {}
+        # Узлы, от которых принимаются приветствия: IP-адреса узлов
+        # из настроек и общий секрет
+        self.allowed_peers = set()
+        self.peer_secret = ''
+        # Пользователи, подключенные к другим узлам: {имя: имя узла}
+        self.remote_users = {}
+
+    def add_event(self, event, **fields):
+        """
+        Добавляет событие в журнал изменений и увеличивает версию состояния
+        :param event: тип события
+        :param fields: поля события
+        """
+        self.version += 1
+        fields[EVENT] = event
+        self.events.append((self.version, fields))
+
+    def get_changes(self, since):
+        """
+        Возвращает события после указанной версии состояния
+        :param since: версия, известная консоли администратора
+        :return: список событий или None, если часть событий уже удалена
+        из журнала и консоли нужен полный список пользователей
+        """
+        if since >= self.version:
+            return []
+        if not self.events or self.events[0][0] > since + 1:
+            return None
+        return [event for version, event in self.events if version > since]
+
+    def get_users(self):
+        """
+        Возвращает список подключенных пользователей
+        :return:
+        """
+        return [{USER: name, ADDRESS: info[ADDRESS], TIME: info[TIME]}
+                for name, info in self.users.items()]
+
+    def can_accept(self):
+        """
+        Проверяет, не достигнуто ли наибольшее число клиентов
+        :return:
+        """
+        return len(self.clients) < self.limits['max_clients']
+
+    def can_queue(self, client):
+        """
+        Проверяет, можно ли поставить сообщение клиента в очередь:
+        не превышено число сообщений клиента в секунду и длина очереди
+        :param client: сокет пользователя
+        :return: None или текст ошибки
+        """
+        if len(self.messages) >= self.limits['max_queue']:
+            return 'Сервер перегружен, повторите позже'
+        max_rate = self.limits['max_message_rate']
+        if not max_rate:
+            return None
+        second = int(time())
+        rate = self.rates.get(client)
+        if rate is None or rate[0] != second:
+            self.rates[client] = [second, 1]
+            return None
+        rate[1] += 1
+        if rate[1] > max_rate:
+            return 'Превышено число сообщений в секунду'
+        return None
+
+    def login(self, name, client):
+        """
+        Запоминает имя пользователя, подключенного через сокет
+        :param name: имя пользователя
+        :param client: сокет пользователя
+        """
+        try:
+            address = client.getpeername()[0]
+        except (OSError, AttributeError):
+            address = ''
+        self.names[name] = client
+        self.client_names[client] = name
+        self.users[name] = {ADDRESS: address, TIME: time()}
+        self.add_event(LOGIN, **{USER: name, ADDRESS: address, TIME: self.users[name][TIME]})
+        self.notify_peers(LOGIN, name)
+        if self.database:
+            self.database.user_login(name, address)
+
+    def restore_client(self, client, name=None, compressed=False):
+        """
+        Добавляет клиента, переданного прежним процессом сервера при перезапуске
+        :param client: сокет пользователя
+        :param name: имя пользователя или None, если клиент не представился
+        :param compressed: клиент согласовал сжатие сообщений
+        """
+        self.clients.append(client)
+        if compressed:
+            self.compressed_clients.add(client)
+        if name is not None:
+            self.names[name] = client
+            self.client_names[client] = name
+            try:
+                address = client.getpeername()[0]
+            except OSError:
+                address = ''
+            self.users[name] = {ADDRESS: address, TIME: time()}
+            self.add_event(LOGIN, **{USER: name, ADDRESS: address, TIME: self.users[name][TIME]})
+
+    def get_name(self, client):
+        """
+        Возвращает имя пользователя по сокету
+        :param client: сокет пользователя
+        :return: имя или None, если клиент не представился
+        """
+        return self.client_names.get(client)
+
+    def message_sent(self, message):
+        """
+        Учитывает принятое сообщение в статистике
+        :param message: сообщение в виде словаря
+        """
+        self.message_count += 1
+        if self.database:
+            self.database.message_sent(message[FROM], message[TO])
+
+    def is_connected(self, sock):
+        """
+        Проверяет, что сокет - подключение клиента или другого узла
+        """
+        return sock in self.peer_nodes or sock in self.clients
+
+    def get_compression(self, sock):
+        """
+        Возвращает метод сжатия сообщений для клиента или узла
+        :param sock: сокет получателя
+        :return: метод сжатия или None
+        """
+        # Узлы кластера всегда поддерживают сжатие
+        if sock in self.compressed_clients or sock in self.peer_nodes:
+            return COMPRESSION_METHOD
+        return None
+
+    def link_peer(self, peer, node, users):
+        """
+        Запоминает узел кластера и подключенных к нему пользователей
+        :param peer: сокет узла
+        :param node: имя узла
+        :param users: имена пользователей узла
+        """
+        self.peer_nodes[peer] = node
+        self.node_links[node] = peer
+        for name in users:
+            self.remote_users[name] = node
+        server_log.info(f'Подключен узел {node}, пользователей: {len(users)}.')
+
+    def notify_peers(self, event, name):
+        """
+        Сообщает другим узлам о входе или выходе пользователя
+        :param event: LOGIN или LOGOUT
+        :param name: имя пользователя
+        """
+        if not self.peer_nodes:
+            return
+        # Уведомление кодируется один раз для всех узлов
+        frame = make_frame(encode_message({ACTION: PEER_PRESENCE, TIME: time(),
+                                           NODE: self.node_name, EVENT: event, USER: name}))
+        for peer in list(self.peer_nodes):
+            try:
+                peer.sendall(frame)
+            except OSError:
+                self.remove_peer(peer)
+
+    def remove_peer(self, peer):
+        """
+        Закрывает соединение с узлом и забывает его пользователей
+        :param peer: сокет узла
+        """
+        peer.close()
+        self.stalled.pop(peer, None)
+        if peer in self.peers:
+            self.peers.remove(peer)
+        for address, linked in list(self.peer_addresses.items()):
+            if linked is peer:
+                del self.peer_addresses[address]
+        node = self.peer_nodes.pop(peer, None)
+        if node is None:
+            return
+        # Узел мог быть подключен повторно
+        if self.node_links.get(node) is peer:
+            del self.node_links[node]
+            for name in [name for name, user_node in self.remote_users.items()
+                         if user_node == node]:
+                del self.remote_users[name]
+        server_log.info(f'Узел {node} отключен.')
+
+    def store_message(self, message, data=None):
+        """
+        Кладёт сообщение в почтовый ящик получателя
+        :param message: сообщение в виде словаря
+        :param data: сообщение, уже закодированное в JSON-байты
+        :return: False, если ящик получателя переполнен
+        """
+        if self.mailboxes.put(message[TO], message, data):
+            return True
+        server_log.warning(f'Почтовый ящик {message[TO]} переполнен, сообщение отброшено.')
+        return False
+
+    def get_recipient(self, message):
+        """
+        Возвращает сокет, через который сообщение доставляется получателю
+        :param message: сообщение в виде словаря
+        :return: сокет получателя или узла кластера, None - получатель не подключен
+        """
+        recipient = self.names.get(message[TO])
+        # Сообщения от других узлов дальше не пересылаются
+        if recipient is None and NODE not in message and message[TO] in self.remote_users:
+            recipient = self.node_links.get(self.remote_users[message[TO]])
+        return recipient
+
+    def drop_stalled(self, writable):
+        """
+        Отключает получателей, которые слишком долго не принимают сообщения
+        или у которых накопилось слишком много сообщений в очереди,
+        чтобы они не занимали общую очередь. Их сообщения остаются
+        в очереди и переносятся в почтовые ящики.
+        :param writable: множество сокетов, готовых к записи
+        """
+        backlog = {}
+        for message in self.messages:
+            recipient = self.get_recipient(message)
+            if recipient is not None and recipient not in writable:
+                backlog[recipient] = backlog.get(recipient, 0) + 1
+        now = time()
+        for recipient in list(self.stalled):
+            if recipient not in backlog:
+                del self.stalled[recipient]
+        for recipient, count in backlog.items():
+            since = self.stalled.setdefault(recipient, now)
+            if (count <= self.limits['max_recipient_queue']
+                    and now - since <= self.limits['stall_timeout']):
+                continue
+            server_log.warning(f'Получатель {self.get_name(recipient) or recipient} '
+                               f'не принимает сообщения, в очереди {count}, отключен.')
+            if recipient in self.peer_nodes:
+                self.remove_peer(recipient)
+            else:
+                self.remove_client(recipient)
+
+    def route_messages(self, writable):
+        """
+        Разбирает очередь сообщений: сообщения отключившимся пользователям
+        переносит в почтовые ящики, сообщения получателям, готовым к приёму,
+        и узлам, к которым подключены получатели, возвращает для отправки,
+        остальные оставляет в очереди.
+        Порядок сообщений каждому получателю сохраняется.
+        :param writable: множество сокетов, готовых к записи
+        :return: [(сокет получателя, сообщение)]
+        """
+        self.drop_stalled(writable)
+        ready = []
+        waiting = []
+        blocked = set()
+        for message in self.messages:
+            recipient = self.get_recipient(message)
+            if recipient is None:
+                self.store_message(message)
+            elif recipient in blocked or recipient not in writable:
+                blocked.add(recipient)
+                waiting.append(message)
+            else:
+                ready.append((recipient, message))
+        self.messages[:] = waiting
+        return ready
+
+    def remove_client(self, client):
+        """
+        Закрывает соединение с клиентом и удаляет его из всех списков
+        :param client: сокет пользователя
+        """
+        name = self.client_names.pop(client, None)
+        client.close()
+        if client in self.clients:
+            self.clients.remove(client)
+        self.compressed_clients.discard(client)
+        self.rates.pop(client, None)
+        self.stalled.pop(client, None)
+        # Имя могло быть занято новым подключением того же пользователя
+        if name is not None and self.names.get(name) is client:
+            del self.names[name]
+            del self.users[name]
+            self.add_event(LOGOUT, **{USER: name})
+            self.notify_peers(LOGOUT, name)
+        server_log.info(f'Клиент {name or client} отключился от сервера.')
@@ -0,0 +1,509 @@
+"""
+Нагрузочное и fuzz-тестирование сервера.
+Запускает сервер в отдельном процессе и в течение заданного времени
+подключает к нему клиентов, которые отправляют корректные и искаженные
+JIM-сообщения, разбитые на части в случайных местах, и отключаются
+как положено или обрывая соединение. Медленные клиенты подолгу держат
+отправленным только начало сообщения. Молчащие клиенты получают поток
+сообщений, но никогда их не читают: сервер должен отключать их, не
+задерживая остальных. Одновременно пара клиентов
+замеряет скорость обмена сообщениями и время доставки каждого сообщения.
+После завершения проверяется, что сервер работает, не осталось
+соединений клиентов, память не выросла сверх ограничения, время доставки
+не превысило MAX_ROUND_TRIP, а скорость обмена не упала относительно
+сохраненных ранее результатов.
+Все случайные данные зависят только от параметра --seed.
+Параметры командной строки:
+soak_harness.py [-d <секунды>] [-c <клиенты>] [-s <медленные клиенты>]
+[-r <молчащие клиенты>] [--seed <число>] [--baseline <файл>] [--save-baseline]
+"""
+import argparse
+import json
+import os
+import random
+import select
+import subprocess
+import sys
+import tempfile
+import threading
+from time import time, sleep, perf_counter
+from socket import socket, create_connection, AF_INET, SOCK_STREAM
+from common.utils import send_message, get_message, compress_data
+from common.variables import *
+from messenger_client import MessengerClient, create_presence_message, \
+    create_text_message, create_exit_message
+
+SOAK_PORT = DEFAULT_PORT + 10
+SOAK_ADMIN_PORT = ADMIN_PORT + 10
+# Интервал замеров памяти и скорости обмена, с
+SAMPLE_INTERVAL = 1
+# Время на закрытие сервером соединений после остановки клиентов, с
+SETTLE_TIMEOUT = 10
+# Допустимый рост памяти: во сколько раз и на сколько байт
+MEMORY_GROWTH_FACTOR = 1.5
+MEMORY_GROWTH_BYTES = 16 * 1024 * 1024
+# Допустимое падение скорости обмена относительно сохраненного результата
+THROUGHPUT_TOLERANCE = 0.3
+# Наибольшее число чтений при очистке сокета клиента
+DRAIN_READS = 16
+# Сколько медленный клиент держит отправленным начало сообщения, с
+STALL_TIME = 2
+# Наибольшее допустимое время доставки сообщения замеряющей пары клиентов, с
+MAX_ROUND_TRIP = 1
+# Длительность подключения молчащего клиента, с, и размер сообщений ему
+SILENT_TIME = 5
+SILENT_TEXT_SIZE = 2000
+# Ограничение очереди одному получателю на сервере во время тестирования:
+# меньше, чем по умолчанию, чтобы молчащие клиенты отключались быстрее
+SOAK_RECIPIENT_QUEUE = 200
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'soak_baseline.json')
+
+
+def random_text(rnd, size):
+    return ''.join(rnd.choice('абвгдеёжзabcdefgh 0123456789') for _ in range(size))
+
+
+def make_frame(rnd, name, names):
+    """
+    Формирует случайное сообщение: корректное или искаженное
+    :param rnd: генератор случайных чисел
+    :param name: имя отправителя
+    :param names: имена других клиентов
+    :return: байты для отправки
+    """
+    kind = rnd.randrange(10)
+    recipient = rnd.choice(names)
+    # Время тоже случайное, чтобы сообщения зависели только от генератора
+    moment = float(rnd.randrange(10 ** 9))
+    if kind < 4:
+        message = create_text_message(name, recipient, random_text(rnd, rnd.choice((1, 50, 2000))))
+        message[TIME] = moment
+        data = json.dumps(message).encode(ENCODING)
+        return compress_data(data) if rnd.random() < 0.3 else data + FRAME_DELIMITER
+    if kind == 4:
+        # Не JSON
+        return bytes(rnd.randrange(1, 256) for _ in range(rnd.randrange(1, 200))) \
+            .replace(FRAME_DELIMITER, b' ') + FRAME_DELIMITER
+    if kind == 5:
+        # JSON, но не словарь
+        return json.dumps(rnd.choice(([1, 2], 'text', 5, None))).encode(ENCODING) + FRAME_DELIMITER
+    if kind == 6:
+        # Неизвестное действие, нет полей или поля неверного типа
+        message = rnd.choice((
+            {ACTION: random_text(rnd, 5), TIME: moment},
+            {ACTION: MSG, TIME: moment},
+            {ACTION: [MSG], TIME: moment},
+            {ACTION: MSG, TIME: moment, FROM: {'a': 1}, TO: [recipient], TEXT: 5},
+            {ACTION: PRESENCE, TIME: moment, USER: 'name'},
+            {ACTION: PRESENCE, TIME: moment, USER: {'account_name': [name]}},
+            {ACTION: FILE, TIME: moment, FROM: name, TO: recipient, FILE_ID: 1,
+             FILE_NAME: '../../etc/passwd', SEQ: 'x', CHUNK: '***', LAST: True},
+            {ACTION: GET_STATE, SINCE: 0},
+        ))
+        return json.dumps(message).encode(ENCODING) + FRAME_DELIMITER
+    if kind == 7:
+        # Поврежденное сжатое сообщение
+        message = create_text_message(name, recipient, random_text(rnd, 600))
+        message[TIME] = moment
+        data = bytearray(compress_data(json.dumps(message).encode(ENCODING)))
+        data[rnd.randrange(len(COMPRESSED_MARKER), len(data))] ^= 0xFF
+        return bytes(data)
+    if kind == 8:
+        # Сообщение больше MAX_MESSAGE_SIZE без разделителя
+        return b'{"' + b'a' * (MAX_MESSAGE_SIZE + rnd.randrange(1000)) + FRAME_DELIMITER
+    # Пустые строки и лишние разделители
+    return FRAME_DELIMITER * rnd.randrange(1, 4)
+
+
+def send_split(sock, data, rnd):
+    """
+    Отправляет данные частями, разбивая их в случайных местах
+    """
+    position = 0
+    while position < len(data):
+        size = rnd.choice((1, 2, 7, 100, len(data)))
+        sock.sendall(data[position:position + size])
+        position += size
+        if rnd.random() < 0.1:
+            sleep(0.001)
+
+
+def drain(sock):
+    """
+    Читает всё, что сервер успел отправить клиенту, чтобы не заполнить
+    буфер сокета и не задержать рассылку остальным клиентам
+    """
+    # Рассылка идёт непрерывно, поэтому читаем ограниченное число раз
+    try:
+        for _ in range(DRAIN_READS):
+            if not sock.recv(65536):
+                return
+    except OSError:
+        pass
+
+
+class SoakWorker(threading.Thread):
+    """
+    Клиент, многократно подключающийся к серверу и отправляющий
+    случайные сообщения
+    """
+    def __init__(self, number, seed, port, stop_event):
+        super().__init__(daemon=True)
+        self.rnd = random.Random(f'{seed}-{number}')
+        self.name = f'soak{number}'
+        self.names = [f'soak{other}' for other in range(number + 2)] + ['probe_in']
+        self.port = port
+        self.stop_event = stop_event
+        self.connections = 0
+        self.frames = 0
+        self.errors = 0
+
+    def run(self):
+        while not self.stop_event.is_set():
+            try:
+                self.session()
+            except OSError:
+                self.errors += 1
+                sleep(0.05)
+
+    def session(self):
+        sock = socket(AF_INET, SOCK_STREAM)
+        sock.settimeout(0.05)
+        sock.connect((DEFAULT_IP, self.port))
+        self.connections += 1
+        try:
+            if self.rnd.random() < 0.9:
+                presence = create_presence_message(self.name,
+                                                   compression=self.rnd.random() < 0.5)
+                send_split(sock, json.dumps(presence).encode(ENCODING) + FRAME_DELIMITER,
+                           self.rnd)
+            for _ in range(self.rnd.randrange(1, 30)):
+                if self.stop_event.is_set():
+                    break
+                send_split(sock, make_frame(self.rnd, self.name, self.names), self.rnd)
+                self.frames += 1
+                drain(sock)
+            if self.rnd.random() < 0.5:
+                send_message(sock, create_exit_message(self.name))
+            drain(sock)
+        finally:
+            # Соединение закрывается без выхода или сразу после него
+            sock.close()
+
+
+class StallingWorker(threading.Thread):
+    """
+    Медленный клиент: отправляет начало сообщения, разбитого в случайном
+    месте, и дописывает его через STALL_TIME. Пока он ждёт, сервер
+    должен обслуживать остальных клиентов.
+    """
+    def __init__(self, number, seed, port, stop_event):
+        super().__init__(daemon=True)
+        self.rnd = random.Random(f'{seed}-stall-{number}')
+        self.name = f'stall{number}'
+        self.port = port
+        self.stop_event = stop_event
+        self.stalls = 0
+        self.errors = 0
+
+    def run(self):
+        while not self.stop_event.is_set():
+            try:
+                self.session()
+            except OSError:
+                self.errors += 1
+                sleep(0.05)
+
+    def session(self):
+        with create_connection((DEFAULT_IP, self.port), timeout=STALL_TIME) as sock:
+            presence = create_presence_message(self.name)
+            data = json.dumps(presence).encode(ENCODING) + FRAME_DELIMITER
+            if self.rnd.random() < 0.5:
+                # Зависает уже сообщение о подключении
+                message = data
+            else:
+                send_message(sock, presence)
+                message = create_text_message(self.name, 'probe_in', random_text(self.rnd, 100))
+                message = json.dumps(message).encode(ENCODING) + FRAME_DELIMITER
+            split = self.rnd.randrange(1, len(message))
+            sock.sendall(message[:split])
+            self.stalls += 1
+            self.stop_event.wait(STALL_TIME)
+            sock.sendall(message[split:])
+            drain(sock)
+
+
+class SilentWorker(threading.Thread):
+    """
+    Молчащий клиент: подключается, получает поток сообщений от своего
+    отправителя, но не читает их. Сообщения ему копятся сначала в буферах
+    сокета, затем в очереди сервера, пока сервер его не отключит.
+    """
+    def __init__(self, number, seed, port, stop_event):
+        super().__init__(daemon=True)
+        self.rnd = random.Random(f'{seed}-silent-{number}')
+        self.name = f'silent{number}'
+        self.sender_name = f'flood{number}'
+        self.port = port
+        self.stop_event = stop_event
+        self.sent = 0
+        self.disconnects = 0
+        self.errors = 0
+
+    def run(self):
+        while not self.stop_event.is_set():
+            try:
+                self.session()
+            except OSError:
+                self.errors += 1
+                sleep(0.05)
+
+    def is_disconnected(self, sock):
+        """
+        Дочитывает накопившиеся сообщения после окончания сеанса и
+        проверяет, закрыл ли сервер соединение
+        """
+        sock.settimeout(0.5)
+        try:
+            while sock.recv(65536):
+                pass
+        except OSError:
+            return False
+        return True
+
+    def session(self):
+        with create_connection((DEFAULT_IP, self.port), timeout=5) as silent, \
+                create_connection((DEFAULT_IP, self.port), timeout=5) as sender:
+            send_message(silent, create_presence_message(self.name, compression=False))
+            get_message(silent)
+            send_message(sender, create_presence_message(self.sender_name, compression=False))
+            get_message(sender)
+            sender.settimeout(0.05)
+            deadline = time() + SILENT_TIME
+            while time() < deadline and not self.stop_event.is_set():
+                message = create_text_message(self.sender_name, self.name,
+                                              random_text(self.rnd, SILENT_TEXT_SIZE))
+                send_message(sender, message)
+                self.sent += 1
+                # Ответов отправителю почти нет, но читать их нужно
+                if select.select([sender], [], [], 0)[0]:
+                    drain(sender)
+                sleep(0.001)
+            if self.is_disconnected(silent):
+                self.disconnects += 1
+
+
+class ThroughputProbe(threading.Thread):
+    """
+    Пара клиентов, обменивающихся сообщениями по очереди: следующее
+    сообщение отправляется после получения предыдущего
+    """
+    def __init__(self, port, stop_event):
+        super().__init__(daemon=True)
+        self.port = port
+        self.stop_event = stop_event
+        self.delivered = 0
+        self.lost = 0
+        self.max_round_trip = 0
+
+    def run(self):
+        receiver = MessengerClient('probe_in', DEFAULT_IP, self.port, compression=False)
+        sender = MessengerClient('probe_out', DEFAULT_IP, self.port, compression=False)
+        receiver.connect()
+        sender.connect()
+        try:
+            while not self.stop_event.is_set():
+                start = perf_counter()
+                sent = sender.send('probe_in', 'probe')
+                while True:
+                    message = receiver.recv(timeout=5)
+                    if message is None:
+                        self.lost += 1
+                        break
+                    if message.get(FROM) == 'probe_out' and message[TIME] == sent[TIME]:
+                        self.delivered += 1
+                        self.max_round_trip = max(self.max_round_trip, perf_counter() - start)
+                        break
+        finally:
+            sender.close()
+            receiver.close()
+
+
+def admin_request(port, message):
+    """
+    Выполняет команду администратора
+    """
+    with create_connection((ADMIN_ADDRESS, port), timeout=5) as sock:
+        send_message(sock, message)
+        return get_message(sock, max_size=ADMIN_MESSAGE_SIZE)
+
+
+def memory_usage(pid):
+    """
+    Возвращает объём занятой процессом памяти в байтах, если он известен
+    """
+    try:
+        with open(f'/proc/{pid}/status') as status:
+            for line in status:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        return None
+    return None
+
+
+def start_server(port, admin_port, directory, config=os.devnull, **settings):
+    """
+    Запускает сервер в отдельном процессе с отдельными базой данных
+    и почтовыми ящиками
+    :param config: файл настроек сервера
+    :param settings: дополнительные настройки сервера
+    :return: процесс сервера
+    """
+    environ = dict(os.environ,
+                   MESSENGER_PORT=str(port),
+                   MESSENGER_ADMIN_PORT=str(admin_port),
+                   MESSENGER_DATABASE=os.path.join(directory, 'soak.db3'),
+                   MESSENGER_MAILBOX_DIR=os.path.join(directory, MAILBOX_DIR),
+                   MESSENGER_LOG_LEVEL='WARNING')
+    environ.update({f'MESSENGER_{name.upper()}': str(value) for name, value in settings.items()})
+    server = subprocess.Popen([sys.executable, os.path.join(os.path.dirname(
+        os.path.abspath(__file__)), 'server.py'), '-c', config],
+                              env=environ, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time() + 10
+    while time() < deadline:
+        try:
+            admin_request(admin_port, {ACTION: GET_STATE, SINCE: 0})
+            return server
+        except OSError:
+            sleep(0.1)
+    server.kill()
+    raise RuntimeError('Сервер не запустился')
+
+
+def run_soak(duration, clients, seed=0, port=SOAK_PORT, admin_port=SOAK_ADMIN_PORT,
+             baseline=None, stalling=1, silent=1):
+    """
+    Выполняет тестирование
+    :param duration: длительность, с
+    :param clients: число одновременно работающих клиентов
+    :param stalling: число медленных клиентов
+    :param silent: число молчащих клиентов
+    :param seed: начальное значение генератора случайных чисел
+    :param port: порт сервера
+    :param admin_port: порт администрирования сервера
+    :param baseline: сохраненный ранее отчёт для сравнения скорости обмена
+    :return: отчёт, список failures пуст, если проверки пройдены
+    """
+    directory = tempfile.mkdtemp()
+    server = start_server(port, admin_port, directory,
+                          max_recipient_queue=SOAK_RECIPIENT_QUEUE)
+    stop_event = threading.Event()
+    probe = ThroughputProbe(port, stop_event)
+    workers = [SoakWorker(number, seed, port, stop_event) for number in range(clients)]
+    stalling_workers = [StallingWorker(number, seed, port, stop_event)
+                        for number in range(stalling)]
+    stalling_workers += [SilentWorker(number, seed, port, stop_event)
+                         for number in range(silent)]
+    failures = []
+    rates = []
+    memory = []
+    try:
+        probe.start()
+        for worker in workers + stalling_workers:
+            worker.start()
+        start = time()
+        last_delivered = 0
+        while time() - start < duration and server.poll() is None:
+            sleep(SAMPLE_INTERVAL)
+            rates.append((probe.delivered - last_delivered) / SAMPLE_INTERVAL)
+            last_delivered = probe.delivered
+            memory.append(memory_usage(server.pid))
+        stop_event.set()
+        probe.join(10)
+        for worker in workers + stalling_workers:
+            worker.join(10)
+
+        if server.poll() is not None:
+            failures.append(f'Сервер завершился с кодом {server.returncode}')
+        else:
+            connections = None
+            deadline = time() + SETTLE_TIMEOUT
+            while time() < deadline:
+                connections = admin_request(admin_port, {ACTION: GET_STATE, SINCE: 0})[CONNECTIONS]
+                if connections == 0:
+                    break
+                sleep(0.2)
+            if connections != 0:
+                failures.append(f'Не закрыто соединений клиентов: {connections}')
+    finally:
+        server.terminate()
+        try:
+            server.wait(SHUTDOWN_TIMEOUT * 2)
+        except subprocess.TimeoutExpired:
+            server.kill()
+
+    memory = [value for value in memory if value is not None]
+    if memory:
+        # Первый замер - после запуска клиентов, дальше память расти не должна
+        limit = memory[0] * MEMORY_GROWTH_FACTOR + MEMORY_GROWTH_BYTES
+        if max(memory) > limit:
+            failures.append(f'Память выросла с {memory[0]} до {max(memory)} байт')
+    throughput = sum(rates) / len(rates) if rates else 0
+    if probe.lost:
+        failures.append(f'Потеряно сообщений: {probe.lost}')
+    if probe.max_round_trip > MAX_ROUND_TRIP:
+        failures.append(f'Время доставки сообщения {probe.max_round_trip:.2f} с '
+                        f'превышает {MAX_ROUND_TRIP} с')
+    if baseline and throughput < baseline['throughput'] * (1 - THROUGHPUT_TOLERANCE):
+        failures.append(f'Скорость обмена упала с {baseline["throughput"]:.1f} '
+                        f'до {throughput:.1f} сообщ./с')
+    return {
+        'seed': seed,
+        'duration': duration,
+        'clients': clients,
+        'connections': sum(worker.connections for worker in workers),
+        'frames': sum(worker.frames for worker in workers),
+        'stalls': sum(getattr(worker, 'stalls', 0) for worker in stalling_workers),
+        'silent_messages': sum(getattr(worker, 'sent', 0) for worker in stalling_workers),
+        'silent_disconnects': sum(getattr(worker, 'disconnects', 0)
+                                  for worker in stalling_workers),
+        'client_errors': sum(worker.errors for worker in workers + stalling_workers),
+        'throughput': throughput,
+        'min_throughput': min(rates) if rates else 0,
+        'max_round_trip': round(probe.max_round_trip, 3),
+        'memory_start': memory[0] if memory else None,
+        'memory_max': max(memory) if memory else None,
+        'failures': failures
+    }
+
+
+def main():
+    args = argparse.ArgumentParser(description='Нагрузочное и fuzz-тестирование сервера')
+    args.add_argument('-d', '--duration', type=float, default=60, help='Длительность, с')
+    args.add_argument('-c', '--clients', type=int, default=20, help='Число клиентов')
+    args.add_argument('-s', '--stalling', type=int, default=1, help='Число медленных клиентов')
+    args.add_argument('-r', '--silent', type=int, default=1,
+                      help='Число молчащих клиентов, не читающих сообщения')
+    args.add_argument('--seed', type=int, default=0)
+    args.add_argument('--baseline', default=BASELINE_FILE,
+                      help='Файл с результатами для сравнения скорости обмена')
+    args.add_argument('--save-baseline', action='store_true',
+                      help='Сохранить результаты для следующих запусков')
+    namespace = args.parse_args(sys.argv[1:])
+
+    baseline = None
+    if os.path.exists(namespace.baseline) and not namespace.save_baseline:
+        with open(namespace.baseline, encoding=ENCODING) as file:
+            baseline = json.load(file)
+    report = run_soak(namespace.duration, namespace.clients, namespace.seed, baseline=baseline,
+                      stalling=namespace.stalling, silent=namespace.silent)
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    if namespace.save_baseline and not report['failures']:
+        with open(namespace.baseline, 'w', encoding=ENCODING) as file:
+            json.dump(report, file, ensure_ascii=False, indent=2)
+    sys.exit(1 if report['failures'] else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -4,9 +4,11 @@ Unit-тесты для модуля client.py
 
 import os
 import sys
+import tempfile
 import unittest
 sys.path.append(os.path.join(os.getcwd(), '..'))
-from client import create_presence_message, read_response
+from client import create_presence_message, read_response, create_file_message, \
+    save_file_chunk
 from errors import MissingFieldError
 from common.variables import *
 
@@ -59,6 +61,15 @@ class TestClient(unittest.TestCase):
         self.assertNotEqual(test_msg, {ACTION: PRESENCE, TIME: 1, TYPE: 'status',
                                        USER: {'account_name': 'User', 'password': ''}})
 
+    def test_create_message_compression(self):
+        """Формирование сообщения с предложением сжатия"""
+        test_msg = create_presence_message(user='User', compression=True)
+        test_msg[TIME] = 1
+
+        self.assertEqual(test_msg, {ACTION: PRESENCE, TIME: 1, TYPE: 'status',
+                                    USER: {'account_name': 'User', 'password': ''},
+                                    COMPRESSION: [COMPRESSION_METHOD]})
+
     def test_create_message_is_dict(self):
         """
         Проверяет, является ли возвращенный объект словарем
@@ -84,6 +95,45 @@ class TestClient(unittest.TestCase):
         """Некорректный код ответа"""
         self.assertRaises(ValueError, read_response, {RESPONSE: 300})
 
+    def test_create_file_message(self):
+        """Формирование сообщения с частью файла"""
+        test_msg = create_file_message('User', 'Test', 'id', 'file.txt', 0, b'data', True)
+        test_msg[TIME] = 1
+
+        self.assertEqual(test_msg, {ACTION: FILE, TIME: 1, FROM: 'User', TO: 'Test',
+                                    FILE_ID: 'id', FILE_NAME: 'file.txt', SEQ: 0,
+                                    CHUNK: 'ZGF0YQ==', LAST: True})
+
+    def test_save_file_chunks(self):
+        """Сохранение файла из нескольких частей, путь в имени файла отбрасывается"""
+        with tempfile.TemporaryDirectory() as directory:
+            for seq, chunk in enumerate([b'first ', b'second']):
+                message = create_file_message('User', 'Test', 'id', '../file.txt',
+                                              seq, chunk, seq == 1)
+                path = save_file_chunk(message, directory)
+            self.assertEqual(path, os.path.join(directory, 'id_file.txt'))
+            with open(path, 'rb') as file:
+                self.assertEqual(file.read(), b'first second')
+
+    def test_save_file_chunk_wrong_name(self):
+        """Имена файлов без имени и с некорректным идентификатором отклоняются"""
+        with tempfile.TemporaryDirectory() as directory:
+            for file_id, file_name in (('id', ''), ('id', '.'), ('id', 'dir/..'),
+                                       ('../id', 'file.txt'), (1, 'file.txt')):
+                message = create_file_message('User', 'Test', file_id, file_name,
+                                              0, b'data', True)
+                self.assertRaises(ValueError, save_file_chunk, message, directory)
+            self.assertEqual(os.listdir(directory), [])
+
+    def test_save_file_chunk_no_overwrite(self):
+        """Первая часть файла не перезаписывает существующий файл"""
+        with tempfile.TemporaryDirectory() as directory:
+            message = create_file_message('User', 'Test', 'id', 'file.txt', 0, b'data', True)
+            path = save_file_chunk(message, directory)
+            self.assertRaises(FileExistsError, save_file_chunk, message, directory)
+            with open(path, 'rb') as file:
+                self.assertEqual(file.read(), b'data')
+
 
 if __name__ == '__main__':
     unittest.main()
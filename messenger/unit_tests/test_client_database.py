@@ -0,0 +1,47 @@
+"""
+Unit-тесты для модуля client_database.py
+"""
+
+import unittest
+import os
+import sys
+sys.path.append(os.path.join(os.getcwd(), '..'))
+from client_database import ClientDatabase
+
+
+class TestClientDatabase(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.database = ClientDatabase(':memory:')
+        for number in range(5):
+            self.database.save_message('User', number % 2 == 0, f'text {number}', number)
+        self.database.save_message('Test', True, 'other', 10)
+
+    def tearDown(self) -> None:
+        self.database.close()
+
+    def test_get_contacts(self):
+        """Список собеседников"""
+        self.assertEqual(self.database.get_contacts(), ['Test', 'User'])
+
+    def test_count_messages(self):
+        """Число сообщений в переписке"""
+        self.assertEqual(self.database.count_messages('User'), 5)
+        self.assertEqual(self.database.count_messages('Unknown'), 0)
+
+    def test_get_last_messages(self):
+        """Последняя страница истории в порядке отправки"""
+        messages = self.database.get_messages('User', 2)
+        self.assertEqual([(incoming, text) for row_id, incoming, text, message_time in messages],
+                         [(False, 'text 3'), (True, 'text 4')])
+
+    def test_get_previous_messages(self):
+        """Постраничная загрузка более ранних сообщений"""
+        last_page = self.database.get_messages('User', 2)
+        previous_page = self.database.get_messages('User', 10, before_id=last_page[0][0])
+        self.assertEqual([text for row_id, incoming, text, message_time in previous_page],
+                         ['text 0', 'text 1', 'text 2'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,126 @@
+"""
+Unit-тесты для модуля log/event_log.py
+"""
+
+import json
+import logging
+import os
+import sys
+import unittest
+sys.path.append(os.path.join(os.getcwd(), '..'))
+from log.event_log import EventLogger, LazyEvent
+from decos import Log
+from common.variables import *
+
+
+class ListHandler(logging.Handler):
+    """
+    Обработчик, сохраняющий выведенные записи
+    """
+    def __init__(self):
+        super().__init__()
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record.getMessage())
+
+
+class TestEventLog(unittest.TestCase):
+    message = {ACTION: MSG, TIME: 1, FROM: 'User', TO: 'Test', TEXT: 'секретный текст'}
+
+    def setUp(self) -> None:
+        self.logger = logging.getLogger('test_event_log')
+        self.logger.propagate = False
+        self.logger.setLevel(logging.INFO)
+        self.handler = ListHandler()
+        self.logger.addHandler(self.handler)
+
+    def tearDown(self) -> None:
+        self.logger.removeHandler(self.handler)
+
+    def test_fields_and_redaction(self):
+        """
+        Событие содержит тип, пользователя, действие и размер, но не текст сообщения
+        """
+        events = EventLogger(self.logger, {})
+        events.log(REQUEST_EVENT, self.message, latency=0.5)
+        events.log(REQUEST_EVENT, {ACTION: PRESENCE, TIME: 1,
+                                   USER: {'account_name': 'User', 'password': 'secret'}})
+        self.assertNotIn('секретный', self.handler.records[0])
+        self.assertNotIn('secret', self.handler.records[1])
+        record = json.loads(self.handler.records[0])
+        self.assertEqual(record[EVENT], REQUEST_EVENT)
+        self.assertEqual(record[USER], 'User')
+        self.assertEqual(record[ACTION], MSG)
+        self.assertEqual(record['latency'], 0.5)
+        self.assertEqual(record['size'], len(json.dumps(self.message, ensure_ascii=False)
+                                             .encode(ENCODING)))
+        self.assertEqual(json.loads(self.handler.records[1])[USER], 'User')
+
+    def test_sampling(self):
+        """
+        Доля 0 отключает события типа, события без доли записываются все
+        """
+        events = EventLogger(self.logger, {REQUEST_EVENT: 0})
+        for _ in range(10):
+            events.log(REQUEST_EVENT, self.message)
+            events.log(BAD_REQUEST_EVENT, self.message)
+        self.assertEqual(len(self.handler.records), 10)
+        events.set_sample_rate(REQUEST_EVENT, 1)
+        self.assertTrue(events.sample(REQUEST_EVENT))
+
+    def test_long_fields(self):
+        """
+        Длинные строки обрезаются, от других значений остаётся размер
+        """
+        events = EventLogger(self.logger, {})
+        events.log(BAD_REQUEST_EVENT, {ACTION: 'a' * 1000, TO: ['x' * 1000], FROM: {'a': 1}},
+                   user='u' * 1000)
+        record = json.loads(self.handler.records[0])
+        self.assertEqual(record[ACTION], 'a' * LOGGED_STRING_LENGTH + '...')
+        self.assertEqual(record[USER], 'u' * LOGGED_STRING_LENGTH + '...')
+        self.assertEqual(record[TO], '<list 1004 байт>')
+        self.assertEqual(record[FROM], '<dict 8 байт>')
+
+    def test_rate_limit(self):
+        """
+        Число событий в секунду ограничено для типов с ограничением
+        """
+        events = EventLogger(self.logger, {}, rate_limits={BAD_REQUEST_EVENT: 3})
+        for _ in range(10):
+            events.log(BAD_REQUEST_EVENT, self.message)
+            events.log(REQUEST_EVENT, self.message)
+        self.assertLessEqual(len(self.handler.records), 16)
+        self.assertGreaterEqual(len(self.handler.records), 13)
+
+    def test_lazy_serialization(self):
+        """
+        При отключенном уровне журнала событие не формируется
+        """
+        self.logger.setLevel(logging.WARNING)
+        events = EventLogger(self.logger, {})
+        self.assertFalse(events.sample(REQUEST_EVENT))
+        events.log(REQUEST_EVENT, self.message)
+        self.assertEqual(self.handler.records, [])
+        self.assertEqual(json.loads(str(LazyEvent(EXIT, None, {})))[EVENT], EXIT)
+
+
+    def test_log_decorator_redaction(self):
+        """
+        Декоратор Log на уровне DEBUG не записывает тексты и пароли
+        """
+        log = Log()
+        log.func_logger = self.logger
+        self.logger.setLevel(logging.DEBUG)
+        decorated = log(lambda message, data: None)
+        decorated(dict(self.message, **{USER: {'account_name': 'User', 'password': 'pwd'}}),
+                  b'x' * 100)
+        output = ' '.join(self.handler.records)
+        self.assertNotIn('секретный текст', output)
+        self.assertNotIn('pwd', output)
+        self.assertIn("'action': 'msg'", output)
+        self.assertIn('<100 байт>', output)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,170 @@
+"""
+Unit-тесты для модуля messenger_client.py
+"""
+
+import tempfile
+import threading
+import unittest
+import os
+from unittest.mock import patch
+import sys
+from socket import socket, AF_INET, SOCK_STREAM, SOL_SOCKET, SO_REUSEADDR
+sys.path.append(os.path.join(os.getcwd(), '..'))
+from common.variables import *
+from common.utils import get_message, send_message
+import messenger_client
+from messenger_client import MessengerClient, create_file_message
+
+
+class TestMessengerClient(unittest.TestCase):
+    port = DEFAULT_PORT + 1
+    correct_response = {
+        RESPONSE: 200,
+        TIME: 1,
+        ALERT: 'Соединение прошло успешно',
+        COMPRESSION: COMPRESSION_METHOD
+    }
+
+    def setUp(self) -> None:
+        # Создаем тестовый сокет для сервера
+        self.server_socket = socket(AF_INET, SOCK_STREAM)
+        self.server_socket.setsockopt(SOL_SOCKET, SO_REUSEADDR, 1)
+        self.server_socket.bind((DEFAULT_LISTEN_ADDRESSES, self.port))
+        self.server_socket.listen(MAX_USERS)
+        # Клиент ждет ответа сервера, поэтому подключается в отдельном потоке
+        self.client = MessengerClient('User', DEFAULT_IP, self.port)
+        connect_thread = threading.Thread(target=self.client.connect)
+        connect_thread.start()
+        self.server_client, address = self.server_socket.accept()
+        self.presence = get_message(self.server_client)
+        send_message(self.server_client, self.correct_response)
+        connect_thread.join()
+
+    def tearDown(self) -> None:
+        self.client.close()
+        self.server_client.close()
+        self.server_socket.close()
+
+    def test_connect(self):
+        """
+        Подключение с согласованием сжатия
+        """
+        self.assertEqual(self.presence[ACTION], PRESENCE)
+        self.assertEqual(self.presence[COMPRESSION], [COMPRESSION_METHOD])
+        self.assertTrue(self.client.connected)
+        self.assertEqual(self.client.compression, COMPRESSION_METHOD)
+
+    def test_send(self):
+        """
+        Отправка текстового сообщения
+        """
+        self.client.send('Test', 'text')
+        message = get_message(self.server_client)
+        self.assertEqual((message[ACTION], message[FROM], message[TO], message[TEXT]),
+                         (MSG, 'User', 'Test', 'text'))
+
+    def test_recv(self):
+        """
+        Получение сообщений: чужие сообщения пропускаются
+        """
+        send_message(self.server_client, {ACTION: MSG, TIME: 1, FROM: 'Test',
+                                          TO: 'Other', TEXT: 'skip'})
+        self.assertIsNone(self.client.recv(timeout=0.5))
+        message = {ACTION: MSG, TIME: 1, FROM: 'Test', TO: 'User', TEXT: 'text'}
+        send_message(self.server_client, message)
+        self.assertEqual(self.client.recv(timeout=1), message)
+
+    def test_recv_file(self):
+        """
+        Часть файла с некорректным именем или ошибка записи
+        не прерывают приём сообщений
+        """
+        with tempfile.TemporaryDirectory() as directory:
+            self.client.downloads_dir = directory
+            for file_name in ('', '..'):
+                send_message(self.server_client, create_file_message(
+                    'Test', 'User', 'bad', file_name, 0, b'data', True))
+            # Первая часть файла с тем же именем уже сохранена
+            message = create_file_message('Test', 'User', 'id', 'file.txt', 0, b'data', True)
+            send_message(self.server_client, message)
+            send_message(self.server_client, message)
+            send_message(self.server_client, create_file_message(
+                'Test', 'User', 'other', 'file.txt', 0, b'other', True))
+            received = [self.client.recv(timeout=1), self.client.recv(timeout=1)]
+            self.assertEqual([message[FILE_PATH] for message in received],
+                             [os.path.join(directory, 'id_file.txt'),
+                              os.path.join(directory, 'other_file.txt')])
+            self.assertTrue(self.client.connected)
+
+    def test_recv_file_write_error(self):
+        """
+        После ошибки записи части файла сохранённые части удаляются,
+        а остальные части этой передачи пропускаются
+        """
+        save_file_chunk = messenger_client.save_file_chunk
+
+        def fail_second_chunk(message, directory):
+            if message[SEQ] == 1:
+                raise OSError('disk full')
+            return save_file_chunk(message, directory)
+
+        with tempfile.TemporaryDirectory() as directory, \
+                patch('messenger_client.save_file_chunk', fail_second_chunk):
+            self.client.downloads_dir = directory
+            for seq in range(3):
+                send_message(self.server_client, create_file_message(
+                    'Test', 'User', 'id', 'file.txt', seq, b'data', seq == 2))
+            message = {ACTION: MSG, TIME: 1, FROM: 'Test', TO: 'User', TEXT: 'text'}
+            send_message(self.server_client, message)
+            self.assertEqual(self.client.recv(timeout=1), message)
+            self.assertEqual(os.listdir(directory), [])
+            self.assertEqual(self.client.failed_transfers, set())
+
+    def test_recv_invalid_fields(self):
+        """
+        Сообщения с полями неверного типа не передаются дальше
+        и не прерывают приём сообщений
+        """
+        message = {ACTION: MSG, TIME: 1, FROM: 'Test', TO: 'User', TEXT: 'text'}
+        send_message(self.server_client, {**message, TIME: 'x'})
+        send_message(self.server_client, {**message, TEXT: {}})
+        send_message(self.server_client, {**create_file_message(
+            'Test', 'User', 'id', 'file.txt', 0, b'data', True), CHUNK: 5})
+        send_message(self.server_client, {RESPONSE: 202, TIME: 1, FILE_ID: [], SEQ: 0})
+        send_message(self.server_client, message)
+        self.assertEqual(self.client.recv(timeout=1), message)
+        self.assertTrue(self.client.connected)
+
+    def test_callback_error(self):
+        """
+        Ошибка в функции обратного вызова не останавливает приём сообщений
+        """
+        received = []
+
+        def callback(message):
+            received.append(message)
+            raise RuntimeError
+
+        self.client.add_callback(callback)
+        message = {ACTION: MSG, TIME: 1, FROM: 'Test', TO: 'User', TEXT: 'text'}
+        send_message(self.server_client, message)
+        send_message(self.server_client, message)
+        self.server_client.close()
+        self.client.receiver.join(5)
+        self.assertEqual(received, [message, message])
+        self.assertFalse(self.client.connected)
+
+    def test_iteration_stops_on_disconnect(self):
+        """
+        Итерация по входящим сообщениям завершается при разрыве соединения
+        """
+        message = {ACTION: MSG, TIME: 1, FROM: 'Test', TO: 'User', TEXT: 'text'}
+        send_message(self.server_client, message)
+        self.assertEqual(self.client.recv(timeout=1), message)
+        self.server_client.close()
+        self.assertEqual(list(self.client), [])
+        self.assertFalse(self.client.connected)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -2,13 +2,45 @@
 Unit-тесты для модуля server.py
 """
 
+import json
+import signal
 import unittest
 import os
 import sys
+import tempfile
 from time import time
 sys.path.append(os.path.join(os.getcwd(), '..'))
 from server import create_response
+from server_state import ServerState
+from server_control import shutdown_server, HANDOFF_ARGUMENT
+from server_mailbox import Mailboxes
+from socket import create_connection, socketpair
+from common.utils import split_frame, get_message, send_message
+from handlers import ACTION_HANDLERS, ADMIN_HANDLERS, register_action, add_timing_hook
 from common.variables import *
+from soak_harness import start_server, admin_request
+
+
+class MockSocket:
+    """
+    Тестовый сокет, сохраняющий отправленные данные
+    """
+    def __init__(self, address='127.0.0.1'):
+        self.sent = []
+        self.closed = False
+        self.address = address
+
+    def getpeername(self):
+        return self.address, 7777
+
+    def settimeout(self, timeout):
+        pass
+
+    def sendall(self, data):
+        self.sent.append(data)
+
+    def close(self):
+        self.closed = True
 
 
 class TestServer(unittest.TestCase):
@@ -24,16 +56,38 @@ class TestServer(unittest.TestCase):
     }
 
     def setUp(self) -> None:
-        pass
+        self.client = MockSocket()
+        self.state = ServerState()
+        self.state.clients.append(self.client)
+        self.mailbox_dir = tempfile.TemporaryDirectory()
+        self.state.mailboxes = Mailboxes(self.mailbox_dir.name)
+
+    def login(self, name):
+        """
+        Подключает ещё одного пользователя
+        """
+        client = MockSocket()
+        self.state.clients.append(client)
+        self.state.login(name, client)
+        return client
+
+    def get_response(self, message, registry=ACTION_HANDLERS):
+        """
+        Передает сообщение серверу и возвращает отправленный клиенту ответ
+        """
+        create_response(message, self.client, self.state, registry)
+        # Большие ответы консоли администратора сжимаются
+        frame, rest = split_frame(self.client.sent[-1])
+        return json.loads(frame.decode(ENCODING))
 
     def tearDown(self) -> None:
-        pass
+        self.mailbox_dir.cleanup()
 
     def test_create_response_ok(self):
         """
         Ответ на корректный запрос
         """
-        test_response = create_response({
+        test_response = self.get_response({
             ACTION: PRESENCE,
             TIME: time(),
             TYPE: 'status',
@@ -49,7 +103,7 @@ class TestServer(unittest.TestCase):
         """
         Некорректное действие
         """
-        test_response = create_response({
+        test_response = self.get_response({
             ACTION: 'wrong_action',
             TIME: time(),
             TYPE: 'status',
@@ -65,7 +119,7 @@ class TestServer(unittest.TestCase):
         """
         Отсутствие действия
         """
-        test_response = create_response({
+        test_response = self.get_response({
             TIME: time(),
             TYPE: 'status',
             USER: {
@@ -76,11 +130,19 @@ class TestServer(unittest.TestCase):
         test_response[TIME] = 1
         self.assertEqual(test_response, self.error_response)
 
+    def test_create_response_action_not_str(self):
+        """
+        Действие, не являющееся строкой
+        """
+        test_response = self.get_response({ACTION: [MSG], TIME: time()})
+        test_response[TIME] = 1
+        self.assertEqual(test_response, self.error_response)
+
     def test_create_response_no_time(self):
         """
         Отсутствие временного штампа
         """
-        test_response = create_response({
+        test_response = self.get_response({
             ACTION: PRESENCE,
             TYPE: 'status',
             USER: {
@@ -88,13 +150,14 @@ class TestServer(unittest.TestCase):
                 'password': ''
             }
         })
+        test_response[TIME] = 1
         self.assertEqual(test_response, self.error_response)
 
     def test_create_response_no_user(self):
         """
         Нет пользователя
         """
-        test_response = create_response({
+        test_response = self.get_response({
             ACTION: PRESENCE,
             TIME: time(),
             TYPE: 'status',
@@ -106,7 +169,7 @@ class TestServer(unittest.TestCase):
         """
         Неверный формат поля "user"
         """
-        test_response = create_response({
+        test_response = self.get_response({
             ACTION: PRESENCE,
             TIME: time(),
             TYPE: 'status',
@@ -115,11 +178,30 @@ class TestServer(unittest.TestCase):
         test_response[TIME] = 1
         self.assertEqual(test_response, self.error_response)
 
+    def test_create_response_user_name_error(self):
+        """
+        Имя пользователя указано не строкой
+        """
+        test_response = self.get_response({ACTION: PRESENCE, TIME: time(),
+                                           USER: {'account_name': ['User']}})
+        test_response[TIME] = 1
+        self.assertEqual(test_response, self.error_response)
+        self.assertEqual(self.state.names, {})
+
+    def test_create_response_compression_error(self):
+        """
+        Методы сжатия указаны не списком
+        """
+        test_response = self.get_response({ACTION: PRESENCE, TIME: time(), COMPRESSION: 5,
+                                           USER: {'account_name': 'User'}})
+        test_response[TIME] = 1
+        self.assertEqual(test_response, self.error_response)
+
     def test_response_is_dict(self):
         """
         Проверяет, является ли возвращенный объект словарем
         """
-        test_response = create_response({
+        test_response = self.get_response({
             ACTION: PRESENCE,
             TIME: time(),
             TYPE: 'status',
@@ -131,6 +213,411 @@ class TestServer(unittest.TestCase):
         test_response[TIME] = 1
         self.assertIsInstance(test_response, dict)
 
+    def test_create_response_message_queued(self):
+        """
+        Текстовое сообщение ставится в очередь без ответа клиенту
+        """
+        self.state.login('User', self.client)
+        self.login('Test')
+        message = {ACTION: MSG, TIME: time(), FROM: 'User', TO: 'Test', TEXT: 'text'}
+        create_response(message, self.client, self.state)
+        self.assertEqual(self.state.messages, [message])
+        self.assertEqual(self.state.message_count, 1)
+        self.assertEqual(self.client.sent, [])
+
+    def test_create_response_message_fields(self):
+        """
+        Сообщения с полями неверного типа и сообщения от имени
+        другого пользователя не принимаются
+        """
+        self.state.login('User', self.client)
+        self.login('Test')
+        message = {ACTION: MSG, TIME: time(), FROM: 'User', TO: 'Test', TEXT: 'text'}
+        chunk = {ACTION: FILE, TIME: time(), FROM: 'User', TO: 'Test', FILE_ID: 'id',
+                 FILE_NAME: 'file.txt', SEQ: 0, CHUNK: '', LAST: True}
+        for field, value in ((TIME, 'x'), (TIME, True), (TEXT, {}), (TO, ['Test'])):
+            self.assertEqual(self.get_response({**message, field: value})[RESPONSE], 400)
+        for field, value in ((FILE_ID, 1), (FILE_NAME, None), (SEQ, -1), (SEQ, 1.5),
+                             (CHUNK, 5), (LAST, 1)):
+            self.assertEqual(self.get_response({**chunk, field: value})[RESPONSE], 400)
+        self.assertEqual(self.get_response({**message, FROM: 'Test'})[RESPONSE], 400)
+        self.assertEqual(self.state.messages, [])
+
+    def test_second_presence(self):
+        """
+        Повторное presence-сообщение с другим именем отклоняется
+        """
+        self.get_response({ACTION: PRESENCE, TIME: time(), USER: {'account_name': 'User'}})
+        test_response = self.get_response({ACTION: PRESENCE, TIME: time(),
+                                           USER: {'account_name': 'Other'}})
+        self.assertEqual(test_response[RESPONSE], 400)
+        self.assertEqual(list(self.state.names), ['User'])
+        self.state.remove_client(self.client)
+        self.assertEqual((self.state.names, self.state.users), ({}, {}))
+
+    def test_admin_state_size(self):
+        """
+        Полный список пользователей больше обычного сообщения
+        принимается консолью администратора
+        """
+        for number in range(2000):
+            self.login(f'User{number:05}' * 4)
+        admin, console = socketpair()
+        self.addCleanup(admin.close)
+        self.addCleanup(console.close)
+        create_response({ACTION: GET_STATE, TIME: time(), SINCE: 0}, admin, self.state,
+                        ADMIN_HANDLERS)
+        response = get_message(console, max_size=ADMIN_MESSAGE_SIZE)
+        self.assertEqual(len(response[USERS]), 2000)
+        self.assertGreater(len(json.dumps(response)), MAX_MESSAGE_SIZE)
+
+    def test_create_response_exit(self):
+        """
+        Выход клиента закрывает соединение
+        """
+        self.get_response({ACTION: PRESENCE, TIME: time(), USER: {'account_name': 'User'}})
+        create_response({ACTION: EXIT, TIME: time()}, self.client, self.state)
+        self.assertTrue(self.client.closed)
+        self.assertEqual(self.state.clients, [])
+        self.assertEqual(self.state.names, {})
+
+    def test_register_action(self):
+        """
+        Регистрация нового действия и хука замера времени
+        """
+        handled = []
+        timings = []
+
+        @register_action('test_action', (TIME,))
+        def handle_test(message, client, state):
+            handled.append(message)
+
+        add_timing_hook('test_action', lambda action, elapsed: timings.append(action))
+        try:
+            create_response({ACTION: 'test_action', TIME: 1}, self.client, self.state)
+            test_response = self.get_response({ACTION: 'test_action'})
+        finally:
+            del ACTION_HANDLERS['test_action']
+        self.assertEqual(handled, [{ACTION: 'test_action', TIME: 1}])
+        self.assertEqual(timings, ['test_action'])
+        test_response[TIME] = 1
+        self.assertEqual(test_response, self.error_response)
+
+    def test_admin_action_not_available_to_clients(self):
+        """
+        Команды администратора недоступны обычным клиентам
+        """
+        test_response = self.get_response({ACTION: GET_STATE, SINCE: 0})
+        test_response[TIME] = 1
+        self.assertEqual(test_response, self.error_response)
+
+    def test_admin_get_state_changes(self):
+        """
+        Консоль администратора получает только изменения после известной версии
+        """
+        self.get_response({ACTION: PRESENCE, TIME: time(), USER: {'account_name': 'User'}})
+        first_state = self.get_response({ACTION: GET_STATE, SINCE: 0}, ADMIN_HANDLERS)
+        self.assertEqual([(event[EVENT], event[USER]) for event in first_state[EVENTS]],
+                         [(LOGIN, 'User')])
+        no_changes = self.get_response({ACTION: GET_STATE, SINCE: first_state[VERSION]},
+                                       ADMIN_HANDLERS)
+        self.assertEqual(no_changes[EVENTS], [])
+
+    def test_admin_get_state_snapshot(self):
+        """
+        Если журнал изменений уже не содержит нужных событий,
+        консоль получает полный список пользователей
+        """
+        self.get_response({ACTION: PRESENCE, TIME: time(), USER: {'account_name': 'User'}})
+        self.state.events.clear()
+        test_response = self.get_response({ACTION: GET_STATE, SINCE: 0}, ADMIN_HANDLERS)
+        self.assertNotIn(EVENTS, test_response)
+        self.assertEqual([user[USER] for user in test_response[USERS]], ['User'])
+
+    def test_admin_kick(self):
+        """
+        Отключение пользователя администратором
+        """
+        self.get_response({ACTION: PRESENCE, TIME: time(), USER: {'account_name': 'User'}})
+        admin = MockSocket()
+        create_response({ACTION: KICK, USER: 'User'}, admin, self.state, ADMIN_HANDLERS)
+        self.assertTrue(self.client.closed)
+        self.assertEqual(self.state.users, {})
+
+    def test_admin_set_limits(self):
+        """
+        Изменение и проверка ограничений сервера
+        """
+        test_response = self.get_response({ACTION: SET_LIMITS, LIMITS: {'max_clients': 1}},
+                                          ADMIN_HANDLERS)
+        self.assertEqual(test_response[RESPONSE], 200)
+        self.assertFalse(self.state.can_accept())
+        test_response = self.get_response({ACTION: SET_LIMITS, LIMITS: {'unknown': 1}},
+                                          ADMIN_HANDLERS)
+        self.assertEqual(test_response[RESPONSE], 400)
+
+    def test_message_rate_limit(self):
+        """
+        Сообщения сверх ограничения в секунду и длины очереди отклоняются
+        """
+        self.state.login('User', self.client)
+        self.login('Test')
+        message = {ACTION: MSG, TIME: time(), FROM: 'User', TO: 'Test', TEXT: 'text'}
+        self.state.limits['max_message_rate'] = 1
+        create_response(message, self.client, self.state)
+        test_response = self.get_response(message)
+        self.assertEqual(test_response[RESPONSE], 400)
+        self.assertEqual(len(self.state.messages), 1)
+
+        self.state.limits['max_message_rate'] = 0
+        self.state.limits['max_queue'] = 1
+        test_response = self.get_response(message)
+        self.assertEqual(test_response[RESPONSE], 400)
+        self.assertEqual(len(self.state.messages), 1)
+
+    def test_admin_profile(self):
+        """
+        Профилирование по команде администратора и отчёт о нём
+        """
+        with tempfile.TemporaryDirectory() as directory:
+            self.state.profiler.directory = directory
+            test_response = self.get_response({ACTION: PROFILE_START, DURATION: 60},
+                                              ADMIN_HANDLERS)
+            self.assertEqual(test_response[RESPONSE], 200)
+            test_response = self.get_response({ACTION: PROFILE_START, DURATION: 60},
+                                              ADMIN_HANDLERS)
+            self.assertEqual(test_response[RESPONSE], 400)
+            message = {ACTION: MSG, TIME: time(), FROM: 'User', TO: 'Test', TEXT: 'text'}
+            create_response(message, self.client, self.state)
+            self.state.profiler.deadline = 0
+            self.state.profiler.check()
+            self.assertFalse(self.state.profiler.active)
+
+            test_response = self.get_response({ACTION: PROFILE_REPORT}, ADMIN_HANDLERS)
+            report = test_response[REPORT]
+            self.assertTrue(os.path.exists(report['file']))
+            self.assertTrue(any('create_response' in function['function']
+                                for function in report['functions']))
+            self.assertEqual(len(os.listdir(directory)), 2)
+
+    def test_route_messages(self):
+        """
+        Сообщение отправляется только получателю и только готовому к приёму,
+        порядок сообщений получателю сохраняется
+        """
+        recipient = self.login('Test')
+        first = {ACTION: MSG, TIME: 1, FROM: 'User', TO: 'Test', TEXT: '1'}
+        second = {ACTION: MSG, TIME: 2, FROM: 'User', TO: 'Test', TEXT: '2'}
+        self.state.messages.extend([first, second])
+        self.assertEqual(self.state.route_messages({self.client}), [])
+        self.assertEqual(self.state.messages, [first, second])
+        self.assertEqual(self.state.route_messages({self.client, recipient}),
+                         [(recipient, first), (recipient, second)])
+        self.assertEqual(self.state.messages, [])
+
+    def test_stalled_recipient(self):
+        """
+        Получатель, у которого накопилось слишком много сообщений или который
+        слишком долго не принимает их, отключается, а его сообщения
+        переносятся в почтовый ящик
+        """
+        self.state.limits['max_recipient_queue'] = 2
+        recipient = self.login('Test')
+        messages = [{ACTION: MSG, TIME: number, FROM: 'User', TO: 'Test', TEXT: str(number)}
+                    for number in range(3)]
+        self.state.messages.extend(messages[:2])
+        self.assertEqual(self.state.route_messages({self.client}), [])
+        self.assertFalse(recipient.closed)
+        self.state.messages.append(messages[2])
+        self.assertEqual(self.state.route_messages({self.client}), [])
+        self.assertTrue(recipient.closed)
+        self.assertEqual((self.state.messages, len(self.state.mailboxes)), ([], 3))
+
+        recipient = self.login('Other')
+        self.state.messages.append({ACTION: MSG, TIME: 1, FROM: 'User', TO: 'Other', TEXT: '1'})
+        self.state.route_messages(set())
+        self.state.stalled[recipient] -= self.state.limits['stall_timeout'] + 1
+        self.state.route_messages(set())
+        self.assertTrue(recipient.closed)
+        self.assertEqual((self.state.messages, self.state.stalled), ([], {}))
+
+    def test_offline_mailbox(self):
+        """
+        Сообщение отключенному пользователю доставляется при подключении,
+        при переполнении ящика отправитель получает ошибку
+        """
+        self.state.login('User', self.client)
+        message = {ACTION: MSG, TIME: time(), FROM: 'User', TO: 'Test', TEXT: 'text'}
+        create_response(message, self.client, self.state)
+        self.assertEqual(self.state.messages, [])
+        self.assertEqual(len(self.state.mailboxes), 1)
+        self.state.mailboxes.max_messages = 1
+        test_response = self.get_response(message)
+        self.assertEqual(test_response[RESPONSE], 400)
+
+        recipient = MockSocket()
+        create_response({ACTION: PRESENCE, TIME: time(), USER: {'account_name': 'Test'}},
+                        recipient, self.state)
+        self.assertEqual([json.loads(data.decode(ENCODING)) for data in recipient.sent[1:]],
+                         [message])
+        self.assertEqual(len(self.state.mailboxes), 0)
+
+
+class TestServerControl(unittest.TestCase):
+
+    def test_shutdown_flushes_messages(self):
+        """
+        При остановке накопленные сообщения отправляются,
+        клиенты получают уведомление и отключаются
+        """
+        state = ServerState()
+        clients = [MockSocket(), MockSocket()]
+        state.clients.extend(clients)
+        state.login('Test', clients[0])
+        state.login('User', clients[1])
+        listening_socket = MockSocket()
+        message = {ACTION: MSG, TIME: 1, FROM: 'User', TO: 'Test', TEXT: 'text'}
+        offline_message = {ACTION: MSG, TIME: 1, FROM: 'User', TO: 'Other', TEXT: 'text'}
+        state.messages.extend([message, offline_message])
+
+        with tempfile.TemporaryDirectory() as directory:
+            state.mailboxes = Mailboxes(directory)
+            shutdown_server(state, [listening_socket])
+            # Сообщение отключенному пользователю сохранено в файл
+            self.assertEqual(len(os.listdir(directory)), 1)
+
+        self.assertTrue(listening_socket.closed)
+        self.assertEqual(state.clients, [])
+        for client in clients:
+            self.assertTrue(client.closed)
+        sent = [json.loads(data.decode(ENCODING)) for data in clients[0].sent]
+        self.assertEqual(sent[0], message)
+        self.assertEqual(sent[1][RESPONSE], 503)
+        sent = [json.loads(data.decode(ENCODING)) for data in clients[1].sent]
+        self.assertEqual([data[RESPONSE] for data in sent], [503])
+
+
+class TestServerProcess(unittest.TestCase):
+    """
+    Сервер в отдельном процессе
+    """
+    PORT = DEFAULT_PORT + 40
+    ADMIN_PORT = ADMIN_PORT + 40
+
+    def setUp(self) -> None:
+        self.directory = tempfile.TemporaryDirectory()
+        self.config = os.path.join(self.directory.name, 'server.ini')
+        with open(self.config, 'w') as file:
+            file.write('[server]\n')
+        self.server = start_server(self.PORT, self.ADMIN_PORT, self.directory.name, self.config)
+
+    def tearDown(self) -> None:
+        self.server.terminate()
+        self.server.wait(10)
+        self.directory.cleanup()
+
+    def connect(self, name):
+        """
+        Подключает пользователя и возвращает его сокет
+        """
+        client = create_connection(('127.0.0.1', self.PORT), timeout=2)
+        send_message(client, {ACTION: PRESENCE, TIME: time(), USER: {'account_name': name}})
+        self.assertEqual(get_message(client)[RESPONSE], 200)
+        return client
+
+    def find_handoff_process(self):
+        """
+        Находит процесс сервера, запущенный при перезапуске
+        :return: pid или None
+        """
+        for pid in filter(str.isdigit, os.listdir('/proc')):
+            try:
+                with open(f'/proc/{pid}/cmdline', 'rb') as file:
+                    arguments = file.read().split(b'\0')
+                with open(f'/proc/{pid}/environ', 'rb') as file:
+                    environ = file.read().split(b'\0')
+            except OSError:
+                continue
+            if (HANDOFF_ARGUMENT.encode() in arguments
+                    and f'MESSENGER_PORT={self.PORT}'.encode() in environ):
+                return int(pid)
+        return None
+
+    def stop_handoff_process(self):
+        pid = self.find_handoff_process()
+        if pid is not None:
+            os.kill(pid, signal.SIGTERM)
+
+    @unittest.skipUnless(hasattr(signal, 'SIGUSR2') and os.path.isdir('/proc'),
+                         'Перезапуск по сигналу SIGUSR2 не поддерживается')
+    def test_restart_keeps_connections(self):
+        """
+        После перезапуска с передачей сокетов подключенные клиенты
+        продолжают обмениваться сообщениями
+        """
+        sender, receiver = self.connect('User'), self.connect('Test')
+        self.addCleanup(sender.close)
+        self.addCleanup(receiver.close)
+        send_message(sender, {ACTION: MSG, TIME: time(), FROM: 'User', TO: 'Test',
+                              TEXT: 'before'})
+        self.assertEqual(get_message(receiver)[TEXT], 'before')
+        admin_request(self.ADMIN_PORT, {ACTION: SET_LIMITS, LIMITS: {'max_clients': 5}})
+
+        self.addCleanup(self.stop_handoff_process)
+        os.kill(self.server.pid, signal.SIGUSR2)
+        self.server.wait(10)
+        self.assertIsNotNone(self.find_handoff_process())
+
+        receiver.settimeout(10)
+        send_message(sender, {ACTION: MSG, TIME: time(), FROM: 'User', TO: 'Test',
+                              TEXT: 'after'})
+        self.assertEqual(get_message(receiver)[TEXT], 'after')
+        state = admin_request(self.ADMIN_PORT, {ACTION: GET_STATE, SINCE: 0})
+        self.assertEqual(state[CONNECTIONS], 2)
+        # Ограничения берутся из настроек нового процесса
+        self.assertEqual(state[LIMITS]['max_clients'], MAX_CLIENTS)
+
+    @unittest.skipUnless(hasattr(signal, 'SIGUSR2') and os.path.isdir('/proc'),
+                         'Перезапуск по сигналу SIGUSR2 не поддерживается')
+    def test_failed_restart_keeps_serving(self):
+        """
+        Если новый процесс не запустился, прежний продолжает работу
+        """
+        sender, receiver = self.connect('User'), self.connect('Test')
+        self.addCleanup(sender.close)
+        self.addCleanup(receiver.close)
+        with open(self.config, 'w') as file:
+            file.write('[server]\nmax_clients = bad\n')
+        os.kill(self.server.pid, signal.SIGUSR2)
+        # Новый процесс завершается из-за ошибки в настройках
+        admin_request(self.ADMIN_PORT, {ACTION: GET_STATE, SINCE: 0})
+        self.assertIsNone(self.server.poll())
+        self.assertIsNone(self.find_handoff_process())
+
+        receiver.settimeout(10)
+        send_message(sender, {ACTION: MSG, TIME: time(), FROM: 'User', TO: 'Test',
+                              TEXT: 'after'})
+        self.assertEqual(get_message(receiver)[TEXT], 'after')
+        self.connect('Other').close()
+
+    def test_partial_frame_does_not_block_server(self):
+        """
+        Клиент, отправивший часть сообщения, не мешает обслуживать остальных
+        """
+        idle = create_connection(('127.0.0.1', self.PORT), timeout=2)
+        idle.sendall(b'{"action": "pres')
+        try:
+            client = self.connect('User')
+            send_message(client, {ACTION: MSG, TIME: time(), FROM: 'User', TO: 'User',
+                                  TEXT: 'text'})
+            self.assertEqual(get_message(client)[TEXT], 'text')
+            client.close()
+            # Оставшаяся часть сообщения обрабатывается, когда придёт
+            idle.sendall(b'ence", "time": 1, "user": {"account_name": "Idle"}}\n')
+            self.assertEqual(get_message(idle)[RESPONSE], 200)
+        finally:
+            idle.close()
+
 
 if __name__ == '__main__':
     unittest.main()
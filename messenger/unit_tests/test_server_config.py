@@ -0,0 +1,78 @@
+"""
+Unit-тесты для модуля server_config.py
+"""
+
+import os
+import sys
+import tempfile
+import unittest
+sys.path.append(os.path.join(os.getcwd(), '..'))
+from server_config import ServerConfig
+from errors import ConfigError
+from common.variables import *
+
+
+class TestServerConfig(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.file = tempfile.NamedTemporaryFile('w', suffix='.ini', delete=False,
+                                                encoding=ENCODING)
+        self.file.write('[server]\nport = 8000\nmax_clients = 5\ntimeout = 0.1\n')
+        self.file.close()
+
+    def tearDown(self) -> None:
+        os.remove(self.file.name)
+
+    def write_config(self, text):
+        with open(self.file.name, 'w', encoding=ENCODING) as file:
+            file.write(text)
+
+    def test_defaults(self):
+        """
+        Без файла и переменных окружения используются значения по умолчанию
+        """
+        config = ServerConfig(environ={})
+        self.assertEqual(config.port, DEFAULT_PORT)
+        self.assertEqual(config.admin_port, ADMIN_PORT)
+        self.assertEqual(config.timeout, TIMEOUT)
+
+    def test_priority(self):
+        """
+        Файл переопределяет значения по умолчанию, переменные окружения -
+        файл, параметры командной строки - переменные окружения
+        """
+        config = ServerConfig(self.file.name, environ={'MESSENGER_MAX_CLIENTS': '7'})
+        self.assertEqual(config.port, 8000)
+        self.assertEqual(config.timeout, 0.1)
+        self.assertEqual(config.max_clients, 7)
+        config = ServerConfig(self.file.name, {'port': 9000, 'address': None},
+                              environ={'MESSENGER_PORT': '8500'})
+        self.assertEqual(config.port, 9000)
+        self.assertEqual(config.address, DEFAULT_LISTEN_ADDRESSES)
+
+    def test_validation(self):
+        """
+        Неверные значения отклоняются при чтении настроек
+        """
+        self.assertRaises(ConfigError, ServerConfig, self.file.name, {'port': 80}, {})
+        self.assertRaises(ConfigError, ServerConfig, environ={'MESSENGER_TIMEOUT': 'fast'})
+        self.assertRaises(ConfigError, ServerConfig, environ={'MESSENGER_LOG_LEVEL': 'LOUD'})
+        self.write_config('[server]\nunknown = 1\n')
+        self.assertRaises(ConfigError, ServerConfig, self.file.name, environ={})
+
+    def test_reload(self):
+        """
+        При перечитывании меняются только изменяемые без перезапуска
+        настройки, неверный файл не меняет настройки
+        """
+        config = ServerConfig(self.file.name, environ={})
+        self.write_config('[server]\nport = 8001\nmax_clients = 10\nlog_level = warning\n')
+        self.assertEqual(config.reload(), {'max_clients': 10, 'log_level': 'WARNING'})
+        self.assertEqual(config.port, 8000)
+        self.write_config('[server]\nmax_clients = 0\n')
+        self.assertEqual(config.reload(), {})
+        self.assertEqual(config.max_clients, 10)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,38 @@
+"""
+Unit-тесты для модуля server_database.py
+"""
+
+import unittest
+import os
+import sys
+sys.path.append(os.path.join(os.getcwd(), '..'))
+from server_database import ServerDatabase
+
+
+class TestServerDatabase(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.database = ServerDatabase(':memory:')
+        self.database.user_login('User', '127.0.0.1')
+        self.database.user_login('Test', '127.0.0.2')
+
+    def tearDown(self) -> None:
+        self.database.close()
+
+    def test_history_summary(self):
+        """Сводка по пользователям учитывает отправленные и полученные сообщения"""
+        self.database.message_sent('User', 'Test')
+        self.database.message_sent('User', 'Test')
+        summary = [(name, sent, received)
+                   for name, last_login, sent, received in self.database.get_history_summary()]
+        self.assertEqual(summary, [('Test', 0, 2), ('User', 2, 0)])
+
+    def test_login_history(self):
+        """Повторный вход добавляется в историю входов"""
+        self.database.user_login('User', '127.0.0.3')
+        addresses = [address for login_time, address in self.database.get_login_history('User')]
+        self.assertEqual(addresses, ['127.0.0.1', '127.0.0.3'])
+
+
+if __name__ == '__main__':
+    unittest.main()
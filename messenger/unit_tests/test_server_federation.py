@@ -0,0 +1,247 @@
+"""
+Unit-тесты для модуля server_federation.py
+"""
+
+import json
+import select
+import unittest
+import os
+import sys
+import tempfile
+from time import time
+from socket import socket, AF_INET, SOCK_STREAM
+sys.path.append(os.path.join(os.getcwd(), '..'))
+from server import create_response
+from server_state import ServerState
+from server_mailbox import Mailboxes
+from server_federation import parse_peers, connect_peers, finish_peer_connect, configure_peers
+from common.utils import split_frame, get_message
+from handlers import ACTION_HANDLERS, PEER_HANDLERS
+from common.variables import *
+from soak_harness import start_server
+from messenger_client import MessengerClient
+from unit_tests.test_server import MockSocket
+
+
+def decode_frames(sock):
+    """
+    Разбирает все кадры, отправленные в тестовый сокет
+    """
+    data = b''.join(sock.sent)
+    messages = []
+    while data:
+        frame, data = split_frame(data)
+        messages.append(json.loads(frame.decode(ENCODING)))
+    return messages
+
+
+class TestServerFederation(unittest.TestCase):
+    def setUp(self) -> None:
+        self.state = ServerState()
+        self.state.node_name = 'node1'
+        self.mailbox_dir = tempfile.TemporaryDirectory()
+        self.state.mailboxes = Mailboxes(self.mailbox_dir.name)
+        self.peer = MockSocket()
+        self.state.peers.append(self.peer)
+        configure_peers(self.state, '127.0.0.1:7801', '')
+
+    def tearDown(self) -> None:
+        self.mailbox_dir.cleanup()
+
+    def login(self, name):
+        client = MockSocket()
+        self.state.clients.append(client)
+        self.state.login(name, client)
+        return client
+
+    def hello(self, users):
+        create_response({ACTION: PEER_HELLO, TIME: time(), NODE: 'node2', USERS: users,
+                         ADDRESS: '127.0.0.1:7801'}, self.peer, self.state, PEER_HANDLERS)
+
+    def finish_connecting(self):
+        """
+        Завершает начатые подключения к узлам, как основной цикл сервера
+        """
+        while self.state.connecting:
+            _, writable, _ = select.select([], list(self.state.connecting), [], 5)
+            for peer in writable:
+                finish_peer_connect(self.state, peer)
+
+    def test_parse_peers(self):
+        # Имена узлов не разрешаются, чтобы не блокировать сервер
+        self.assertEqual(parse_peers(' 127.0.0.1:7801, ,host:7802,bad,10.0.0.1:x'),
+                         [('127.0.0.1', 7801)])
+
+    def test_connect_peers_skips_unavailable(self):
+        connect_peers(self.state, '127.0.0.1:1')
+        self.finish_connecting()
+        self.assertEqual(self.state.peer_addresses, {})
+
+    def test_connect_peers(self):
+        """
+        Подключение к узлу не блокирует сервер и завершается приветствием
+        """
+        listener = socket(AF_INET, SOCK_STREAM)
+        self.addCleanup(listener.close)
+        listener.bind(('127.0.0.1', 0))
+        listener.listen(1)
+        address = f'127.0.0.1:{listener.getsockname()[1]}'
+        connect_peers(self.state, address)
+        connect_peers(self.state, address)
+        self.assertEqual(len(self.state.connecting), 1)
+        self.finish_connecting()
+        peer = self.state.peer_addresses[address]
+        self.addCleanup(peer.close)
+        self.assertIn(peer, self.state.peers)
+        remote, _ = listener.accept()
+        self.addCleanup(remote.close)
+        remote.settimeout(5)
+        self.assertEqual(get_message(remote)[ACTION], PEER_HELLO)
+
+    def test_peer_hello(self):
+        self.login('local')
+        self.hello(['remote'])
+        self.assertEqual(self.state.remote_users, {'remote': 'node2'})
+        self.assertIs(self.state.node_links['node2'], self.peer)
+        # К узлу, подключившемуся самостоятельно, повторно не подключаемся
+        self.assertIs(self.state.peer_addresses['127.0.0.1:7801'], self.peer)
+        # Узлу, подключившемуся самостоятельно, отправлено ответное приветствие
+        answer = decode_frames(self.peer)[-1]
+        self.assertEqual(answer[ACTION], PEER_HELLO)
+        self.assertEqual(answer[USERS], ['local'])
+
+    def test_peer_hello_forwards_mailbox(self):
+        self.state.store_message({ACTION: MSG, TIME: 1, FROM: 'a', TO: 'remote', TEXT: 'hi'})
+        self.hello(['remote'])
+        self.assertEqual(decode_frames(self.peer)[-1][TEXT], 'hi')
+        self.assertEqual(len(self.state.mailboxes), 0)
+
+    def test_peer_hello_from_unknown_host(self):
+        """
+        Приветствие с адреса, не указанного в настройках, отклоняется
+        """
+        self.state.store_message({ACTION: MSG, TIME: 1, FROM: 'a', TO: 'victim', TEXT: 'hi'})
+        self.peer.address = '10.0.0.1'
+        self.hello(['victim'])
+        self.assertTrue(self.peer.closed)
+        self.assertEqual((self.state.peers, self.state.remote_users), ([], {}))
+        self.assertEqual(self.peer.sent, [])
+        self.assertEqual(len(self.state.mailboxes), 1)
+
+    def test_peer_hello_secret(self):
+        """
+        Если задан общий секрет, приветствие без него отклоняется
+        """
+        configure_peers(self.state, '127.0.0.1:7801', 'secret')
+        self.hello([])
+        self.assertTrue(self.peer.closed)
+
+        self.peer = MockSocket('10.0.0.1')
+        create_response({ACTION: PEER_HELLO, TIME: time(), NODE: 'node2', USERS: [],
+                         SECRET: 'secret'}, self.peer, self.state, PEER_HANDLERS)
+        self.assertIs(self.state.node_links['node2'], self.peer)
+        self.assertEqual(decode_frames(self.peer)[-1][SECRET], 'secret')
+
+    def test_peer_message_before_hello(self):
+        """
+        Сообщения узла до приветствия отклоняются
+        """
+        self.state.store_message({ACTION: MSG, TIME: 1, FROM: 'a', TO: 'victim', TEXT: 'hi'})
+        create_response({ACTION: PEER_PRESENCE, TIME: time(), NODE: 'node2',
+                         EVENT: LOGIN, USER: 'victim'}, self.peer, self.state, PEER_HANDLERS)
+        self.assertTrue(self.peer.closed)
+        self.assertEqual((self.peer.sent, self.state.remote_users), ([], {}))
+
+    def test_presence(self):
+        self.hello([])
+        self.login('local')
+        notice = decode_frames(self.peer)[-1]
+        self.assertEqual((notice[ACTION], notice[EVENT], notice[USER]),
+                         (PEER_PRESENCE, LOGIN, 'local'))
+
+        create_response({ACTION: PEER_PRESENCE, TIME: time(), NODE: 'node2',
+                         EVENT: LOGIN, USER: 'remote'}, self.peer, self.state, PEER_HANDLERS)
+        self.assertEqual(self.state.remote_users, {'remote': 'node2'})
+        create_response({ACTION: PEER_PRESENCE, TIME: time(), NODE: 'node2',
+                         EVENT: LOGOUT, USER: 'remote'}, self.peer, self.state, PEER_HANDLERS)
+        self.assertEqual(self.state.remote_users, {})
+
+    def test_message_forwarded_to_peer(self):
+        self.hello(['remote'])
+        sender = self.login('local')
+        message = {ACTION: MSG, TIME: time(), FROM: 'local', TO: 'remote', TEXT: 'hi'}
+        create_response(message, sender, self.state, ACTION_HANDLERS)
+        self.assertEqual(self.state.route_messages({self.peer}), [(self.peer, message)])
+        self.assertEqual(len(self.state.mailboxes), 0)
+
+    def test_forwarded_message_delivered_locally(self):
+        self.hello([])
+        client = self.login('local')
+        message = {ACTION: MSG, TIME: time(), FROM: 'remote', TO: 'local', TEXT: 'hi'}
+        create_response(message, self.peer, self.state, PEER_HANDLERS)
+        self.assertEqual(self.state.route_messages({client}), [(client, message)])
+        self.assertEqual(message[NODE], 'node2')
+
+    def test_forwarded_message_not_forwarded_again(self):
+        self.hello(['remote'])
+        # Пересланное сообщение пользователю другого узла попадает в почтовый ящик
+        message = {ACTION: MSG, TIME: time(), FROM: 'a', TO: 'remote', TEXT: 'hi'}
+        create_response(message, self.peer, self.state, PEER_HANDLERS)
+        self.assertEqual(self.state.route_messages({self.peer}), [])
+        self.assertEqual(len(self.state.mailboxes), 1)
+
+    def test_remove_peer(self):
+        self.hello(['remote'])
+        self.state.remove_peer(self.peer)
+        self.assertTrue(self.peer.closed)
+        self.assertEqual((self.state.peers, self.state.remote_users, self.state.node_links),
+                         ([], {}, {}))
+
+
+class TestServerCluster(unittest.TestCase):
+    """
+    Два узла кластера в отдельных процессах
+    """
+    PORTS = (DEFAULT_PORT + 20, DEFAULT_PORT + 30)
+    ADMIN_PORTS = (ADMIN_PORT + 20, ADMIN_PORT + 30)
+    PEER_PORTS = (DEFAULT_PORT + 22, DEFAULT_PORT + 32)
+
+    def setUp(self) -> None:
+        self.directory = tempfile.TemporaryDirectory()
+        self.servers = []
+        for number in range(2):
+            directory = os.path.join(self.directory.name, str(number))
+            os.makedirs(directory)
+            self.servers.append(start_server(
+                self.PORTS[number], self.ADMIN_PORTS[number], directory,
+                node_name=f'node{number}', peer_port=self.PEER_PORTS[number],
+                peers=f'127.0.0.1:{self.PEER_PORTS[1 - number]}'))
+
+    def tearDown(self) -> None:
+        for server in self.servers:
+            server.terminate()
+            server.wait(10)
+        self.directory.cleanup()
+
+    def test_message_between_nodes(self):
+        receiver = MessengerClient('receiver', '127.0.0.1', self.PORTS[1])
+        sender = MessengerClient('sender', '127.0.0.1', self.PORTS[0])
+        receiver.connect()
+        sender.connect()
+        try:
+            # Узлы подключаются друг к другу и сообщают о входе пользователей
+            deadline = time() + 10
+            message = None
+            while message is None and time() < deadline:
+                sender.send('receiver', 'hi')
+                message = receiver.recv(0.5)
+            self.assertIsNotNone(message)
+            self.assertEqual((message[FROM], message[TEXT], message[NODE]),
+                             ('sender', 'hi', 'node0'))
+        finally:
+            sender.close()
+            receiver.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
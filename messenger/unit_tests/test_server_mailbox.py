@@ -0,0 +1,102 @@
+"""
+Unit-тесты для модуля server_mailbox.py
+"""
+
+import json
+import os
+import sys
+import tempfile
+import unittest
+sys.path.append(os.path.join(os.getcwd(), '..'))
+from server_mailbox import Mailboxes
+from common.variables import *
+
+
+class TestMailboxes(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.directory = tempfile.TemporaryDirectory()
+        self.mailboxes = Mailboxes(self.directory.name)
+
+    def tearDown(self) -> None:
+        self.directory.cleanup()
+
+    @staticmethod
+    def make_message(number, recipient='Test'):
+        return {ACTION: MSG, TIME: number, FROM: 'User', TO: recipient, TEXT: str(number)}
+
+    def take(self, name):
+        return [json.loads(data.decode(ENCODING)) for data in self.mailboxes.take(name)]
+
+    def test_limits(self):
+        """
+        Ящик ограничен числом и объёмом сообщений
+        """
+        self.mailboxes.max_messages = 2
+        self.assertTrue(self.mailboxes.put('Test', self.make_message(1)))
+        self.assertTrue(self.mailboxes.put('Test', self.make_message(2)))
+        self.assertFalse(self.mailboxes.put('Test', self.make_message(3)))
+        self.assertTrue(self.mailboxes.put('Other', self.make_message(3, 'Other')))
+        self.mailboxes.max_bytes = 10
+        self.assertFalse(self.mailboxes.put('New', self.make_message(1, 'New')))
+        self.assertEqual(self.take('Test'), [self.make_message(1), self.make_message(2)])
+        self.assertEqual(self.take('Test'), [])
+
+    def test_total_limit(self):
+        """
+        Общий объём сообщений в памяти и в файлах ограничен
+        для всех получателей вместе
+        """
+        size = len(json.dumps(self.make_message(1, 'User0')).encode(ENCODING))
+        self.mailboxes.total_limit = size * 3
+        for number in range(3):
+            self.assertTrue(self.mailboxes.put(f'User{number}', self.make_message(1, f'User{number}')))
+        self.mailboxes.spill_all()
+        self.assertFalse(self.mailboxes.put('User3', self.make_message(1, 'User3')))
+        self.mailboxes.take('User0')
+        self.assertEqual(self.mailboxes.disk, size * 2)
+        self.assertTrue(self.mailboxes.put('User3', self.make_message(1, 'User3')))
+
+    def test_expire(self):
+        """
+        Сообщения с истекшим сроком хранения удаляются и не доставляются
+        """
+        self.mailboxes.ttl = -1
+        self.mailboxes.put('Test', self.make_message(1))
+        self.mailboxes.put('Other', self.make_message(1, 'Other'))
+        self.mailboxes.spill_box('Other')
+        self.mailboxes.expire()
+        self.assertEqual(len(self.mailboxes), 0)
+        self.assertEqual(self.mailboxes.memory, 0)
+        self.assertEqual(os.listdir(self.directory.name), [])
+
+    def test_spill(self):
+        """
+        При превышении объёма памяти ящики переносятся на диск,
+        порядок сообщений сохраняется
+        """
+        self.mailboxes.memory_limit = 500
+        messages = [self.make_message(number) for number in range(20)]
+        for message in messages:
+            self.mailboxes.put('Test', message)
+        self.assertLessEqual(self.mailboxes.memory, 500)
+        self.assertIn('Test', self.mailboxes.spilled)
+        self.assertEqual(len(self.mailboxes), 20)
+        self.assertEqual(self.take('Test'), messages)
+        self.assertEqual(os.listdir(self.directory.name), [])
+
+    def test_load(self):
+        """
+        Сохранённые в файлы ящики загружаются новым экземпляром
+        """
+        self.mailboxes.put('Test', self.make_message(1))
+        self.mailboxes.put('Другой', self.make_message(2, 'Другой'))
+        self.mailboxes.spill_all()
+        mailboxes = Mailboxes(self.directory.name)
+        mailboxes.load()
+        self.assertEqual(len(mailboxes), 2)
+        self.assertEqual(json.loads(mailboxes.take('Другой')[0]), self.make_message(2, 'Другой'))
+
+
+if __name__ == '__main__':
+    unittest.main()
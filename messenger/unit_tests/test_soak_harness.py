@@ -0,0 +1,38 @@
+"""
+Unit-тесты для модуля soak_harness.py
+"""
+
+import os
+import random
+import sys
+import unittest
+sys.path.append(os.path.join(os.getcwd(), '..'))
+from soak_harness import run_soak, make_frame, SOAK_PORT, SOAK_ADMIN_PORT
+from common.variables import *
+
+
+class TestSoakHarness(unittest.TestCase):
+
+    def test_frames_deterministic(self):
+        """
+        Сообщения зависят только от начального значения
+        """
+        first, second = random.Random(1), random.Random(1)
+        for _ in range(50):
+            self.assertEqual(make_frame(first, 'User', ['Test']),
+                             make_frame(second, 'User', ['Test']))
+
+    def test_short_soak(self):
+        """
+        Короткий прогон: сервер не падает, соединения закрываются
+        """
+        report = run_soak(3, 4, seed=1, port=SOAK_PORT + 1, admin_port=SOAK_ADMIN_PORT + 1)
+        self.assertEqual(report['failures'], [])
+        self.assertGreater(report['frames'], 0)
+        self.assertGreater(report['stalls'], 0)
+        self.assertGreater(report['silent_messages'], 0)
+        self.assertGreater(report['throughput'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -6,10 +6,13 @@ import json
 import unittest
 import os
 import sys
+import tempfile
+import threading
 from socket import socket, AF_INET, SOCK_STREAM, SOL_SOCKET, SO_REUSEADDR
 sys.path.append(os.path.join(os.getcwd(), '..'))
 from common.variables import *
-from common.utils import get_message, send_message
+from common.utils import get_message, send_message, read_file_chunks, compress_data, \
+    has_buffered_message, split_frame, MessageTemplate, FrameDecompressor
 from errors import NotDictError
 
 
@@ -124,6 +127,119 @@ class TestUtils(unittest.TestCase):
 
         self.assertIsInstance(get_message(self.client_socket), dict)
 
+    def test_send_long_message_compressed(self):
+        """
+        Проверяем сжатие длинного сообщения и его расшифровку
+        """
+        client, client_address = self.server_socket.accept()
+        long_message = {ACTION: MSG, TIME: 1, FROM: 'User', TO: 'Test',
+                        TEXT: 'Сообщение ' * COMPRESSION_THRESHOLD}
+        send_message(self.client_socket, long_message, COMPRESSION_METHOD)
+        response = get_message(client)
+        client.close()
+        self.assertEqual(long_message, response)
+
+    def test_send_short_message_not_compressed(self):
+        """
+        Проверяем, что короткое сообщение отправляется без сжатия
+        """
+        client, client_address = self.server_socket.accept()
+        send_message(self.client_socket, self.test_message, COMPRESSION_METHOD)
+        test_response = client.recv(MAX_PACKAGE_LENGTH)
+        client.close()
+        self.assertEqual(self.test_message, json.loads(test_response.decode(ENCODING)))
+
+    def test_get_several_messages_in_one_packet(self):
+        """
+        Проверяем разбор нескольких сообщений, пришедших вместе
+        """
+        client, client_address = self.server_socket.accept()
+        long_message = {ACTION: MSG, TIME: 1, FROM: 'User', TO: 'Test',
+                        TEXT: 'Сообщение ' * COMPRESSION_THRESHOLD}
+        data = (json.dumps(self.test_message).encode(ENCODING) + FRAME_DELIMITER
+                + compress_data(json.dumps(long_message).encode(ENCODING))
+                + json.dumps(self.test_error_response).encode(ENCODING) + FRAME_DELIMITER)
+        client.sendall(data)
+        client.close()
+        self.assertEqual(get_message(self.client_socket), self.test_message)
+        self.assertTrue(has_buffered_message(self.client_socket))
+        self.assertEqual(get_message(self.client_socket), long_message)
+        self.assertEqual(get_message(self.client_socket), self.test_error_response)
+        self.assertFalse(has_buffered_message(self.client_socket))
+
+    def test_get_message_split_into_packets(self):
+        """
+        Проверяем сборку сообщения, пришедшего по частям
+        """
+        client, client_address = self.server_socket.accept()
+        data = json.dumps(self.test_message).encode(ENCODING) + FRAME_DELIMITER
+        client.sendall(data[:10])
+        # Вторая часть приходит, когда первая уже принята
+        timer = threading.Timer(0.1, client.sendall, (data[10:],))
+        timer.start()
+        response = get_message(self.client_socket)
+        timer.join()
+        client.close()
+        self.assertEqual(response, self.test_message)
+
+    def test_compressed_message_size_limited(self):
+        """
+        Проверяем, что сжатое сообщение не распаковывается больше MAX_MESSAGE_SIZE
+        """
+        data = compress_data(b'{"message": "' + b'x' * MAX_MESSAGE_SIZE * 100 + b'"}')
+        self.assertLess(len(data), MAX_MESSAGE_SIZE)
+        with self.assertRaises(ValueError):
+            split_frame(data)
+
+    def test_compressed_message_decompressed_once(self):
+        """
+        Проверяем, что сжатое сообщение, принимаемое по частям,
+        распаковывается постепенно
+        """
+        long_message = {ACTION: MSG, TIME: 1, FROM: 'User', TO: 'Test',
+                        TEXT: 'Сообщение ' * COMPRESSION_THRESHOLD}
+        data = compress_data(json.dumps(long_message).encode(ENCODING)) + b'rest'
+        decompressor = FrameDecompressor()
+        self.assertEqual(decompressor.feed(data[:20]), (None, data[:20]))
+        self.assertEqual(decompressor.fed, 20)
+        frame, rest = decompressor.feed(data)
+        self.assertEqual((json.loads(frame), rest), (long_message, b'rest'))
+
+    def test_message_template(self):
+        """
+        Проверяем подстановку времени в заранее закодированный ответ
+        """
+        template = MessageTemplate({RESPONSE: 200, TIME: None,
+                                    ALERT: 'Соединение прошло успешно'})
+        self.assertEqual(template.encode(1), json.dumps(
+            dict(self.test_correct_response, **{TIME: 1.0})).encode(ENCODING))
+        frame, rest = split_frame(template.make_frame())
+        response = json.loads(frame)
+        self.assertIsInstance(response[TIME], float)
+        response[TIME] = 1
+        self.assertEqual(response, self.test_correct_response)
+
+    def test_read_file_chunks(self):
+        """
+        Проверяем чтение файла частями
+        """
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'test.bin')
+            with open(path, 'wb') as file:
+                file.write(b'x' * 5)
+            chunks = list(read_file_chunks(path, chunk_size=2))
+        self.assertEqual(chunks, [(b'xx', False), (b'xx', False), (b'x', True)])
+
+    def test_read_empty_file_chunks(self):
+        """
+        Проверяем чтение пустого файла
+        """
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'empty.bin')
+            open(path, 'wb').close()
+            chunks = list(read_file_chunks(path))
+        self.assertEqual(chunks, [(b'', True)])
+
 
 if __name__ == '__main__':
     unittest.main()